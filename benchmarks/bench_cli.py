@@ -0,0 +1,192 @@
+"""
+benchmarks.bench_cli - Time mdfic commands on synthetic manuscripts.
+
+Each command runs as a fresh `python -m mdfic.cli` process, the way
+make runs it, so interpreter startup and imports are included.
+
+    python -m benchmarks.bench_cli --size short-story --size novel \\
+        --repeat 3 --output bench_results.json
+
+With `--compare OLD.json`, exits non-zero if any command's median time
+grew by more than `--threshold` (default 1.25x) against the old results.
+"""
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+import mdfic
+from .manuscript import SIZES, sized_manuscript
+
+# name -> (arguments, input file)
+COMMANDS = {
+    'latex': (['latex', '-o', 'out.tex', 'story.md'], 'story.md'),
+    'html': (['html', '-o', 'out.html', 'story.md'], 'story.md'),
+    'docx-sffms': (['docx', '--sffms', '--no-date', '-o', 'out.docx', 'story.md'], 'story.md'),
+    'wc': (['wc', 'story.md'], 'story.md'),
+    'stats': (['stats', '--json', 'story.md'], 'story.md'),
+    'echoes': (['echoes', '--json', 'story.md'], 'story.md'),
+    'normalize': (['normalize', '--pspaces', '1', '--quotes', 'smart', '--dashes', 'unicode',
+                   '--ellipses', 'unicode', '--whitespace', '-o', 'clean.md', 'story.md'], 'story.md'),
+    'tweet': (['tweet', '-o', 'tweets.txt', 'story.md'], 'story.md'),
+    'strip-word-doc': (['strip-word-doc', '-o', 'stripped.md', 'story.doc'], 'story.doc'),
+    'progress': (['progress', 'story.md'], 'story.md'),
+}
+
+
+def mac_word_bytes(text):
+    """
+    Approximate an old Mac Word file: MacRoman curly quotes
+    and carriage-return paragraphs.
+    """
+    text = text.replace('"', '“').replace('\n\n', '\r')
+    return text.encode('mac_roman', errors='replace')
+
+
+def git(workdir, *args):
+    subprocess.run(['git', '-C', workdir] + list(args), check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def prepare(workdir, text):
+    """
+    Write the inputs for every command into workdir.  For
+    `progress`, the first half of the story is committed to
+    git and the whole story is left in the working copy.
+    """
+    with open(os.path.join(workdir, 'story.doc'), 'wb') as f:
+        f.write(mac_word_bytes(text))
+    if shutil.which('git'):
+        git(workdir, 'init', '-q')
+        git(workdir, 'config', 'user.email', 'bench@example.invalid')
+        git(workdir, 'config', 'user.name', 'Bench')
+        with open(os.path.join(workdir, 'story.md'), 'w') as f:
+            f.write(text[:len(text) // 2])
+        git(workdir, 'add', 'story.md')
+        git(workdir, 'commit', '-q', '-m', 'half')
+    with open(os.path.join(workdir, 'story.md'), 'w') as f:
+        f.write(text)
+
+
+def mdfic_env():
+    """
+    The environment for mdfic subprocesses, importing mdfic from
+    the same checkout as this benchmark.
+    """
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(mdfic.__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(p for p in [root, env.get('PYTHONPATH')] if p)
+    return env
+
+
+def run(workdir, args, timeout):
+    """
+    Run one mdfic command and return its wall time in seconds.
+    Raises CalledProcessError if it fails.
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'mdfic.cli'] + args, cwd=workdir, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout,
+                   env=mdfic_env())
+    return time.perf_counter() - start
+
+
+def tool_version(*command):
+    try:
+        out = subprocess.run(list(command), capture_output=True, text=True).stdout
+        return out.splitlines()[0] if out else None
+    except OSError:
+        return None
+
+
+def benchmark(sizes, commands, repeat=3, timeout=1800, seed=0):
+    """
+    Time each command on each manuscript size and return a
+    list of result dicts.
+    """
+    results = []
+    for size in sizes:
+        text = sized_manuscript(size, seed=seed)
+        with tempfile.TemporaryDirectory(prefix='mdfic-bench-') as workdir:
+            prepare(workdir, text)
+            for name in commands:
+                args, input = COMMANDS[name]
+                result = dict(size=size, command=name, words=len(text.split()),
+                              bytes=os.path.getsize(os.path.join(workdir, input)))
+                try:
+                    times = [run(workdir, args, timeout) for _ in range(repeat)]
+                    result.update(times=times, min=min(times), median=statistics.median(times))
+                except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                    stderr = getattr(e, 'stderr', b'') or b''
+                    result.update(error=str(e), stderr=stderr.decode('utf8', 'replace')[-2000:])
+                print("{size:12} {command:15} {status}".format(
+                    status="{:.3f}s".format(result['median']) if 'median' in result else 'FAILED',
+                    **result), file=sys.stderr)
+                results.append(result)
+    return results
+
+
+def regressions(old, new, threshold):
+    """
+    Return (size, command, old_median, new_median) for each result in
+    new whose median is more than threshold times the one in old.
+    """
+    before = {(r['size'], r['command']): r['median'] for r in old['results'] if 'median' in r}
+    found = []
+    for r in new['results']:
+        key = (r['size'], r['command'])
+        if 'median' in r and key in before and r['median'] > before[key] * threshold:
+            found.append(key + (before[key], r['median']))
+    return found
+
+
+@click.command()
+@click.option('--size', 'sizes', multiple=True, type=click.Choice(list(SIZES)),
+              help="Manuscript size, may be repeated. (default short-story and novelette)")
+@click.option('--command', 'commands', multiple=True, type=click.Choice(list(COMMANDS)),
+              help="Command to time, may be repeated. (default all)")
+@click.option('--repeat', type=int, default=3, help="Runs per command. (default 3)")
+@click.option('--seed', type=int, default=0, help="Manuscript generator seed.")
+@click.option('--output', '-o', type=str, default='bench_results.json', help="JSON results file.")
+@click.option('--compare', type=click.Path(exists=True), help="Earlier results to check for regressions.")
+@click.option('--threshold', type=float, default=1.25, help="Allowed slowdown factor for --compare.")
+def main(sizes, commands, repeat, seed, output, compare, threshold):
+    results = benchmark(sizes or ['short-story', 'novelette'], commands or list(COMMANDS),
+                        repeat=repeat, seed=seed)
+    report = dict(
+        meta=dict(
+            python=platform.python_version(),
+            platform=platform.platform(),
+            pandoc=tool_version('pandoc', '--version'),
+            seed=seed,
+            repeat=repeat,
+            time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        ),
+        results=results,
+    )
+    with click.open_file(output, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+
+    failed = [r for r in results if 'error' in r]
+    if compare:
+        with open(compare) as f:
+            slower = regressions(json.load(f), report, threshold)
+        for size, command, old, new in slower:
+            print("REGRESSION {} {}: {:.3f}s -> {:.3f}s".format(size, command, old, new), file=sys.stderr)
+        if slower:
+            sys.exit(1)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
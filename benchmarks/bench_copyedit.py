@@ -0,0 +1,187 @@
+"""
+benchmarks.bench_copyedit - Copyedit throughput against a mock chat API.
+
+Runs `mdfic.copyedit` on a synthetic manuscript against
+`benchmarks.mock_llm`, for each combination of chunk size and
+concurrency, and reports the end-to-end wall time, the time until the
+first edited text and the whole first chunk are ready to be written,
+and the median and p95 latency of the chunk requests, retries included.
+
+    python -m benchmarks.bench_copyedit --size novel --max-words 2000 \\
+        --max-words 8000 --jobs 1 --jobs 4 --latency 0.5 --rate-limit 0.05
+
+No API key or network is needed.
+"""
+
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+
+import click
+
+from .manuscript import SIZES, sized_manuscript
+from .mock_llm import Backend, base_url, make_server
+
+
+class TimedChain:
+    """
+    Wrap a chain, recording how long each call takes.
+    """
+
+    def __init__(self, chain):
+        self.chain = chain
+        self.times = []
+        self.lock = threading.Lock()
+
+    def record(self, start):
+        with self.lock:
+            self.times.append(time.perf_counter() - start)
+
+    def invoke(self, msg):
+        start = time.perf_counter()
+        try:
+            return self.chain.invoke(msg)
+        finally:
+            self.record(start)
+
+    def stream(self, msg):
+        start = time.perf_counter()
+        try:
+            yield from self.chain.stream(msg)
+        finally:
+            self.record(start)
+
+
+def percentile(values, p):
+    """
+    The pth percentile of values, interpolated.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def import_copyedit(url):
+    """
+    Import mdfic.copyedit pointed at the mock, without
+    looking for a real API key.
+    """
+    os.environ.pop('OPENAI_USER', None)
+    os.environ['MDFIC_OPENAI_BASE_URL'] = url
+    import mdfic.copyedit
+    return mdfic.copyedit
+
+
+def run(copyedit, url, text, max_words, jobs, retries):
+    """
+    Copyedit text once and return a result dict.
+    """
+    from langchain_core.output_parsers import StrOutputParser
+
+    timed = TimedChain(copyedit.editprompt | copyedit.chat_model(base_url=url, max_retries=retries)
+                       | StrOutputParser())
+    copyedit.copy_editor_chain = timed
+    _, chunks = copyedit.split_story(text, max_words)
+    result = dict(max_words=max_words, jobs=jobs, chunks=len(chunks))
+    start = time.perf_counter()
+    first_token = first_chunk = None
+    try:
+        for i, piece in copyedit.stream_chunks(chunks, jobs=jobs):
+            if first_token is None and piece:
+                first_token = time.perf_counter() - start
+            if first_chunk is None and i > 0:
+                first_chunk = time.perf_counter() - start
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    wall = time.perf_counter() - start
+    result.update(
+        wall=wall,
+        first_token=first_token,
+        first_chunk=first_chunk if first_chunk is not None or 'error' in result else wall,
+        chunk_median=statistics.median(timed.times) if timed.times else None,
+        chunk_p95=percentile(timed.times, 95),
+    )
+    return result
+
+
+def benchmark(size, max_words, jobs, backend, retries=2, seed=0):
+    """
+    Time copyedit for each (max_words, jobs) pair and return
+    a list of result dicts.
+    """
+    text = sized_manuscript(size, seed=seed)
+    server = make_server(backend)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = base_url(server)
+        copyedit = import_copyedit(url)
+        results = []
+        for words in max_words:
+            for j in jobs:
+                before = dict(backend.counts)
+                result = dict(size=size, words=len(text.split()))
+                result.update(run(copyedit, url, text, words, j, retries))
+                result['server'] = {k: v - before[k] for k, v in backend.counts.items()}
+                print("{size:12} max-words {max_words:6} jobs {jobs:3} chunks {chunks:4}  "
+                      "wall {wall:8.2f}s  first token {token} chunk {first} p95 {p95}{failed}".format(
+                          token=_seconds(result['first_token']), first=_seconds(result['first_chunk']),
+                          p95=_seconds(result['chunk_p95']),
+                          failed='  FAILED' if 'error' in result else '', **result), file=sys.stderr)
+                results.append(result)
+        return results
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _seconds(value):
+    return '{:7.2f}s'.format(value) if value is not None else '      -'
+
+
+@click.command()
+@click.option('--size', type=click.Choice(list(SIZES)), default='novel', help="Manuscript size. (default novel)")
+@click.option('--max-words', 'max_words', multiple=True, type=int,
+              help="Words per chunk, may be repeated. (default 4000)")
+@click.option('--jobs', multiple=True, type=int, help="Chunks at once, may be repeated. (default 1 and 8)")
+@click.option('--retries', type=int, default=2, help="Client retries per chunk. (default 2)")
+@click.option('--latency', type=float, default=0.5, help="Mock seconds to first token. (default 0.5)")
+@click.option('--jitter', type=float, default=0.2, help="Mock extra random latency. (default 0.2)")
+@click.option('--tokens-per-second', type=float, default=1000, help="Mock output rate. (default 1000)")
+@click.option('--rate-limit', type=float, default=0.0, help="Fraction of requests refused with 429.")
+@click.option('--failure-rate', type=float, default=0.0, help="Fraction of requests failed with 500.")
+@click.option('--seed', type=int, default=0, help="Manuscript and mock seed.")
+@click.option('--output', '-o', type=str, default='copyedit_results.json', help="JSON results file.")
+def main(size, max_words, jobs, retries, latency, jitter, tokens_per_second, rate_limit, failure_rate,
+         seed, output):
+    backend = Backend(latency=latency, jitter=jitter, tokens_per_second=tokens_per_second,
+                      rate_limit=rate_limit, failure_rate=failure_rate, seed=seed)
+    results = benchmark(size, max_words or [4000], jobs or [1, 8], backend, retries=retries, seed=seed)
+    report = dict(
+        meta=dict(
+            python=platform.python_version(),
+            platform=platform.platform(),
+            seed=seed,
+            retries=retries,
+            mock=dict(latency=latency, jitter=jitter, tokens_per_second=tokens_per_second,
+                      rate_limit=rate_limit, failure_rate=failure_rate),
+            time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        ),
+        results=results,
+    )
+    with click.open_file(output, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+    if any('error' in r for r in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
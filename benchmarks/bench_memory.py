@@ -0,0 +1,157 @@
+"""
+benchmarks.bench_memory - Peak memory of the DOCX, LaTeX and tweet paths.
+
+Each (target, size) pair runs in a fresh child process so that its peak
+RSS is its own.  A second child run under tracemalloc reports the top
+allocation sites.  Results are compared against the per-size budgets
+in `memory_budgets.json` (in MiB), and the run fails if any is exceeded.
+
+    python -m benchmarks.bench_memory --size novel --top 10 -o mem_results.json
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+import click
+
+from .bench_cli import mdfic_env
+from .manuscript import SIZES, sized_manuscript
+
+TARGETS = ('docx', 'latex', 'tweets')
+
+BUDGETS_FILE = os.path.join(os.path.dirname(__file__), 'memory_budgets.json')
+
+
+def peak_rss_mib():
+    """
+    The peak resident set size of this process in MiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_target(target, text, workdir):
+    """
+    Run one target on text and return the objects it built, so
+    that a tracemalloc snapshot taken afterwards still sees them.
+    """
+    if target == 'docx':
+        from mdfic.docx import HTML2DOCX
+        from mdfic.utils import pandoc, parse_metadata
+        html = pandoc(text, '--from=markdown', '--to=html')
+        hdocx = HTML2DOCX(parse_metadata(text, join='\n'), sffms=True)
+        hdocx.feed(html)
+        hdocx.save(os.path.join(workdir, 'story.docx'))
+        return hdocx
+    elif target == 'latex':
+        from mdfic.latex import SFFMSStory
+        story = SFFMSStory(text)
+        return story, story.document
+    elif target == 'tweets':
+        from mdfic.tweets import generate
+        return list(generate(text, 280))
+    raise ValueError("Unknown target {}".format(target))
+
+
+def child(target, path, top):
+    """
+    Child process entry point: run target on the manuscript
+    in path and print a JSON result on stdout.
+    """
+    with open(path) as f:
+        text = f.read()
+    # import the target's modules before measuring the baseline
+    import mdfic.docx, mdfic.latex, mdfic.tweets  # noqa: F401,E401
+    baseline = peak_rss_mib()
+    result = dict(baseline_mib=round(baseline, 1))
+    with tempfile.TemporaryDirectory(prefix='mdfic-mem-') as workdir:
+        if top:
+            import tracemalloc
+            tracemalloc.start(5)
+            kept = run_target(target, text, workdir)
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del kept
+            result['traced_peak_mib'] = round(peak / 2**20, 1)
+            result['top'] = [
+                dict(site=str(stat.traceback[0]), size_mib=round(stat.size / 2**20, 2), count=stat.count)
+                for stat in snapshot.statistics('lineno')[:top]]
+        else:
+            run_target(target, text, workdir)
+            result['peak_rss_mib'] = round(peak_rss_mib(), 1)
+    json.dump(result, sys.stdout)
+
+
+def measure(target, path, top=0):
+    command = [sys.executable, '-m', 'benchmarks.bench_memory', '--child', target, path,
+               '--top', str(top)]
+    out = subprocess.run(command, check=True, capture_output=True, text=True, env=mdfic_env(),
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(out.stdout)
+
+
+def load_budgets(path=BUDGETS_FILE):
+    with open(path) as f:
+        return json.load(f)
+
+
+def over_budget(results, budgets):
+    """
+    Return the results whose peak RSS exceeds their budget.
+    """
+    return [r for r in results
+            if 'peak_rss_mib' in r
+            and r['peak_rss_mib'] > budgets.get(r['target'], {}).get(r['size'], float('inf'))]
+
+
+@click.command()
+@click.option('--size', 'sizes', multiple=True, type=click.Choice(list(SIZES)),
+              help="Manuscript size, may be repeated. (default short-story, novelette and novel)")
+@click.option('--target', 'targets', multiple=True, type=click.Choice(TARGETS),
+              help="Code path to measure, may be repeated. (default all)")
+@click.option('--top', type=int, default=5, help="Allocation sites to report per run, 0 to skip. (default 5)")
+@click.option('--budgets', type=click.Path(exists=True), default=BUDGETS_FILE, help="Budgets JSON file.")
+@click.option('--output', '-o', type=str, default='-', help="JSON results file. (default stdout)")
+@click.option('--child', 'child_args', nargs=2, type=str, hidden=True)
+def main(sizes, targets, top, budgets, output, child_args):
+    if child_args:
+        child(child_args[0], child_args[1], top)
+        return
+
+    budgets = load_budgets(budgets)
+    results = []
+    with tempfile.TemporaryDirectory(prefix='mdfic-mem-') as workdir:
+        for size in sizes or ['short-story', 'novelette', 'novel']:
+            path = os.path.join(workdir, size + '.md')
+            with open(path, 'w') as f:
+                f.write(sized_manuscript(size))
+            for target in targets or TARGETS:
+                result = dict(target=target, size=size,
+                              budget_mib=budgets.get(target, {}).get(size))
+                result.update(measure(target, path))
+                if top:
+                    result.update(measure(target, path, top=top))
+                print("{target:8} {size:12} {peak_rss_mib:8.1f} MiB (budget {budget_mib})".format(**result),
+                      file=sys.stderr)
+                results.append(result)
+
+    with click.open_file(output, 'w') as f:
+        json.dump(dict(results=results), f, indent=2)
+        f.write('\n')
+
+    failed = over_budget(results, budgets)
+    for r in failed:
+        print("OVER BUDGET {target} {size}: {peak_rss_mib} MiB > {budget_mib} MiB".format(**r),
+              file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+benchmarks.bench_trace - What hot-path logging costs when nobody is listening.
+
+Times, per call, the ways a per-token handler like `HTML2DOCX.handle_data`
+can log while logging is at its default ERROR level: not at all, a
+`mdfic.trace` event guarded by `trace.on`, a lazily formatted
+`logger.debug('%s', ...)`, and an eagerly built
+`logger.debug("...".format(**locals()))` message.  Then feeds a synthetic
+manuscript's HTML to `HTML2DOCX` with tracing off and with it on (written
+to /dev/null).
+
+    python -m benchmarks.bench_trace --size novel --repeat 3 -o trace_results.json
+"""
+
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import timeit
+
+import click
+
+from .manuscript import SIZES, sized_manuscript
+
+logger = logging.getLogger('benchmarks.bench_trace')
+
+# What the tag stack looks like inside a paragraph of a chapter.
+STACK = [('body', {}), ('p', {}), ('em', {}), ('strong', {'class': 'x'})]
+
+
+def call_costs(number=200000):
+    """
+    Nanoseconds per call of each way of logging from a hot path,
+    with logging at ERROR and tracing off.
+    """
+    from mdfic.trace import tracer
+    trace = tracer('benchmarks.bench_trace')
+    logger.setLevel(logging.ERROR)
+    stack = list(STACK)
+
+    def silent(data):
+        return data
+
+    def guarded(data):
+        if trace.on:
+            trace('data', data=data, stack=[t for t, _ in stack])
+        return data
+
+    def lazy(data):
+        logger.debug("Adding data: %r stack = %s", data, stack)
+        return data
+
+    def eager(data):
+        logger.debug(u"Adding data: '{data}'".format(**locals()))
+        logger.debug("stack = {stack}".format(stack=stack))
+        return data
+
+    costs = {}
+    for name, f in [('silent', silent), ('guarded', guarded), ('lazy', lazy), ('eager', eager)]:
+        best = min(timeit.repeat(lambda: f('some words'), number=number, repeat=3))
+        costs[name] = round(best / number * 1e9, 1)
+    return costs
+
+
+def feed(html, traced):
+    """
+    Seconds to feed html to a new HTML2DOCX, with docx tracing
+    on (to /dev/null) or off.
+    """
+    from mdfic import trace
+    from mdfic.docx import HTML2DOCX
+    hdocx = HTML2DOCX({})
+    with open(os.devnull, 'w') as devnull:
+        if traced:
+            trace.enable(['docx'], devnull)
+        try:
+            start = time.perf_counter()
+            hdocx.feed(html)
+            return time.perf_counter() - start
+        finally:
+            trace.disable()
+
+
+def benchmark(size, repeat=3, seed=0):
+    from mdfic.utils import pandoc
+    text = sized_manuscript(size, seed=seed)
+    html = pandoc(text, '--from=markdown', '--to=html')
+    result = dict(size=size, words=len(text.split()), calls_ns=call_costs())
+    for traced in (False, True):
+        result['feed_traced' if traced else 'feed'] = min(feed(html, traced) for _ in range(repeat))
+    return result
+
+
+@click.command()
+@click.option('--size', type=click.Choice(list(SIZES)), default='novelette', help="Manuscript size. (default novelette)")
+@click.option('--repeat', type=int, default=3, help="Feeds per setting; the fastest counts. (default 3)")
+@click.option('--seed', type=int, default=0, help="Manuscript seed.")
+@click.option('--output', '-o', type=str, default='-', help="JSON results file. (default stdout)")
+def main(size, repeat, seed, output):
+    result = benchmark(size, repeat=repeat, seed=seed)
+    for name, ns in result['calls_ns'].items():
+        print("{:8} {:8.1f} ns/call".format(name, ns), file=sys.stderr)
+    print("feed {size}: {feed:.2f}s untraced, {feed_traced:.2f}s traced".format(**result), file=sys.stderr)
+    report = dict(
+        meta=dict(python=platform.python_version(), platform=platform.platform(), seed=seed,
+                  time=time.strftime('%Y-%m-%dT%H:%M:%S')),
+        results=[result],
+    )
+    with click.open_file(output, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+benchmarks.manuscript - Deterministic synthetic manuscripts for benchmarks.
+
+The same (size, seed) always produces the same text: YAML front matter,
+chapters, scene breaks, dialogue, emphasis, blockquotes and lists.
+"""
+
+import random
+
+# size name -> approximate word count of the body
+SIZES = {
+    'short-story': 5000,
+    'novelette': 12000,
+    'novel': 100000,
+    'anthology': 500000,
+}
+
+WORDS = """
+lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor
+incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud
+exercitation ullamco laboris nisi aliquip ex ea commodo consequat duis aute
+irure in reprehenderit voluptate velit esse cillum fugiat nulla pariatur
+excepteur sint occaecat cupidatat non proident sunt culpa qui officia deserunt
+mollit anim id est laborum the a of and to her his she he was it that with
+station ship river lantern morning window quiet door city storm orbit letter
+""".split()
+
+FRONT_MATTER = """\
+---
+title: {title}
+author: Bench Q. Marker
+address:
+    - 12 Synthetic Street
+    - Generated City, ST 00000
+email: bench@example.invalid
+mdfic:
+  number_scenes: {number_scenes}
+...
+"""
+
+
+class _Writer:
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.words = 0
+
+    def word(self):
+        return self.rng.choice(WORDS)
+
+    def phrase(self, n):
+        self.words += n
+        return ' '.join(self.word() for _ in range(n))
+
+    def sentence(self):
+        n = self.rng.randint(5, 24)
+        words = [self.word() for _ in range(n)]
+        self.words += n
+        r = self.rng.random()
+        if r < 0.15:
+            i = self.rng.randrange(n)
+            words[i] = '*{}*'.format(words[i])
+        elif r < 0.2:
+            i = self.rng.randrange(n)
+            words[i] = '**{}**'.format(words[i])
+        text = ' '.join(words)
+        text = text[0].upper() + text[1:] + self.rng.choice('...?!')
+        if self.rng.random() < 0.25:
+            text = '"{}" {} said.'.format(text, self.rng.choice(['she', 'he', 'they']))
+            self.words += 2
+        return text
+
+    def paragraph(self):
+        r = self.rng.random()
+        if r < 0.03:
+            return '> ' + ' '.join(self.sentence() for _ in range(self.rng.randint(1, 3)))
+        if r < 0.05:
+            return '\n'.join('- ' + self.phrase(self.rng.randint(2, 6))
+                             for _ in range(self.rng.randint(2, 5)))
+        return ' '.join(self.sentence() for _ in range(self.rng.randint(2, 7)))
+
+    def scene(self, words):
+        target = self.words + words
+        paragraphs = []
+        while self.words < target:
+            paragraphs.append(self.paragraph())
+        return '\n\n'.join(paragraphs)
+
+
+def manuscript(words, seed=0, scene_words=1500, chapter_words=5000, number_scenes='false'):
+    """
+    Return a markdown manuscript of about `words` words.  Works longer
+    than two chapters get `# Chapter N` headings; scenes are separated
+    by `---`.
+    """
+    w = _Writer(seed)
+    parts = [FRONT_MATTER.format(title="Synthetic {} Words".format(words),
+                                 number_scenes=number_scenes)]
+    chapters = max(1, round(words / chapter_words))
+    per_chapter = words / chapters
+    for c in range(chapters):
+        target = round((c + 1) * per_chapter)
+        if chapters > 2:
+            parts.append('# Chapter {}\n'.format(c + 1))
+        scenes = []
+        while w.words < target:
+            scenes.append(w.scene(min(scene_words, target - w.words)))
+        parts.append('\n\n---\n\n'.join(scenes) + '\n')
+    return '\n'.join(parts)
+
+
+def sized_manuscript(size, seed=0):
+    """
+    Return the manuscript for one of the named SIZES.
+    """
+    return manuscript(SIZES[size], seed=seed)
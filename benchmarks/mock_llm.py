@@ -0,0 +1,226 @@
+"""
+benchmarks.mock_llm - A local stand-in for the OpenAI chat completions API.
+
+Point `mdfic copyedit` at it with MDFIC_OPENAI_BASE_URL to try chunk
+sizes, concurrency and retry settings without spending API money:
+
+    python -m benchmarks.mock_llm --port 8011 --latency 0.5 --tokens-per-second 200 &
+    MDFIC_OPENAI_BASE_URL=http://127.0.0.1:8011/v1 OPENAI_API_KEY=mock \\
+        mdfic copyedit story.md
+
+The "edit" it returns is the text below the prompt's #### line,
+unchanged.  Each request waits for the latency (plus up to the jitter)
+before its first token, then sends the reply at the given tokens per
+second, streamed as server-sent events if the client asks for that.
+A fraction of requests can be refused as rate-limited (429, with a
+retry-after header) or fail (500).
+"""
+
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+
+logger = logging.getLogger(__name__)
+
+# Roughly what a tokenizer makes of English prose.
+TOKEN = re.compile(r'\s*\S+')
+
+# The line above the text in the copyedit prompt.
+RULE = re.compile(r'^####[ \t]*$', re.MULTILINE)
+
+
+class Backend:
+    """
+    How the mock behaves, and counts of what it has done.
+
+    latency            seconds before the first token
+    jitter             up to this many more seconds, at random
+    tokens_per_second  how fast the reply is produced (0: instantly)
+    rate_limit         fraction of requests refused with 429
+    failure_rate       fraction of requests failed with 500
+    retry_after        seconds the 429 asks the client to wait
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, tokens_per_second=0, rate_limit=0.0,
+                 failure_rate=0.0, retry_after=0.1, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit = rate_limit
+        self.failure_rate = failure_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = dict(requests=0, completed=0, rate_limited=0, failed=0)
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def outcome(self):
+        """
+        Decide what happens to a request: 'rate_limited', 'failed' or
+        None, and how long it waits before its first token.
+        """
+        with self.lock:
+            self.counts['requests'] += 1
+            roll = self.random.random()
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if roll < self.rate_limit:
+            return 'rate_limited', 0
+        if roll < self.rate_limit + self.failure_rate:
+            return 'failed', delay
+        return None, delay
+
+    def token_delay(self):
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0
+
+
+def reply_text(messages):
+    """
+    The mock's edit of a chat: the last message's text
+    below the #### line.
+    """
+    content = messages[-1]['content'] if messages else ''
+    if isinstance(content, list):
+        content = ''.join(part.get('text', '') for part in content)
+    m = RULE.search(content)
+    return content[m.end():].strip() if m else content.strip()
+
+
+def completion(model, text):
+    return dict(
+        id='chatcmpl-mock', object='chat.completion', created=int(time.time()), model=model,
+        choices=[dict(index=0, message=dict(role='assistant', content=text), finish_reason='stop')],
+        usage=dict(prompt_tokens=0, completion_tokens=len(TOKEN.findall(text)), total_tokens=0),
+    )
+
+
+def completion_chunk(model, delta, finish_reason=None):
+    return dict(
+        id='chatcmpl-mock', object='chat.completion.chunk', created=int(time.time()), model=model,
+        choices=[dict(index=0, delta=delta, finish_reason=finish_reason)],
+    )
+
+
+class MockHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        backend = self.server.backend
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path.rstrip('/') not in ('/v1/chat/completions', '/chat/completions'):
+            self.send_json(404, dict(error=dict(message="not found", type='invalid_request_error')))
+            return
+        outcome, delay = backend.outcome()
+        time.sleep(delay)
+        if outcome == 'rate_limited':
+            backend.count('rate_limited')
+            self.send_json(429, dict(error=dict(message="Rate limit reached (mock)", type='requests',
+                                                code='rate_limit_exceeded')),
+                           headers=[('retry-after-ms', str(int(backend.retry_after * 1000)))])
+            return
+        if outcome == 'failed':
+            backend.count('failed')
+            self.send_json(500, dict(error=dict(message="Internal error (mock)", type='server_error')))
+            return
+
+        model = request.get('model', 'mock')
+        text = reply_text(request.get('messages', []))
+        tokens = TOKEN.findall(text)
+        try:
+            if request.get('stream'):
+                self.stream(model, tokens, backend.token_delay())
+            else:
+                time.sleep(len(tokens) * backend.token_delay())
+                # counted before the client can see the reply
+                backend.count('completed')
+                self.send_json(200, completion(model, text))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def stream(self, model, tokens, delay):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        events = [completion_chunk(model, dict(role='assistant', content=''))]
+        events += [completion_chunk(model, dict(content=token)) for token in tokens]
+        events += [completion_chunk(model, {}, finish_reason='stop')]
+        start = time.perf_counter()
+        for i, event in enumerate(events):
+            # pace against the clock, not per-token sleeps, so small delays add up right
+            wait = start + i * delay - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            self.wfile.write('data: {}\n\n'.format(json.dumps(event)).encode('utf8'))
+            self.wfile.flush()
+        self.server.backend.count('completed')
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+
+
+def make_server(backend, host='127.0.0.1', port=0):
+    """
+    Return a mock chat server for backend.  The caller runs
+    `serve_forever()`; port 0 picks a free port.
+    """
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.backend = backend
+    return server
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return 'http://{}:{}/v1'.format(host, port)
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', type=int, default=8011, show_default=True)
+@click.option('--latency', type=float, default=0.5, show_default=True, help="Seconds before the first token.")
+@click.option('--jitter', type=float, default=0.2, show_default=True, help="Up to this many extra seconds.")
+@click.option('--tokens-per-second', type=float, default=200, show_default=True, help="0 for instant replies.")
+@click.option('--rate-limit', type=float, default=0.0, show_default=True, help="Fraction of requests answered 429.")
+@click.option('--failure-rate', type=float, default=0.0, show_default=True, help="Fraction answered 500.")
+@click.option('--retry-after', type=float, default=0.1, show_default=True, help="Seconds asked for by a 429.")
+@click.option('--seed', type=int, default=0)
+def main(host, port, latency, jitter, tokens_per_second, rate_limit, failure_rate, retry_after, seed):
+    backend = Backend(latency=latency, jitter=jitter, tokens_per_second=tokens_per_second,
+                      rate_limit=rate_limit, failure_rate=failure_rate, retry_after=retry_after, seed=seed)
+    server = make_server(backend, host, port)
+    print("mock chat API at {}".format(base_url(server)), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(backend.counts))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+mdfic.artifacts - A content-addressed cache of rendered outputs.
+
+Set MDFIC_ARTIFACT_CACHE to a directory, which may be on storage shared
+between builders, and `mdfic html`, `latex`, `docx` and `epub` look
+there before rendering.  Each artifact is stored under the sha256 of
+everything that decides it: the format and its options, the input text,
+the contents of other files it reads (such as CSS), and the mdfic and
+pandoc versions.  Outputs that carry the build time (docx and epub) are
+only cached in reproducible mode, where that time comes from the source.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from .instrument import stage
+from .pandoc import pandoc_version
+from .utils import atomic_write, package_version
+
+logger = logging.getLogger(__name__)
+
+ENV = 'MDFIC_ARTIFACT_CACHE'
+
+
+def artifact_dir():
+    """
+    The artifact cache directory, or None if caching is off.
+    """
+    return os.environ.get(ENV) or None
+
+
+@functools.lru_cache(maxsize=None)
+def mdfic_version():
+    """
+    The installed mdfic version, or for a checkout that isn't
+    installed, a hash of its source so every edit is a new version.
+    """
+    version = package_version('mdfic')
+    if version != 'dev':
+        return version
+    h = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(here)):
+        if name.endswith('.py'):
+            with open(os.path.join(here, name), 'rb') as f:
+                h.update(name.encode('utf8') + b'\0' + f.read())
+    return 'dev-' + h.hexdigest()[:16]
+
+
+def artifact_key(kind, input, options=None, files=()):
+    """
+    The cache key for rendering input (a string) as kind with the
+    given options (a JSON-able dict), also reading files.
+    """
+    header = dict(kind=kind, options=options or {}, mdfic=mdfic_version(), pandoc=pandoc_version())
+    h = hashlib.sha256(json.dumps(header, sort_keys=True, default=str).encode('utf8'))
+    h.update(b'\0' + input.encode('utf8'))
+    for name in files:
+        with open(name, 'rb') as f:
+            h.update(b'\0' + f.read())
+    return h.hexdigest()
+
+
+def artifact_path(key):
+    return os.path.join(artifact_dir(), key[:2], key)
+
+
+def fetch(key, output):
+    """
+    Copy the artifact for key to output.  Returns False if
+    there isn't one.
+    """
+    path = artifact_path(key)
+    try:
+        src = open(path, 'rb')
+    except FileNotFoundError:
+        return False
+    with src, stage('artifacts.fetch', os.fstat(src.fileno()).st_size), atomic_write(output, 'wb') as out:
+        shutil.copyfileobj(src, out)
+    try:
+        # recently used artifacts are the ones to keep when pruning
+        os.utime(path)
+    except OSError:
+        pass
+    return True
+
+
+def store(key, output):
+    """
+    Add output to the cache as the artifact for key.  Failing
+    to is logged, not raised.
+    """
+    path = artifact_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with stage('artifacts.store', os.path.getsize(output)), \
+             open(output, 'rb') as src, atomic_write(path, 'wb') as out:
+            shutil.copyfileobj(src, out)
+    except OSError as e:
+        logger.warning("Can't write artifact {}: {}".format(path, e))
+
+
+def cached_render(kind, input, options, output, render, files=()):
+    """
+    Write output from the cache if it holds an artifact for these
+    inputs; otherwise call render() to write it and cache the result.
+    Returns True on a cache hit.  Output to stdout isn't cached.
+    """
+    if not artifact_dir() or output == '-':
+        render()
+        return False
+    key = artifact_key(kind, input, options, files)
+    if fetch(key, output):
+        logger.info("{}: reused artifact {}".format(output, key))
+        return True
+    render()
+    store(key, output)
+    return False
@@ -0,0 +1,140 @@
+"""
+mdfic.batch - Convert many stories to .docx in a pool of worker processes.
+
+A job file is a YAML (or JSON) list of jobs, one per output:
+
+    - files: [metadata.yaml, story-01.md, story-02.md]
+      output: out/story-sffms.docx
+      sffms: true
+    - files: [other.md]
+      output: out/other-plain.docx
+
+Jobs may also set `date` (default true), `pspaces` (default 1) and
+`reproducible` (default false), as for `mdfic docx`.  Each worker
+imports python-docx and loads the docx templates once, then converts
+jobs until the batch is done.  A job that fails is reported and the
+rest carry on, even if it takes its worker process down with it.
+"""
+
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+JOB_DEFAULTS = dict(
+    sffms = False,
+    date = True,
+    pspaces = 1,
+    reproducible = False,
+    )
+
+
+def load_jobs(path):
+    """
+    Read a job file and return its jobs with the defaults filled in.
+    Raises ValueError if a job has no files or output.
+    """
+    with open(path) as f:
+        jobs = yaml.load(f, Loader=yaml.SafeLoader) or []
+    if not isinstance(jobs, list):
+        raise ValueError("{}: expected a list of jobs".format(path))
+    result = []
+    for i, job in enumerate(jobs):
+        if not isinstance(job, dict) or not job.get('files') or not job.get('output'):
+            raise ValueError("{}: job {} needs `files` and `output`".format(path, i + 1))
+        job = dict(JOB_DEFAULTS, **job)
+        if isinstance(job['files'], str):
+            job['files'] = [job['files']]
+        result.append(job)
+    return result
+
+
+def warm():
+    """
+    Worker initializer: import python-docx and build the docx
+    templates so that every job in this worker reuses them.
+    """
+    from .docx import template_bytes
+    template_bytes(sffms=False)
+    template_bytes(sffms=True)
+
+
+def run_job(job):
+    """
+    Convert one job and return its result: the output, whether it
+    succeeded, the time it took and the error if it didn't.
+    """
+    from .docx import render_docx
+    from .normalize import Normalizer, chunks
+    from .utils import source_date
+
+    start = time.perf_counter()
+    result = succeeded(job)
+    try:
+        normalize = Normalizer(pspaces=job['pspaces'])
+        input = ""
+        for name in job['files']:
+            with open(name) as f:
+                input += ''.join(normalize.stream(chunks(f)))
+        # the pool already keeps the CPUs busy, one pandoc per job
+        render_docx(input, job['output'], sffms=job['sffms'], date=job['date'], jobs=1,
+                    source_date=source_date(job['files']) if job['reproducible'] else None)
+    except Exception as e:
+        logger.debug(traceback.format_exc())
+        result = failed(job, e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def succeeded(job):
+    return dict(output=job['output'], ok=True, error=None, seconds=0.0)
+
+
+def failed(job, e):
+    return dict(output=job['output'], ok=False, error="{}: {}".format(type(e).__name__, e), seconds=0.0)
+
+
+def run_alone(job):
+    """
+    Run a job in a worker process of its own, after a worker died
+    during the batch; if this one dies too, the job is to blame.
+    """
+    with ProcessPoolExecutor(max_workers=1, initializer=warm) as pool:
+        try:
+            return pool.submit(run_job, job).result()
+        except BrokenProcessPool:
+            return failed(job, RuntimeError("the worker process died"))
+        except Exception as e:
+            return failed(job, e)
+
+
+def convert(jobs, workers=None):
+    """
+    Run the jobs and yield their results in job order.  workers is
+    the number of processes (default: the CPU count); with 1 the
+    jobs run in this process.  When a worker dies, every job the pool
+    hadn't finished is rerun in a process of its own, so that only
+    the job that killed it fails.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(jobs)) or 1
+    if workers == 1:
+        warm()
+        for job in jobs:
+            yield run_job(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm) as pool:
+        futures = [pool.submit(run_job, job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                logger.warning("a worker died; running {} on its own".format(job['output']))
+                yield run_alone(job)
+            except Exception as e:
+                yield failed(job, e)
@@ -0,0 +1,246 @@
+"""
+mdfic.catalog - An incrementally updated SQLite index of story directories.
+
+A story directory is any directory containing Markdown files.  Its inputs
+are `metadata.yaml` (if present) followed by its Markdown parts, the same
+files the generated Makefiles feed to `mdfic`.  For multi-part stories the
+concatenated `STORY.md` built from `STORY-*.md` is skipped: a directory is
+a multi-part story when its Makefile is mdfic's multi-part one, or when
+every other Markdown file in it is a `STORY-*.md` part.
+
+Files are only re-read when their size or mtime changed, and a story is
+only re-analyzed when the hash of one of its inputs changed.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+
+import yaml
+
+from .utils import parse_metadata, split_metadata_and_text, count_scenes
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    story TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha1 TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_story ON files(story);
+CREATE TABLE IF NOT EXISTS stories (
+    path TEXT PRIMARY KEY,
+    title TEXT,
+    author TEXT,
+    words INTEGER NOT NULL,
+    scenes INTEGER NOT NULL,
+    parts TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    scanned TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stories_words ON stories(words);
+"""
+
+SKIP_DIRS = {'out', 'markup', 'images', 'node_modules', '__pycache__'}
+SKIP_FILES = {'README.md', 'CHANGELOG.md'}
+
+# The story name in a multi-part Makefile from `mdfic.makefile`.
+MULTI_MAKEFILE = re.compile(r'^STORY=(\S+)\n(?:.*\n)*?PARTS = \$\(sort \$\(wildcard \$\(STORY\)-\*\.md\)\)',
+                            re.MULTILINE)
+
+
+def connect(dbpath):
+    """
+    Open (creating if needed) the catalog database at dbpath.
+    """
+    db = sqlite3.connect(dbpath)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+
+def story_inputs(dirpath, filenames):
+    """
+    Return the list of input files for the story in dirpath,
+    given the names of the files in it, or [] if it isn't a story.
+    """
+    md = sorted(f for f in filenames if f.endswith('.md') and f not in SKIP_FILES)
+    generated = multi_part_name(dirpath, filenames)
+    if generated is None:
+        for f in md:
+            others = [o for o in md if o != f]
+            part = re.compile(re.escape(f[:-3]) + r'-\d+\.md$')
+            if others and all(part.match(o) for o in others):
+                generated = f[:-3]
+    # STORY.md is generated from STORY-01.md, STORY-02.md, ... in
+    # multi-part stories
+    parts = [f for f in md if f != '{}.md'.format(generated)]
+    if not parts:
+        return []
+    inputs = ['metadata.yaml'] if 'metadata.yaml' in filenames else []
+    return [os.path.join(dirpath, f) for f in inputs + parts]
+
+
+def multi_part_name(dirpath, filenames):
+    """
+    The story name in dirpath's Makefile, if it is a multi-part one.
+    """
+    if 'Makefile' not in filenames:
+        return None
+    try:
+        with open(os.path.join(dirpath, 'Makefile')) as f:
+            m = MULTI_MAKEFILE.search(f.read())
+    except (OSError, UnicodeDecodeError):
+        return None
+    return m.group(1) if m else None
+
+
+def find_stories(root):
+    """
+    Walk the tree under root and generate (story_dir, inputs) pairs.
+    """
+    for dirpath, dirnames, filenames in os.walk(os.path.realpath(root)):
+        dirnames[:] = sorted(d for d in dirnames
+                             if not d.startswith('.') and d not in SKIP_DIRS)
+        inputs = story_inputs(dirpath, filenames)
+        if inputs:
+            yield dirpath, inputs
+
+
+def analyze(inputs, contents):
+    """
+    Compute the catalog record for a story from the contents
+    of its input files.
+    """
+    text = ''.join(contents)
+    try:
+        metadata = parse_metadata(text, join='\n')
+        _, body = split_metadata_and_text(text)
+    except (ValueError, yaml.YAMLError) as e:
+        logger.warning("Can't parse metadata for {}: {}".format(inputs[0], e))
+        metadata, body = {}, text
+    metadata.pop('metadata_yaml_length', None)
+    return dict(
+        title = str(metadata.get('title', '')),
+        author = str(metadata.get('author', '')),
+        words = len(body.split()),
+        scenes = count_scenes(body),
+        parts = json.dumps([os.path.basename(p) for p in inputs]),
+        metadata = json.dumps(metadata, default=str),
+    )
+
+
+def _story_changed(db, story, inputs, stats):
+    """
+    Check the stored file records for a story against the disk.
+    Files whose mtime moved but whose contents didn't are refreshed
+    in place.  Return True if the story needs to be re-analyzed.
+    """
+    known = {r['path']: r for r in db.execute(
+        "SELECT * FROM files WHERE story = ?", (story,))}
+    if set(known) != set(inputs):
+        return True
+    for path in inputs:
+        row = known[path]
+        st = stats[path]
+        if (row['mtime_ns'], row['size']) == (st.st_mtime_ns, st.st_size):
+            continue
+        with open(path, 'rb') as f:
+            sha1 = hashlib.sha1(f.read()).hexdigest()
+        if sha1 != row['sha1']:
+            return True
+        db.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?",
+                   (st.st_mtime_ns, st.st_size, path))
+    return False
+
+
+def scan(db, root):
+    """
+    Bring the catalog up to date with the stories under root.
+    Return a dict counting added, updated, unchanged and removed stories.
+    """
+    counts = dict(added=0, updated=0, unchanged=0, removed=0)
+    seen = set()
+    now = datetime.datetime.now().isoformat(timespec='seconds')
+    for story, inputs in find_stories(root):
+        seen.add(story)
+        stats = {p: os.stat(p) for p in inputs}
+        exists = db.execute("SELECT 1 FROM stories WHERE path = ?", (story,)).fetchone()
+        if exists and not _story_changed(db, story, inputs, stats):
+            counts['unchanged'] += 1
+            continue
+
+        logger.info("Scanning {}".format(story))
+        raw = []
+        for p in inputs:
+            with open(p, 'rb') as f:
+                raw.append(f.read())
+        record = analyze(inputs, [r.decode('utf8', errors='replace') for r in raw])
+        db.execute("DELETE FROM files WHERE story = ?", (story,))
+        db.executemany(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+            [(p, story, stats[p].st_mtime_ns, stats[p].st_size,
+              hashlib.sha1(r).hexdigest()) for p, r in zip(inputs, raw)])
+        db.execute(
+            "INSERT OR REPLACE INTO stories VALUES "
+            "(:path, :title, :author, :words, :scenes, :parts, :metadata, :scanned)",
+            dict(record, path=story, scanned=now))
+        counts['updated' if exists else 'added'] += 1
+
+    prefix = os.path.join(os.path.realpath(root), '')
+    for (story,) in db.execute("SELECT path FROM stories").fetchall():
+        if (story + os.sep).startswith(prefix) and story not in seen:
+            db.execute("DELETE FROM stories WHERE path = ?", (story,))
+            db.execute("DELETE FROM files WHERE story = ?", (story,))
+            counts['removed'] += 1
+    db.commit()
+    return counts
+
+
+def query(db, min_words=None, max_words=None, where=(), sql=None):
+    """
+    Return catalog rows matching all the given conditions.
+
+    where is a sequence of (key, value) pairs matched against the
+    story metadata, with dotted keys for nested values, e.g.
+    ('mdfic.number_scenes', 'roman').  sql is an extra raw SQL
+    condition on the stories table.
+    """
+    conditions, params = [], []
+    if min_words is not None:
+        conditions.append("words >= ?")
+        params.append(min_words)
+    if max_words is not None:
+        conditions.append("words <= ?")
+        params.append(max_words)
+    for key, value in where:
+        conditions.append("json_extract(metadata, ?) = ?")
+        params.extend(['$.' + key, value])
+    if sql:
+        conditions.append("({})".format(sql))
+    statement = "SELECT * FROM stories"
+    if conditions:
+        statement += " WHERE " + " AND ".join(conditions)
+    statement += " ORDER BY path"
+    return db.execute(statement, params).fetchall()
+
+
+def parse_where(expr):
+    """
+    Parse a `key=value` query condition.  The value is read
+    as YAML so that `true` and `3` match booleans and numbers.
+    """
+    if '=' not in expr:
+        raise ValueError("Expected key=value, got {!r}".format(expr))
+    key, value = expr.split('=', 1)
+    value = yaml.safe_load(value)
+    if isinstance(value, bool):
+        value = int(value)
+    return key.strip(), value
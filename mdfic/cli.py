@@ -14,7 +14,6 @@ import click
 import logging
 import os
 import sys
-import datetime
 
 
 
@@ -30,111 +29,273 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 ############################
 
+from .instrument import stage
 
-@click.group()
-def cli():
+
+def reproducible_mode(flag):
+    """
+    --reproducible/--no-reproducible, defaulting to on when
+    $SOURCE_DATE_EPOCH is set, as reproducible-builds tools expect.
+    """
+    return bool(os.environ.get('SOURCE_DATE_EPOCH')) if flag is None else flag
+
+
+class Group(click.Group):
+    """
+    Report a failed pandoc run as an error message, not a traceback,
+    and keep the command line the group was invoked with, which under
+    `mdfic serve` is the client's, not the daemon's sys.argv.
+    """
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        argv = list(args)
+        ctx = super().make_context(info_name, args, parent=parent, **extra)
+        ctx.meta['mdfic.argv'] = argv
+        return ctx
+
+    def invoke(self, ctx):
+        try:
+            return super().invoke(ctx)
+        except RuntimeError as e:
+            from .pandoc import PandocError
+            if isinstance(e, PandocError):
+                raise click.ClickException(str(e).rstrip())
+            raise
+
+
+@click.group(cls=Group)
+@click.option('--profile', metavar='FILE', envvar='MDFIC_PROFILE',
+              help="Append per-stage timings as a JSON line to FILE ('-' for stderr). Also $MDFIC_PROFILE.")
+@click.option('--profile-stage', metavar='STAGE', envvar='MDFIC_PROFILE_STAGE',
+              help="Run STAGE under cProfile and dump it to STAGE.prof. Also $MDFIC_PROFILE_STAGE.")
+@click.option('--trace', metavar='MODULE', multiple=True, envvar='MDFIC_TRACE',
+              help="Write JSON trace events from MODULE (e.g. docx, utils, or all) to stderr; may be repeated. Also $MDFIC_TRACE.")
+@click.option('--trace-file', metavar='FILE', envvar='MDFIC_TRACE_FILE',
+              help="Append trace events to FILE instead of stderr. Also $MDFIC_TRACE_FILE.")
+@click.pass_context
+def cli(ctx,profile,profile_stage,trace,trace_file):
     """    
     A set of tools to help in rendering fiction stories 
     written in Markdown to latex, pdf, DOCX and other 
     formats.
     """
+    if profile:
+        from . import instrument
+        instrument.enable(profile_stage=profile_stage)
+        @ctx.call_on_close
+        def finish():
+            instrument.write_report(profile, ctx.invoked_subcommand, ctx.meta.get('mdfic.argv'))
+            instrument.disable()
+        ctx.with_resource(stage('total'))
+    if trace:
+        from . import trace as tracing
+        stream = ctx.with_resource(open(trace_file, 'a')) if trace_file else None
+        tracing.enable(trace, stream)
+        ctx.call_on_close(tracing.disable)
 
 @cli.command('latex')
 @click.option('--documentclass', default='sffms', help="document class {sffms,article,book}. default=sffms.")
 @click.option('--output', '-o', type=str,default="-", help="File to write to. (default stdout)")
+@click.option('--depfile', type=str, help="Also write a make dependency file listing the inputs read.")
 @click.argument('files', nargs=-1)
-def latex_story(documentclass,output,files):
+def latex_story(documentclass,output,files,depfile):
     """
     Output a complete latex story from markdwon
     """
-    from .latex import SFFMSStory,ArticleStory,BookStory
+    from .artifacts import cached_render
+    from .latex import latex_story as make_latex_story
+    from .utils import write_depfile
 
     files = files or ['-']
     input = ''
-    for name in files:
-        with click.open_file(name,'r') as f:
-            input += f.read()
-
-    if documentclass=='article':
-        latex_story = ArticleStory(input)
-    elif documentclass=='book':
-        latex_story = BookStory(input)
-    else:
-        latex_story = SFFMSStory(input)
-
-    with click.open_file(output,"w") as out:
-        out.write(latex_story.document)
+    with stage('read') as st:
+        for name in files:
+            with click.open_file(name,'r') as f:
+                input += f.read()
+        st.add_bytes(len(input))
+
+    def render():
+        document = make_latex_story(input, documentclass).document
+        with stage('write', len(document)), click.open_file(output,"w",atomic=True) as out:
+            out.write(document)
+    cached_render('tex', input, dict(documentclass=documentclass), output, render)
+    if depfile:
+        write_depfile(depfile, output, files)
 
 @cli.command('docx')
 @click.option('--output', '-o',  default="story.docx", help="The output file, default: story.docx")
 @click.option('--pspaces', default=1, help="Number of spaces to put after a period.")
 @click.option('--sffms/--no-sffms', default=False, help="Use SFFMS style.")
 @click.option('--date/--no-date', default=True, help="Add a DRAFT tag and date to the title")
+@click.option('--depfile', type=str, help="Also write a make dependency file listing the inputs read.")
+@click.option('--batch', 'jobfile', type=click.Path(exists=True), help="Convert every job in a YAML/JSON job file instead.")
+@click.option('--jobs', '-j', type=int, help="Worker processes for --batch, or pandoc runs at once for a long story. (default: CPU count)")
+@click.option('--reproducible/--no-reproducible', default=None, help="Date the output from $SOURCE_DATE_EPOCH or git, so the same input gives the same bytes. (default: on if $SOURCE_DATE_EPOCH is set)")
 @click.argument('files', nargs=-1)
-def docx_story(output,pspaces,files,sffms,date):
+def docx_story(output,pspaces,files,sffms,date,depfile,jobfile,jobs,reproducible):
     """
     Read a story on standard input and write a formatted .docx
     """
-    from .docx import HTML2DOCX
-    from .utils import fix_sentence_spacing, parse_metadata, pandoc
+    from .artifacts import cached_render
+    from .docx import render_docx
+    from .normalize import Normalizer, chunks
+    from .utils import source_date, write_depfile
+
+    if jobfile:
+        from .batch import load_jobs, convert
+        if files:
+            raise click.UsageError("--batch takes its input files from the job file")
+        try:
+            batch = load_jobs(jobfile)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--batch')
+        failed = 0
+        for result in convert(batch, workers=jobs):
+            if result['ok']:
+                click.echo("ok      {seconds:7.2f}s  {output}".format(**result))
+            else:
+                failed += 1
+                click.echo("FAILED  {seconds:7.2f}s  {output}: {error}".format(**result))
+        click.echo("{} of {} jobs failed".format(failed, len(batch)) if failed
+                   else "{} jobs converted".format(len(batch)))
+        if failed:
+            sys.exit(1)
+        return
 
+    normalize = Normalizer(pspaces=pspaces)
     input = ""
-    for name in files:
-        with click.open_file(name,'r') as f:
-            input += fix_sentence_spacing(f.read(), N=pspaces)
-    metadata = parse_metadata(input,join='\n')
-    if date:
-        metadata['date'] = datetime.datetime.today().strftime('%Y-%m-%d %H:%M')
-    html = pandoc(input, '--from=markdown', '--to=html') #.decode('utf8')
-    hdocx = HTML2DOCX(metadata,sffms=sffms)
-    hdocx.feed(html)
-    hdocx.save(output)
+    with stage('read') as st:
+        for name in files:
+            with click.open_file(name,'r') as f:
+                input += ''.join(normalize.stream(chunks(f)))
+        st.add_bytes(len(input))
+    if reproducible_mode(reproducible):
+        built = source_date(files)
+        cached_render('docx', input, dict(sffms=sffms, date=date, source_date=built.isoformat()), output,
+                      lambda: render_docx(input, output, sffms=sffms, date=date, jobs=jobs, source_date=built))
+    else:
+        render_docx(input, output, sffms=sffms, date=date, jobs=jobs)
+    if depfile:
+        write_depfile(depfile, output, files)
 
 @cli.command('html')
 @click.option('--output', '-o',  default="story.html", help="The output file, default: story.html")
 @click.option('--css', '-c', help='CSS file to use for formatting')
+@click.option('--depfile', type=str, help="Also write a make dependency file listing the inputs read.")
+@click.option('--optimize', is_flag=True, help="Minify the page and its CSS, and write precompressed .gz (and .br) copies.")
 @click.argument('files', nargs=-1)
-def html_story(output,css,files):
+def html_story(output,css,files,depfile,optimize):
     """
     Read a story on standard input and write HTML
     """
-    from .utils import parse_metadata, pandoc
-    from .utils import get_in, int_to_roman
+    from .artifacts import cached_render
+    from .html import render_html
+    from .utils import write_depfile
 
     input = ""
-    for name in files:
-        with click.open_file(name,'r') as f:
-            input += f.read()
-    metadata = parse_metadata(input,join='\n')
-    number_scenes = get_in(metadata,['mdfic','number_scenes'],False)
-
-    cssargs = []
-    if css:
-        cssargs = ['-H',css]
-    html = pandoc(input, '--standalone','--from=markdown', '--to=html',*cssargs) #.decode('utf8')
-
-    html += "<center><bold>END</bold></center>"
-
-    if number_scenes:
-        scenes = html.split("<hr />")
-        html = ""
-        for i,s in enumerate(scenes):
-            scene_num = int_to_roman(i+1) if number_scenes=='roman' else i+1
-            scene_break = f"<center><bold>{scene_num}</bold></center>"
-            if i == 0:
-                h,s = s.split("</header>\n")
-                html += (h 
-                     + "</header>\n" 
-                     + scene_break
-                     + s)
-            else:
-                html += scene_break + s
+    with stage('read') as st:
+        for name in files:
+            with click.open_file(name,'r') as f:
+                input += f.read()
+        st.add_bytes(len(input))
+
+    def render():
+        html = render_html(input, css=css, optimize=optimize)
+        with stage('write', len(html)), click.open_file(output,'w',atomic=True) as f:
+            f.write(html)
+    cached_render('html', input, dict(css=bool(css), optimize=optimize), output, render,
+                  files=[css] if css else [])
+    if optimize and output != '-':
+        from .minify import precompress
+        with stage('precompress'):
+            precompress(output)
+    if depfile:
+        write_depfile(depfile, output, list(files) + ([css] if css else []))
+
+
+@cli.command('html-pages')
+@click.option('--output', '-o', default="story", help="The output directory, default: story")
+@click.option('--css', '-c', help='CSS file to use instead of the mdfic CSS')
+@click.option('--by', type=click.Choice(['chapter', 'part']), default='chapter', show_default=True,
+              help="A page per top-level chapter heading, or per input file.")
+@click.option('--jobs', '-j', type=int, help="Pandoc runs at once for long books. (default: CPU count)")
+@click.option('--depfile', type=str, help="Also write a make dependency file listing the inputs read.")
+@click.option('--optimize', is_flag=True, help="Minify the pages and CSS, and write precompressed .gz (and .br) copies.")
+@click.argument('files', nargs=-1)
+def html_pages(output,css,by,jobs,files,depfile,optimize):
+    """
+    Read a story and write it as HTML pages, one per chapter
+    (or part), with an index and links between them.
+    """
+    from .paginate import join_parts, render_pages
+    from .utils import write_depfile
+
+    texts = []
+    with stage('read') as st:
+        for name in files:
+            with click.open_file(name,'r') as f:
+                texts.append(f.read())
+        st.add_bytes(sum(len(text) for text in texts))
+    input = join_parts(texts) if by == 'part' else ''.join(texts)
+    render_pages(input, output, css=css, by=by, jobs=jobs, optimize=optimize)
+    if depfile:
+        write_depfile(depfile, os.path.join(output, 'index.html'), list(files) + ([css] if css else []))
+
+
+@cli.command('epub')
+@click.option('--output', '-o',  default="story.epub", help="The output file, default: story.epub")
+@click.option('--css', '-c', help='CSS file to embed instead of the mdfic CSS')
+@click.option('--jobs', '-j', type=int, help="Pandoc runs at once for long books. (default: CPU count)")
+@click.option('--depfile', type=str, help="Also write a make dependency file listing the inputs read.")
+@click.option('--reproducible/--no-reproducible', default=None, help="Date the book from $SOURCE_DATE_EPOCH or git, so the same input gives the same bytes. (default: on if $SOURCE_DATE_EPOCH is set)")
+@click.argument('files', nargs=-1)
+def epub_story(output,css,jobs,files,depfile,reproducible):
+    """
+    Read a story on standard input and write an EPUB book,
+    one chapter per file, with the mdfic CSS and scene breaks.
+    """
+    from .artifacts import cached_render
+    from .epub import render_epub
+    from .utils import source_date, write_depfile
+
+    input = ""
+    with stage('read') as st:
+        for name in files:
+            with click.open_file(name,'r') as f:
+                input += f.read()
+        st.add_bytes(len(input))
+    if reproducible_mode(reproducible):
+        built = source_date(files)
+        cached_render('epub', input, dict(css=bool(css), source_date=built.isoformat()), output,
+                      lambda: render_epub(input, output, css=css, jobs=jobs, source_date=built),
+                      files=[css] if css else [])
     else:
-        html = html.replace("<hr />","<center><bold>• • •</bold></center>")
+        render_epub(input, output, css=css, jobs=jobs)
+    if depfile:
+        write_depfile(depfile, output, list(files) + ([css] if css else []))
 
-    with click.open_file(output,'w') as f:
-        f.write(html)
 
+@cli.command('pdf')
+@click.option('--output', '-o', help="The output file. (default: the .tex file's name with .pdf)")
+@click.option('--engine', default='pdflatex', help="LaTeX engine to run. (default pdflatex)")
+@click.option('--build-dir', help="Where to keep LaTeX's auxiliary files. (default: .NAME.build next to the output)")
+@click.option('--max-runs', default=5, help="Most LaTeX runs before giving up on the aux files settling.")
+@click.argument('file', nargs=1)
+def pdf(file,output,engine,build_dir,max_runs):
+    """
+    Compile a .tex file from `mdfic latex` to PDF, running LaTeX
+    again only while its .aux/.toc files change.
+    """
+    from .pdf import compile_pdf, LatexError
+
+    output = output or os.path.splitext(file)[0] + '.pdf'
+    try:
+        runs = compile_pdf(file, output, engine=engine, build_dir=build_dir, max_runs=max_runs)
+    except LatexError as e:
+        raise click.ClickException(str(e))
+    except FileNotFoundError as e:
+        raise click.ClickException("Can't run {}: {}".format(engine, e))
+    logger.info("{}: {} LaTeX run(s)".format(output, runs))
 
 @cli.command('pages-to-pdf')
 @click.option('--output', '-o',  default='story.pdf', help="The output file, will be written as PDF.")
@@ -176,6 +337,8 @@ def gitignore(name,output,multi):
     *.log
     *.toc
     *.synctex.gz
+    *.d
+    .*.build/
     {name}.tex
     {name}.pdf
     {name}.docx
@@ -233,12 +396,65 @@ def strip_word_doc(output,files):
 
     files = files or ['-']
     txt = b'' 
-    for name in files: 
-        with click.open_file(name,'rb') as f:
-            txt += f.read()
+    with stage('read') as st:
+        for name in files: 
+            with click.open_file(name,'rb') as f:
+                txt += f.read()
+        st.add_bytes(len(txt))
 
-    with click.open_file(output,"w") as out:
-        out.write(''.join(charset.get(chr(c),'') for c in txt))
+    with stage('strip', len(txt)):
+        stripped = ''.join(charset.get(chr(c),'') for c in txt)
+
+    with stage('write', len(stripped)), click.open_file(output,"w") as out:
+        out.write(stripped)
+
+
+@cli.command('from-docx')
+@click.option('--output', '-o', type=str,default="-", help="File to write to. (default stdout)")
+@click.argument('file', type=click.Path(exists=True, dir_okay=False))
+def from_docx(output,file):
+    """
+    Turn a .docx manuscript, such as one back from an editor, into
+    mdfic Markdown: italics, bold, headings, blockquotes, lists and
+    scene breaks, with front matter from the document properties.
+    Tracked changes are taken as accepted.
+    """
+    import zipfile
+    from .fromdocx import docx_to_markdown
+
+    try:
+        with click.open_file(output,"w",atomic=True) as out:
+            for text in docx_to_markdown(file):
+                out.write(text)
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise click.ClickException("{} isn't a .docx file: {}".format(file, e))
+
+
+@cli.command('normalize')
+@click.option('--output', '-o', type=str,default="-", help="File to write to. (default stdout)")
+@click.option('--pspaces', type=int, help="Number of spaces to put after a period.")
+@click.option('--quotes', type=click.Choice(['smart', 'straight']), help="Make quotes curly or straight.")
+@click.option('--dashes', type=click.Choice(['unicode', 'ascii']), help="Turn -- and --- into en and em dashes, or back.")
+@click.option('--ellipses', type=click.Choice(['unicode', 'ascii']), help="Turn ... and . . . into an ellipsis character, or back.")
+@click.option('--whitespace/--no-whitespace', default=False, help="Drop trailing spaces, extra blank lines and zero-width characters.")
+@click.argument('files', nargs=-1)
+def normalize(output,pspaces,quotes,dashes,ellipses,whitespace,files):
+    """
+    Clean up the text of a story in one pass: sentence spacing,
+    quotes, dashes, ellipses and whitespace.  Metadata, code and
+    HTML are left alone.  Reads and writes as it goes, so it can
+    sit in a pipe in front of any other command.
+    """
+    from .normalize import Normalizer, chunks
+
+    normalizer = Normalizer(pspaces=pspaces, quotes=quotes, dashes=dashes,
+                            ellipses=ellipses, whitespace=whitespace)
+    with stage('normalize') as st, click.open_file(output,"w",atomic=True) as out:
+        for name in files or ['-']:
+            with click.open_file(name,'r') as f:
+                for chunk in normalizer.stream(chunks(f)):
+                    st.add_bytes(len(chunk))
+                    out.write(chunk)
 
 
 @cli.command('wc')
@@ -251,13 +467,73 @@ def wc(files,wpm):
     total = 0
     fmt = "{name}: {count} words, {minutes} minutes"
     for name in files:
-        with click.open_file(name,'r') as f:
-            count = len(f.read().split())
+        with click.open_file(name,'r') as f, stage('count') as st:
+            text = f.read()
+            st.add_bytes(len(text))
+            count = len(text.split())
             total += count
         print(fmt.format(name=name,count=count,minutes=round(count/wpm)))
     print(fmt.format(name="TOTAL", count=total,minutes=round(total/wpm)))        
 
 
+@cli.command('stats')
+@click.argument('files', nargs=-1)
+@click.option('--wpm',type=int,default=260,help="Reading time words per minute.")
+@click.option('--json', 'as_json', is_flag=True, help="Print JSON instead of tables.")
+def stats(files,wpm,as_json):
+    """
+    Print per-chapter and per-scene word counts, sentence and
+    paragraph lengths, dialogue ratio and reading time.
+    """
+    from .stats import stats as manuscript_stats, format_table
+
+    input = ""
+    with stage('read') as st:
+        for name in files or ['-']:
+            with click.open_file(name,'r') as f:
+                input += f.read()
+        st.add_bytes(len(input))
+    with stage('stats', len(input)):
+        result = manuscript_stats(input, wpm=wpm)
+    if as_json:
+        import json
+        click.echo(json.dumps(result, indent=2))
+    else:
+        click.echo(format_table(result))
+
+@cli.command('echoes')
+@click.argument('files', nargs=-1)
+@click.option('--n', 'sizes', type=click.IntRange(2), multiple=True, help="Phrase length in words; repeat for several. (default=3)")
+@click.option('--min-count', type=click.IntRange(2), default=2, show_default=True, help="Report phrases used at least this many times.")
+@click.option('--distance', type=click.IntRange(1), default=30, show_default=True, help="Report words repeated within this many words.")
+@click.option('--min-length', type=int, default=4, show_default=True, help="Ignore echoes of words shorter than this.")
+@click.option('--ignore', multiple=True, help="A word not to report as an echo; repeat for several.")
+@click.option('--json', 'as_json', is_flag=True, help="Print JSON instead of text.")
+def echoes(files,sizes,min_count,distance,min_length,ignore,as_json):
+    """
+    Find repeated phrases and words echoed close together,
+    with the chapter, scene and paragraph of each.
+    """
+    from .echoes import Tokens, repeated_phrases, echoes as find_echoes, format_report
+
+    input = ""
+    with stage('read') as st:
+        for name in files or ['-']:
+            with click.open_file(name,'r') as f:
+                input += f.read()
+        st.add_bytes(len(input))
+    with stage('echoes', len(input)):
+        tokens = Tokens(input)
+        phrases = []
+        for n in sizes or (3,):
+            phrases += repeated_phrases(tokens, n=n, min_count=min_count)
+        found = find_echoes(tokens, distance=distance, min_length=min_length, ignore=ignore)
+    if as_json:
+        import json
+        click.echo(json.dumps(dict(phrases=phrases, echoes=found), indent=2))
+    else:
+        click.echo(format_report(phrases, found))
+
 @cli.command('makefile')
 @click.option('--name',type=str,required=True, help="The filename stem of the story.")
 @click.option('--multi/--no-multi', default=False, help="Is this a multi-part story?")
@@ -287,11 +563,13 @@ def tweet(maxlen,output,files,append):
     files = files or ["-"]
 
     text = ""
-    for name in files:
-        with click.open_file(name,'r') as f:
-            text += f.read()
+    with stage('read') as st:
+        for name in files:
+            with click.open_file(name,'r') as f:
+                text += f.read()
+        st.add_bytes(len(text))
 
-    with click.open_file(output,'w') as out:
+    with stage('tweets.generate', len(text)), click.open_file(output,'w') as out:
         for i,(l,t) in enumerate(generate(text,maxlen,appendix=append)):
             out.write("{} | {} | {}".format(i+1,l,t))
             out.write('\n####\n')
@@ -303,7 +581,7 @@ def css(output):
     Output CSS file for HTML stories.
     """
     from .css import CSS
-    with click.open_file(output,'w') as out:
+    with click.open_file(output,'w',atomic=True) as out:
         out.write(CSS)
 
 @cli.command("hrrepl")
@@ -328,7 +606,8 @@ def progress(since,files):
     command = ["git", "diff"] + list(files)
 
     # get the changes in the working copy
-    out,err = Popen(command,encoding='utf8',stdin=PIPE,stdout=PIPE).communicate()
+    with stage('git.diff'):
+        out,err = Popen(command,encoding='utf8',stdin=PIPE,stdout=PIPE).communicate()
 
     if err:
         print(err)
@@ -337,7 +616,8 @@ def progress(since,files):
     if since:
         # get the historical changes from the repo
         command = ["git", "diff", f'HEAD@{{{since}}}','HEAD'] + list(files)
-        hout,herr = Popen(command,encoding='utf8',stdin=PIPE,stdout=PIPE).communicate()
+        with stage('git.diff'):
+            hout,herr = Popen(command,encoding='utf8',stdin=PIPE,stdout=PIPE).communicate()
         out += hout
         if herr:
             print(herr)
@@ -351,25 +631,169 @@ def progress(since,files):
 @cli.command("copyedit")
 @click.option("--strength", type=str, default='light')
 @click.option('--output', '-o',  type=str, default='-', help="File to write output to. (default stdout)")
+@click.option('--jobs', '-j', type=int, help="Chunks to send at once. (default $MDFIC_COPYEDIT_JOBS or 1)")
 @click.argument('files',nargs=-1,type=str)
-def copyedit(strength,output,files):
+def copyedit(strength,output,jobs,files):
     """
     Run an AI copyedit on Markdown fiction files.
 
     Reads each file, sends chunks to the configured OpenAI model, and writes
-    the edited result. Configuration (env vars, API key, strength levels) is
-    documented in the project README.
+    the edited text as it arrives, in order, so the start of a long story
+    can be read while the rest is still being edited. Configuration (env
+    vars, API key, strength levels) is documented in the project README.
     """
-    from .copyedit import copyedit
-    from pathlib import Path
+    from .copyedit import copyedit_stream
 
     with click.open_file(output,'w') as out:
         for filename in files:
-            with click.open_file(filename) as inp:
+            with click.open_file(filename) as inp, stage('read') as st:
                 contents = inp.read()
-            edited_contents = copyedit(contents,strength=strength)
-            out.write(edited_contents)
+                st.add_bytes(len(contents))
+            with stage('copyedit', len(contents)):
+                for piece in copyedit_stream(contents,strength=strength,jobs=jobs):
+                    out.write(piece)
+                    out.flush()
+
+
+@cli.group("catalog")
+@click.option('--db', type=str, default=lambda: os.environ.get('MDFIC_CATALOG', 'catalog.sqlite'),
+              help="Catalog database file. (default $MDFIC_CATALOG or catalog.sqlite)")
+@click.pass_context
+def catalog(ctx,db):
+    """
+    Index story directories in a SQLite catalog and query it.
+    """
+    ctx.obj = db
 
+@catalog.command("scan")
+@click.argument('roots', nargs=-1, type=click.Path(exists=True, file_okay=False))
+@click.pass_obj
+def catalog_scan(db,roots):
+    """
+    Scan directory trees for stories and update the catalog.
+    Only stories whose files changed are re-read.
+    """
+    from .catalog import connect, scan
+
+    with connect(db) as conn:
+        for root in roots or ['.']:
+            counts = scan(conn, root)
+            print("{root}: {added} added, {updated} updated, {unchanged} unchanged, {removed} removed"
+                  .format(root=root, **counts))
+
+@catalog.command("query")
+@click.option('--min-words', type=int, help="Only stories with at least this many words.")
+@click.option('--max-words', type=int, help="Only stories with at most this many words.")
+@click.option('--where', 'wheres', multiple=True, help="Metadata condition key=value, e.g. mdfic.number_scenes=roman")
+@click.option('--sql', type=str, help="Extra SQL condition on the stories table.")
+@click.option('--json/--no-json', 'as_json', default=False, help="Output JSON lines.")
+@click.pass_obj
+def catalog_query(db,min_words,max_words,wheres,sql,as_json):
+    """
+    List the cataloged stories matching all the given conditions.
+    """
+    import json
+    from .catalog import connect, query, parse_where
+
+    try:
+        where = [parse_where(w) for w in wheres]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--where')
+    with connect(db) as conn:
+        rows = query(conn, min_words=min_words, max_words=max_words, where=where, sql=sql)
+    for row in rows:
+        if as_json:
+            record = dict(row)
+            record['parts'] = json.loads(record['parts'])
+            record['metadata'] = json.loads(record['metadata'])
+            print(json.dumps(record))
+        else:
+            print("{words}\t{scenes}\t{title}\t{path}".format(**row))
+
+@cli.command("watch")
+@click.option('--name', type=str, required=True, help="The filename stem of the story.")
+@click.option('--format', '-f', 'formats', multiple=True,
+              type=click.Choice(['html','plain','sffms','tex']),
+              help="Output to rebuild, may be repeated. (default html and sffms)")
+@click.option('--css', '-c', help='CSS file to use for HTML output.')
+@click.option('--date/--no-date', default=True, help="Add a DRAFT tag and date to docx titles")
+@click.option('--pspaces', default=1, help="Number of spaces to put after a period in docx output.")
+@click.option('--interval', type=float, default=0.5, help="Seconds between polls. (default 0.5)")
+@click.option('--debounce', type=float, default=0.5, help="Seconds of quiet to wait for after a change. (default 0.5)")
+def watch(name,formats,css,date,pspaces,interval,debounce):
+    """
+    Watch a story's sources and rebuild its outputs on every save.
+    """
+    from .watch import StoryWatcher
+
+    watcher = StoryWatcher(name, formats=formats or ('html','sffms'), css=css, date=date,
+                           pspaces=pspaces, interval=interval, debounce=debounce)
+
+    def report(results):
+        for fmt,output,seconds,error in results:
+            status = "FAILED: {}".format(error) if error else "ok"
+            print("{output}: {status} ({seconds:.2f}s)".format(**locals()), flush=True)
+
+    report(watcher.build(force=True))
+    try:
+        while True:
+            changed = watcher.wait_for_change()
+            logger.info("Changed: {}".format(sorted(changed)))
+            report(watcher.build())
+    except KeyboardInterrupt:
+        pass
+
+@cli.command("preview")
+@click.option('--css', '-c', help='CSS file to use instead of the built-in mdfic CSS.')
+@click.option('--host', type=str, default='127.0.0.1', help="Address to listen on. (default 127.0.0.1)")
+@click.option('--port', '-p', type=int, default=8000, help="Port to listen on. (default 8000)")
+@click.option('--interval', type=float, default=0.5, help="Seconds between checks for changes. (default 0.5)")
+@click.option('--open/--no-open', 'open_browser', default=False, help="Open the preview in a browser.")
+@click.argument('files', nargs=-1, required=True)
+def preview(css,host,port,interval,open_browser,files):
+    """
+    Serve a live-reloading HTML preview of a story.
+    """
+    from .preview import Preview, make_server
+
+    server = make_server(Preview(files, css=css, interval=interval), host=host, port=port)
+    url = "http://{}:{}/".format(*server.server_address[:2])
+    print("Serving {} at {}".format(' '.join(files), url), flush=True)
+    if open_browser:
+        import webbrowser
+        webbrowser.open(url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.preview.stop()
+        server.server_close()
+
+
+@cli.command("serve")
+@click.option('--socket', 'path', type=str, help="Unix socket to listen on. (default: $MDFIC_SOCKET, or mdfic.sock in $XDG_RUNTIME_DIR)")
+@click.option('--idle-timeout', type=float, help="Exit after this many seconds without a request.")
+@click.option('--stop', is_flag=True, help="Stop the running daemon instead.")
+def serve(path,idle_timeout,stop):
+    """
+    Run a daemon that keeps mdfic's imports, the docx templates and
+    pandoc warm.  While it is running, other mdfic commands are run
+    by it instead of starting from scratch.  Set MDFIC_NO_DAEMON to
+    run a command in-process anyway.
+    """
+    from .serve import serve as run_server, stop as stop_server, ServeError
+
+    if stop:
+        if not stop_server(path):
+            raise click.ClickException("mdfic serve isn't running")
+        return
+    try:
+        run_server(path, idle_timeout=idle_timeout)
+    except ServeError as e:
+        raise click.ClickException(str(e))
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == '__main__':
@@ -0,0 +1,151 @@
+"""
+mdfic.client - The `mdfic` command, which hands its work to `mdfic serve`.
+
+If a daemon started with `mdfic serve` is listening on the socket, the
+command line, working directory, environment and umask are sent to it
+along with this process's stdin, stdout and stderr, and the daemon runs
+the command in a forked copy of itself that already has everything
+imported.  The exit status comes back over the socket.  If there is no
+daemon, or MDFIC_NO_DAEMON is set, the command runs in this process.
+
+This module is imported on every run, so it imports nothing heavy.
+
+    MDFIC_SOCKET     the daemon's socket (default: mdfic.sock in
+                     $XDG_RUNTIME_DIR, or mdfic-UID.sock in /tmp)
+    MDFIC_NO_DAEMON  run every command in-process
+"""
+
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+
+# Commands that always run in this process: the daemon itself and
+# the long-running ones that watch files for the user.
+LOCAL_COMMANDS = {'serve', 'watch', 'preview'}
+
+# Options of the `mdfic` group that take a value.
+GROUP_OPTIONS = {'--profile', '--profile-stage', '--trace', '--trace-file'}
+
+HEADER = struct.Struct('!I')
+STATUS = struct.Struct('!i')
+
+
+def socket_path():
+    if os.environ.get('MDFIC_SOCKET'):
+        return os.environ['MDFIC_SOCKET']
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(os.environ['XDG_RUNTIME_DIR'], 'mdfic.sock')
+    return os.path.join(os.environ.get('TMPDIR') or '/tmp', 'mdfic-{}.sock'.format(os.getuid()))
+
+
+def command(argv):
+    """
+    The name of the subcommand in an mdfic command line, or None.
+    """
+    args = iter(argv)
+    for arg in args:
+        if arg in GROUP_OPTIONS:
+            next(args, None)
+        elif not arg.startswith('-'):
+            return arg
+    return None
+
+
+def send_message(sock, message, fds=()):
+    """
+    Send a length-prefixed JSON message, passing fds with it.
+    """
+    data = json.dumps(message).encode('utf8')
+    data = HEADER.pack(len(data)) + data
+    sent = socket.send_fds(sock, [data], list(fds))
+    if sent < len(data):
+        sock.sendall(data[sent:])
+
+
+def recv_message(sock, maxfds=0):
+    """
+    Receive a message from `send_message()` and return it
+    with the list of file descriptors that came with it.
+    """
+    data, fds, _, _ = socket.recv_fds(sock, 1 << 16, maxfds)
+    try:
+        while len(data) < HEADER.size or len(data) < HEADER.size + HEADER.unpack_from(data)[0]:
+            more = sock.recv(1 << 16)
+            if not more:
+                raise ConnectionError("connection closed in the middle of a message")
+            data += more
+        return json.loads(data[HEADER.size:]), fds
+    except BaseException:
+        for fd in fds:
+            os.close(fd)
+        raise
+
+
+def recv_status(sock):
+    data = b''
+    while len(data) < STATUS.size:
+        more = sock.recv(STATUS.size - len(data))
+        if not more:
+            raise ConnectionError("connection closed before the exit status")
+        data += more
+    return STATUS.unpack(data)[0]
+
+
+def connect(path=None):
+    """
+    Connect to the daemon, or return None if it isn't running.  The
+    socket must be ours: commands carry the environment with them.
+    """
+    path = path or socket_path()
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def forward(argv, path=None):
+    """
+    Run an mdfic command line in the daemon and return its exit
+    status, or None if it has to run in this process instead.
+    """
+    if os.environ.get('MDFIC_NO_DAEMON') or command(argv) in LOCAL_COMMANDS:
+        return None
+    sock = connect(path)
+    if sock is None:
+        return None
+    umask = os.umask(0)
+    os.umask(umask)
+    request = dict(argv=list(argv), cwd=os.getcwd(), env=dict(os.environ), umask=umask)
+    with sock:
+        try:
+            send_message(sock, request, fds=[0, 1, 2])
+        except OSError:
+            # e.g. one of our standard streams is closed
+            return None
+        try:
+            return recv_status(sock)
+        except KeyboardInterrupt:
+            return 130
+        except ConnectionError as e:
+            print("mdfic: lost the connection to mdfic serve: {}".format(e), file=sys.stderr)
+            return 1
+
+
+def main():
+    status = forward(sys.argv[1:])
+    if status is None:
+        from .cli import cli
+        cli(prog_name='mdfic')
+    sys.exit(status)
@@ -1,9 +1,12 @@
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import keyring
 import os
 import logging
+import queue
 
 
 import mdfic.utils
@@ -20,13 +23,32 @@ except KeyError:
 
 MODEL_NAME = os.environ.get('MDFIC_MODEL_NAME', 'gpt-5-mini')
 MAX_WORDS = int(os.environ.get('MDFIC_MAX_WORDS', '80000'))
+# Any OpenAI-compatible server, e.g. benchmarks.mock_llm
+BASE_URL = os.environ.get('MDFIC_OPENAI_BASE_URL') or None
+JOBS = int(os.environ.get('MDFIC_COPYEDIT_JOBS', '1'))
+MAX_RETRIES = int(os.environ.get('MDFIC_MAX_RETRIES', '2'))
 
 log.info(f"Using model {MODEL_NAME}, with a {MAX_WORDS} word limit.")
 
-model = ChatOpenAI(
-    openai_api_key = OPENAI_API_KEY,
-    model_name = MODEL_NAME,
-)
+
+def chat_model(base_url=BASE_URL, max_retries=MAX_RETRIES, **kwargs):
+    """
+    The chat model copyedit talks to.  Rate-limited and failed
+    requests are retried max_retries times with backoff.
+    """
+    api_key = OPENAI_API_KEY
+    if api_key is None and base_url:
+        # local servers don't check the key, but the client wants one
+        api_key = os.environ.get('OPENAI_API_KEY', 'unused')
+    return ChatOpenAI(
+        openai_api_key = api_key,
+        model_name = MODEL_NAME,
+        base_url = base_url,
+        max_retries = max_retries,
+        **kwargs,
+    )
+
+model = chat_model()
 
 editprompt = ChatPromptTemplate.from_template("""
 You are a helpful and diligent copy editor.  
@@ -63,24 +85,84 @@ copy_editor_chain = (
 )
 
 
-def copyedit(input_text,strength="light"):
+def split_story(input_text, max_words=None):
+    """
+    Split a story into its metadata block and the chunks of
+    text to send to the model, each about max_words long.
+    """
     metadata,story = mdfic.utils.split_metadata_and_text(input_text)
-    chunks = list(t for _,t in mdfic.tweets.generate(story, maxlen = MAX_WORDS * 6, add_counter=False))
-
-    edited_chunks = []
-    for i,c in enumerate(chunks):
+    maxlen = (max_words or MAX_WORDS) * 6
+    return metadata, [t for _,t in mdfic.tweets.generate(story, maxlen=maxlen, add_counter=False)]
+
+def stream_chunks(chunks, strength="light", jobs=None):
+    """
+    Copyedit chunks of text, up to jobs of them at once, and yield
+    (chunk number, text) pieces in order as the model writes them:
+    all of the first chunk, then all of the second, and so on.
+    Later chunks are held back until the ones before are done.
+    Each chunk starts with an empty piece, even if the model
+    returns nothing for it.
+    """
+    def messages(i):
         log.info(f"Sending chunk {i+1} of {len(chunks)}.")
-        msg = dict(strength=strength, text=c.strip())
-        edited_chunks.append(copy_editor_chain.invoke(msg))
-
-    edited_story = "\n\n".join(edited_chunks)
-
-    return f"""\
----
-{metadata.strip()}
-...
-
-{edited_story}
-"""
-    
-    
\ No newline at end of file
+        return dict(strength=strength, text=chunks[i].strip())
+
+    jobs = max(1, min(jobs or JOBS, len(chunks)))
+    if jobs == 1:
+        for i in range(len(chunks)):
+            yield i, ''
+            for piece in copy_editor_chain.stream(messages(i)):
+                yield i, piece
+        return
+
+    queues = [queue.SimpleQueue() for _ in chunks]
+
+    def edit(i):
+        try:
+            for piece in copy_editor_chain.stream(messages(i)):
+                queues[i].put(piece)
+            queues[i].put(None)
+        except BaseException as e:
+            queues[i].put(e)
+
+    pool = ThreadPoolExecutor(jobs)
+    try:
+        for i in range(len(chunks)):
+            pool.submit(edit, i)
+        for i, q in enumerate(queues):
+            yield i, ''
+            for piece in iter(q.get, None):
+                if isinstance(piece, BaseException):
+                    raise piece
+                yield i, piece
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def edit_chunks(chunks, strength="light", jobs=None):
+    """
+    Copyedit chunks of text, up to jobs of them at once, and
+    yield the edited chunks in order as they are ready.
+    """
+    for _, pieces in itertools.groupby(stream_chunks(chunks, strength, jobs), key=lambda p: p[0]):
+        yield ''.join(piece for _, piece in pieces)
+
+def copyedit_stream(input_text,strength="light",jobs=None,max_words=None):
+    """
+    Copyedit a story, yielding the front matter and then the
+    edited text a piece at a time, in order, as it arrives.
+    """
+    metadata,chunks = split_story(input_text, max_words)
+    if metadata is not None:
+        yield f"---\n{metadata.strip()}\n...\n\n"
+    last = None
+    for i, piece in stream_chunks(chunks, strength, jobs):
+        if i != last:
+            if last is not None:
+                yield "\n\n"
+            last = i
+        yield piece
+    yield "\n"
+
+
+def copyedit(input_text,strength="light",jobs=None,max_words=None):
+    return ''.join(copyedit_stream(input_text, strength, jobs, max_words))
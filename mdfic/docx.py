@@ -16,7 +16,15 @@ from xml.dom import minidom
 import datetime
 import re
 import os
-from .utils import get_in, int_to_roman
+import functools
+import io
+import tempfile
+from .utils import get_in, int_to_roman, parse_metadata, pandoc, atomic_write
+from .utils import cache_dir, package_version, rezip, zip_date_time
+from .utils import CROSS_REFERENCE, count_scenes, split_metadata_and_text, split_scenes
+from .pandoc import default_jobs, run_many
+from .instrument import stage
+from .trace import tracer
 
 
 ############################################################
@@ -26,6 +34,7 @@ from .utils import get_in, int_to_roman
 import logging
 
 logger = logging.getLogger(__name__)
+trace = tracer(__name__)
 
 METADATA_DEFAULTS = dict(
     title = "Untitled",
@@ -40,9 +49,69 @@ DOCX_HEADER_TEMPLATE = """
 <?xml version="1.0" ?><w:hdr mc:Ignorable="w14" xmlns:m="http://schemas.openxmlformats.org/officeDocument/2006/math" xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006" xmlns:o="urn:schemas-microsoft-com:office:office" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" xmlns:v="urn:schemas-microsoft-com:vml" xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" xmlns:w10="urn:schemas-microsoft-com:office:word" xmlns:w14="http://schemas.microsoft.com/office/word/2010/wordml" xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" xmlns:wpg="http://schemas.microsoft.com/office/word/2010/wordprocessingGroup" xmlns:wps="http://schemas.microsoft.com/office/word/2010/wordprocessingShape"><w:p><w:pPr><w:pStyle w:val="Footnote"/><w:jc w:val="right"/></w:pPr><w:r><w:t>{author} / {title} / </w:t></w:r><w:r><w:fldChar w:fldCharType="begin" w:fldLock="0"/></w:r><w:r><w:instrText xml:space="preserve"> PAGE </w:instrText></w:r><w:r><w:fldChar w:fldCharType="separate" w:fldLock="0"/></w:r><w:r><w:t>11</w:t></w:r><w:r><w:fldChar w:fldCharType="end" w:fldLock="0"/></w:r></w:p></w:hdr>
 """.strip()
 
+# Stories with at least this many scenes are converted in parallel.
+PARALLEL_SCENES = 8
+
 DOCX_RELS_FILENAME = 'word/_rels/document.xml.rels'
 DOCX_DOC_FILENAME = 'word/document.xml'
 
+# Bump when set_sffms_styles changes, so cached templates are rebuilt.
+SFFMS_STYLE_VERSION = 1
+
+def base_document(sffms=False):
+    """
+    A new document with the manuscript margins, and with
+    the SFFMS styles applied if sffms is True.
+    """
+    doc = docx.Document()
+    doc.sections[0].left_margin = Length(Inches(1))
+    doc.sections[0].right_margin = Length(Inches(1))
+    if sffms:
+        set_sffms_styles(doc)
+    return doc
+
+def sffms_template_path():
+    """
+    Where the SFFMS-styled template is cached, named for the mdfic
+    and python-docx versions that built it.
+    """
+    name = "sffms-template-{}-{}-{}.docx".format(
+        package_version('mdfic'), package_version('python-docx'), SFFMS_STYLE_VERSION)
+    return os.path.join(cache_dir(), name)
+
+@functools.lru_cache(maxsize=None)
+def template_bytes(sffms=False):
+    """
+    The base document (see `base_document`) as .docx bytes, built
+    once per process.  New documents are opened from these bytes.
+    The SFFMS-styled template is also cached on disk, so styling
+    it is paid once per mdfic and python-docx version rather than
+    once per document or process.
+    """
+    if not sffms:
+        buf = io.BytesIO()
+        base_document().save(buf)
+        return buf.getvalue()
+
+    path = sffms_template_path()
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        pass
+
+    buf = io.BytesIO()
+    base_document(sffms=True).save(buf)
+    data = buf.getvalue()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_write(path, 'wb') as f:
+            f.write(data)
+        logger.info("Cached SFFMS template in {}".format(path))
+    except OSError as e:
+        logger.warning("Can't cache SFFMS template in {}: {}".format(path, e))
+    return data
+
 def set_sffms_styles(d):
     
     for s in d.styles:
@@ -51,7 +120,7 @@ def set_sffms_styles(d):
             s.font.size = Pt(12)
             s.font.color.rgb = docx.shared.RGBColor(0,0,0)
         except AttributeError:
-            logger.warn("Error setting font info for style {s}".format(s=s))
+            logger.warning("Error setting font info for style {s}".format(s=s))
 
         if s.name == 'Normal':
             s.paragraph_format.line_spacing = 2.0
@@ -126,8 +195,9 @@ def xml_rel_nums(xml):
 
 class HTML2DOCX(HTMLParser):
 
-    def __init__(self,metadata,sffms=False):
-        self.metadata = METADATA_DEFAULTS
+    def __init__(self,metadata,sffms=False,source_date=None):
+        self.source_date = source_date
+        self.metadata = dict(METADATA_DEFAULTS)
         self.metadata.update(metadata)
         self.tag_attrs = {}
         self.sffms = sffms
@@ -162,22 +232,19 @@ class HTML2DOCX(HTMLParser):
         super().reset()
         # Add a two column table at the top with the contact info
         # and space for the wordcount
-        self.doc = docx.Document()
+        self.doc = docx.Document(io.BytesIO(template_bytes(self.sffms)))
         self.doc.core_properties.author = self.author
         self.doc.core_properties.title = self.title
-        self.doc.core_properties.created = self.doc.core_properties.modified = datetime.datetime.now()
+        # python-docx wants a naive UTC time
+        created = (self.source_date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+                   if self.source_date else datetime.datetime.now())
+        self.doc.core_properties.created = self.doc.core_properties.modified = created
         self.doc.core_properties.category = 'story'
 
         logger.debug("NUM SECTIONS = {}".format(len(self.doc.sections)))
-
-        self.doc.sections[0].left_margin = Length(Inches(1))
-        self.doc.sections[0].right_margin = Length(Inches(1))
-
         logger.debug("section[0] left margin = {}".format(self.doc.sections[0].left_margin))
         logger.debug("section[0] right margin = {}".format(self.doc.sections[0].right_margin))
 
-        if self.sffms:
-            set_sffms_styles(self.doc)
         self.top_table = self.doc.add_table(rows=1,cols=2)
         self.addr_cell = self.top_table.cell(0,0)
         self.wordcount_cell = self.top_table.cell(0,1)
@@ -193,6 +260,9 @@ class HTML2DOCX(HTMLParser):
         self.doc.add_paragraph("By " + self.author, style='Normal').paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
 
         self.current_paragraph = self.doc.add_paragraph('', style='Normal')
+        # (bold, italic) of each paragraph style; looking a style up
+        # through python-docx scans every style in the document
+        self.style_emphasis = {}
         self.stack = []
         self.emphasis = 0
         self.strong = 0
@@ -218,16 +288,24 @@ class HTML2DOCX(HTMLParser):
         self.close()
 
         if self.sffms:
-            # If using SFFMS style, add a header to each page
-            tmpfilename = filename + ".tmp"
+            # If using SFFMS style, add a header to each page.
+            # The temporary file is unique so parallel builds can't collide.
+            fd, tmpfilename = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)),
+                                               prefix='.' + os.path.basename(filename) + '.',
+                                               suffix='.tmp')
+            os.close(fd)
             logger.info("saving temporary file: {}".format(tmpfilename))
-            self.doc.save(tmpfilename)
+            with stage('docx.save') as st:
+                self.doc.save(tmpfilename)
+                st.add_bytes(os.path.getsize(tmpfilename))
 
             try:
                 # Add header
                 logger.info("adding header")
-                with zipfile.ZipFile(tmpfilename,mode='r') as oldzip:
-                    with zipfile.ZipFile(filename,mode='w') as newzip:
+                with stage('docx.header', os.path.getsize(tmpfilename)), \
+                     zipfile.ZipFile(tmpfilename,mode='r') as oldzip, \
+                     atomic_write(filename,'wb') as out:
+                    with zipfile.ZipFile(out,mode='w') as newzip:
                         for i,name in enumerate(oldzip.namelist()):
                             if name == '[Content_Types].xml':
                                 oldxml = oldzip.read(name)
@@ -248,7 +326,13 @@ class HTML2DOCX(HTMLParser):
             finally:
                 os.remove(tmpfilename)
         else:
-            self.doc.save(filename)
+            with stage('docx.save') as st, atomic_write(filename,'wb') as out:
+                self.doc.save(out)
+                st.add_bytes(out.tell())
+
+        if self.source_date:
+            with stage('docx.rezip', os.path.getsize(filename)):
+                rezip(filename, zip_date_time(self.source_date), first=('[Content_Types].xml',))
 
 
     def add_header_content_override(self,contentxmlstr):
@@ -304,7 +388,8 @@ class HTML2DOCX(HTMLParser):
 
         self.stack.append((tag,dict(attrs)))
 
-        logger.debug("starttag: {tag}. stack = {self.stack}".format(**locals()))
+        if trace.on:
+            trace('starttag', tag=tag, stack=[t for t, _ in self.stack])
 
         if isstrong(tag):
             self.strong += 1
@@ -324,7 +409,7 @@ class HTML2DOCX(HTMLParser):
         elif tag == 'hr':
             self.insert_scene_break()
         elif tag == 'a':
-            logger.info("Got anchor tag. attrs = {}".format(attrs))
+            logger.info("Got anchor tag. attrs = %s", attrs)
         elif re.fullmatch("[Hh][1-3]",tag):
             self.current_paragraph = self.doc.add_paragraph(style="Heading "+tag[1])
 
@@ -342,7 +427,8 @@ class HTML2DOCX(HTMLParser):
 
     def handle_endtag(self,tag):
 
-        logger.debug("endtag: {tag}. stack = {self.stack}".format(**locals()))
+        if trace.on:
+            trace('endtag', tag=tag, stack=[t for t, _ in self.stack])
 
         starttag,attrs = self.stack.pop()
         if tag != starttag:
@@ -361,17 +447,69 @@ class HTML2DOCX(HTMLParser):
 
     def handle_data(self,data):
 
-        logger.debug( "----" )
-        logger.debug(u"Adding data: '{data}'".format(**locals()))
-        logger.debug("stack = {self.stack}".format(**locals()))
-        logger.debug("----")
+        if trace.on:
+            trace('data', data=data, stack=[t for t, _ in self.stack])
 
         # skip data that's outside any tags.
         if self.stack:
+            bold, italic = self.paragraph_emphasis()
             run = self.current_paragraph.add_run(data)
-            run.bold = self.current_paragraph.style.font.bold or self.strong > 0
-            run.italic = self.current_paragraph.style.font.italic or self.emphasis > 0
+            run.bold = bold or self.strong > 0
+            run.italic = italic or self.emphasis > 0
             self.wordcount += len(data.split())
 
+    def paragraph_emphasis(self):
+        """
+        Whether the current paragraph's style is bold and italic.
+        """
+        style_id = self.current_paragraph._p.style
+        try:
+            return self.style_emphasis[style_id]
+        except KeyError:
+            font = self.current_paragraph.style.font
+            flags = self.style_emphasis[style_id] = (font.bold, font.italic)
+            return flags
+
 
+def html_fragments(input, jobs=None):
+    """
+    Convert a markdown story to HTML for HTML2DOCX and yield the
+    fragments in order.  Long stories are split at their scene
+    breaks and the scenes converted several at once, with an
+    <hr /> fed between them where pandoc would have put one.
+    Stories with footnotes or reference links are converted whole.
+    """
+    jobs = jobs or default_jobs()
+    _, text = split_metadata_and_text(input)
+    if jobs < 2 or CROSS_REFERENCE.search(text) or count_scenes(text) < PARALLEL_SCENES:
+        yield pandoc(input, '--from=markdown', '--to=html')
+        return
+
+    scenes = split_scenes(text)
+    results = run_many([(scene, ('--from=markdown', '--to=html')) for scene in scenes], jobs=jobs)
+    for i, result in enumerate(results):
+        if i > 0:
+            yield '<hr />\n'
+        yield result.output
 
+
+def render_docx(input, output, sffms=False, date=True, metadata=None, jobs=None, source_date=None):
+    """
+    Render a markdown story to a .docx file.  If date is True,
+    today's date is added to the title page.  jobs is the most
+    pandoc runs at once for long stories (see `html_fragments`).
+    Given a source_date (see `utils.source_date`), the build is
+    reproducible: that date is used instead of today's, and the
+    zip entries are written in a fixed order with fixed times.
+    """
+    if metadata is None:
+        metadata = parse_metadata(input,join='\n')
+    metadata = dict(metadata)
+    if date:
+        metadata['date'] = (source_date or datetime.datetime.today()).strftime('%Y-%m-%d %H:%M')
+    with stage('docx.template'):
+        hdocx = HTML2DOCX(metadata,sffms=sffms,source_date=source_date)
+    for html in html_fragments(input, jobs):
+        with stage('docx.feed', len(html)):
+            hdocx.feed(html)
+    hdocx.save(output)
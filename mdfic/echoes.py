@@ -0,0 +1,189 @@
+"""
+mdfic.echoes - Find repeated phrases and nearby word echoes.
+
+The manuscript is tokenized once into an array of word ids.  Repeated
+n-grams are found with a rolling hash over that array, and echoes (the
+same word again within a few words) with a single scan remembering
+where each word was last seen, so both take time linear in the length
+of the manuscript.  Phrases never span sentences or paragraphs, and
+locations are reported by chapter, scene and paragraph.  Chapters are
+numbered as `mdfic.stats` numbers them: text before the first chapter
+heading is chapter 0.
+"""
+
+from array import array
+from collections import defaultdict
+import re
+
+from .stats import blocks
+from .tweets import SENTENCE_DELIM
+
+WORD = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+
+# Phrases made only of these, and echoes of these, aren't reported.
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because
+been before being below between both but by can could did do does doing
+down during each few for from further had has have having he her here hers
+herself him himself his how i if in into is it its itself just me more most
+my myself no nor not now of off on once only or other our ours ourselves out
+over own same she should so some such than that the their theirs them
+themselves then there these they this those through to too under until up
+very was we were what when where which while who whom why will with would
+you your yours yourself yourselves said says say like one back
+""".split())
+
+_MOD = (1 << 61) - 1
+_BASE = 1000003
+
+
+class Tokens:
+    """
+    A manuscript as arrays: the id of each word, the paragraph and
+    sentence each word is in, and the chapter, scene (within the
+    chapter) and paragraph (within the scene) of each paragraph.
+    """
+
+    def __init__(self, text):
+        self.words = []
+        ids = {}
+        self.ids = array('I')
+        self.paragraph = array('I')
+        self.sentence = array('I')
+        self.paragraph_chapter = array('I')
+        self.paragraph_scene = array('I')
+        self.paragraph_number = array('I')
+
+        chapter, scene, number, sentence = 0, 0, 0, 0
+        new_scene = True
+        for kind, para in blocks(text):
+            if kind == 'chapter':
+                chapter, scene = chapter + 1, 0
+                new_scene = True
+                continue
+            if kind == 'scene':
+                new_scene = True
+                continue
+            if new_scene:
+                scene, number, new_scene = scene + 1, 0, False
+            number += 1
+            p = len(self.paragraph_number)
+            self.paragraph_chapter.append(chapter)
+            self.paragraph_scene.append(scene)
+            self.paragraph_number.append(number)
+            for part in SENTENCE_DELIM.split(para.lower()):
+                sentence += 1
+                for word in WORD.findall(part):
+                    i = ids.get(word)
+                    if i is None:
+                        i = ids[word] = len(self.words)
+                        self.words.append(word)
+                    self.ids.append(i)
+                    self.paragraph.append(p)
+                    self.sentence.append(sentence)
+
+    def location(self, position):
+        """
+        The (chapter, scene, paragraph) of the word at position.
+        """
+        p = self.paragraph[position]
+        return (self.paragraph_chapter[p], self.paragraph_scene[p], self.paragraph_number[p])
+
+    def stop_ids(self, ignore=()):
+        stop = STOPWORDS | set(w.lower() for w in ignore)
+        return array('b', (w in stop for w in self.words))
+
+
+def repeated_phrases(tokens, n=3, min_count=2):
+    """
+    Return the n-word phrases that occur at least min_count times,
+    most frequent first, as dicts with the phrase, its count and
+    the location of each occurrence.  Phrases of stop words only,
+    or that span sentences, are skipped.
+    """
+    ids, sentence = tokens.ids, tokens.sentence
+    stop = tokens.stop_ids()
+    drop = pow(_BASE, n - 1, _MOD)
+    starts = defaultdict(list)
+    h = stops = 0
+    for i, t in enumerate(ids):
+        if i >= n:
+            h = (h - (ids[i - n] + 1) * drop) % _MOD
+            stops -= stop[ids[i - n]]
+        h = (h * _BASE + t + 1) % _MOD
+        stops += stop[t]
+        start = i - n + 1
+        if start >= 0 and stops < n and sentence[start] == sentence[i]:
+            starts[h].append(start)
+
+    found = []
+    for positions in starts.values():
+        if len(positions) < min_count:
+            continue
+        # different phrases can share a hash
+        phrases = defaultdict(list)
+        for s in positions:
+            phrases[tuple(ids[s:s + n])].append(s)
+        for phrase, at in phrases.items():
+            if len(at) >= min_count:
+                found.append(dict(
+                    phrase=' '.join(tokens.words[w] for w in phrase),
+                    count=len(at),
+                    locations=[tokens.location(s) for s in at]))
+    found.sort(key=lambda f: (-f['count'], f['locations'][0]))
+    return found
+
+
+def echoes(tokens, distance=30, min_length=4, ignore=()):
+    """
+    Return the words (of at least min_length letters, and not stop
+    words) that come back within distance words of their last use,
+    as dicts with the word, how many times it occurs in the run of
+    echoes, the number of words the run spans and its locations.
+    """
+    ids = tokens.ids
+    stop = tokens.stop_ids(ignore)
+    short = array('b', (len(w) < min_length for w in tokens.words))
+    runs = {}
+    found = []
+
+    def finish(run):
+        if len(run) > 1:
+            found.append(run)
+
+    for i, t in enumerate(ids):
+        if stop[t] or short[t]:
+            continue
+        run = runs.get(t)
+        if run is not None and i - run[-1] <= distance:
+            run.append(i)
+        else:
+            if run is not None:
+                finish(run)
+            runs[t] = [i]
+    for run in runs.values():
+        finish(run)
+
+    found.sort()
+    return [dict(word=tokens.words[ids[run[0]]], count=len(run), span=run[-1] - run[0] + 1,
+                 locations=sorted(set(tokens.location(i) for i in run)))
+            for run in found]
+
+
+def format_location(location):
+    return "ch{} sc{} p{}".format(*location)
+
+
+def format_report(phrases, found):
+    """
+    Format the results of `repeated_phrases()` and `echoes()` as text.
+    """
+    lines = ["repeated phrases:"]
+    for p in phrases:
+        lines.append("  {:>4}x  {:<30}  {}".format(
+            p['count'], p['phrase'], ', '.join(map(format_location, p['locations']))))
+    lines += ["", "echoes:"]
+    for e in found:
+        lines.append("  {:<16} {}x in {:>3} words  {}".format(
+            e['word'], e['count'], e['span'], ', '.join(map(format_location, e['locations']))))
+    return '\n'.join(lines)
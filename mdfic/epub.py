@@ -0,0 +1,309 @@
+"""
+mdfic.epub - Build EPUB 3 books from mdfic's own HTML rendering.
+
+The story is converted to an HTML fragment by pandoc, split into one
+XHTML file per chapter at its top-level headings, and given mdfic's
+scene breaks and CSS.  The package document and navigation are built
+from the story's YAML metadata and everything is zipped here, without
+running pandoc's EPUB writer.
+
+Long books with many chapters are converted in several pandoc runs at
+once, each on a contiguous group of chapters; shorter ones, and books
+with footnotes or reference links that could span chapters, are
+converted in a single run.
+"""
+
+import html as htmlmod
+import os
+import re
+import time
+import uuid
+import zipfile
+
+from .instrument import stage
+from .pandoc import run_many
+from .utils import atomic_write, get_in, int_to_roman, pandoc, parse_metadata, split_metadata_and_text
+from .utils import zip_date_time
+from .utils import CHAPTER_HEADING, CROSS_REFERENCE
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Books with at least this many chapters are converted in parallel.
+PARALLEL_CHAPTERS = 8
+
+PANDOC_ARGS = ('--from=markdown', '--to=html5', '--reference-location=section')
+
+# pandoc's rendering of a chapter heading.
+HTML_CHAPTER = re.compile(r'(?=<h1[ >])')
+
+# The footnotes pandoc puts at the end of each section, which start
+# with a rule of their own: id="footnotes", then "footnotes-2", ...
+FOOTNOTES = re.compile(r'(<aside id="footnotes(?:-\d+)?"[^>]*>.*?</aside>)', re.DOTALL)
+
+EPUB_CSS = """
+.scene-break {
+  text-align: center;
+  font-weight: bold;
+  margin: 1em 0;
+}
+"""
+
+CONTAINER = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="EPUB/package.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+XHTML = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="{lang}" xml:lang="{lang}">
+<head>
+<meta charset="utf-8" />
+<title>{title}</title>
+<link rel="stylesheet" type="text/css" href="style.css" />
+</head>
+<body{body_type}>
+{body}
+</body>
+</html>
+"""
+
+TITLE_PAGE = """<section epub:type="titlepage">
+<h1 class="title">{title}</h1>
+{subtitle}{author}</section>"""
+
+NAV = """<nav epub:type="toc" id="toc">
+<h1>{title}</h1>
+<ol>
+{items}
+</ol>
+</nav>"""
+
+PACKAGE = """<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="uid" xml:lang="{lang}">
+<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+<dc:identifier id="uid">{identifier}</dc:identifier>
+<dc:title>{title}</dc:title>
+{creators}<dc:language>{lang}</dc:language>
+<meta property="dcterms:modified">{modified}</meta>
+</metadata>
+<manifest>
+<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+<item id="css" href="style.css" media-type="text/css"/>
+<item id="title" href="title.xhtml" media-type="application/xhtml+xml"/>
+{items}
+</manifest>
+<spine>
+<itemref idref="title"/>
+{itemrefs}
+</spine>
+</package>
+"""
+
+
+def stylesheet(css=None):
+    """
+    Return the book's stylesheet: the contents of the file css
+    or mdfic's default CSS, without any <style> wrapper, plus
+    the styles for scene breaks.
+    """
+    if css:
+        with open(css) as f:
+            text = f.read()
+    else:
+        from .css import CSS as text
+    text = re.sub(r'</?style[^>]*>', '', text)
+    return text.strip() + '\n' + EPUB_CSS
+
+
+def markdown_chunks(text, n):
+    """
+    Split the markdown text into at most n pieces of roughly equal
+    size, each starting at a chapter heading (except the first,
+    which also holds anything before the first chapter).
+    """
+    starts = [m.start() for m in CHAPTER_HEADING.finditer(text)]
+    if not starts or n < 2:
+        return [text]
+    bounds = [0]
+    size = len(text) / n
+    for s in starts:
+        if s > 0 and s >= len(bounds) * size:
+            bounds.append(s)
+    bounds.append(len(text))
+    return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+def render_fragment(input, jobs=1):
+    """
+    Convert the story (with its metadata block) to an HTML fragment,
+    in up to `jobs` concurrent pandoc runs for long books.
+    """
+    _, text = split_metadata_and_text(input)
+    chapters = len(CHAPTER_HEADING.findall(text))
+    if jobs < 2 or chapters < PARALLEL_CHAPTERS or CROSS_REFERENCE.search(text):
+        return pandoc(input, *PANDOC_ARGS)
+
+    chunks = markdown_chunks(text, jobs)
+    logger.debug("Converting {} chapters in {} pandoc runs".format(chapters, len(chunks)))
+    results = run_many([(chunk, PANDOC_ARGS) for chunk in chunks], jobs=jobs)
+    return ''.join(r.output for r in results)
+
+
+def heading_text(html):
+    """
+    Return the plain text of an HTML fragment.
+    """
+    return htmlmod.unescape(re.sub(r'<[^>]+>', '', html)).strip()
+
+
+def split_chapters(fragment):
+    """
+    Split an HTML fragment at its <h1> headings and return a list
+    of (title, html) pairs.  Text before the first heading becomes
+    a chapter with no title.
+    """
+    chapters = []
+    for part in HTML_CHAPTER.split(fragment):
+        if not part.strip():
+            continue
+        m = re.match(r'<h1[^>]*>(.*?)</h1>', part, re.DOTALL)
+        chapters.append((heading_text(m.group(1)) if m else None, part))
+    return chapters
+
+
+def scene_breaks(html, number_scenes=False):
+    """
+    Replace the <hr /> scene breaks in one chapter with centered
+    dots, or with scene numbers if number_scenes is True or 'roman'.
+    Numbered chapters also get a number for their first scene, after
+    the chapter heading.  Numbering restarts in each chapter.
+    """
+    def mark(text):
+        return '<p class="scene-break">{}</p>'.format(text)
+
+    # the odd pieces are footnotes, whose rules are left alone
+    pieces = FOOTNOTES.split(html)
+
+    if not number_scenes:
+        return ''.join(piece if i % 2 else piece.replace('<hr />', mark('• • •'))
+                       for i, piece in enumerate(pieces))
+
+    scenes = [1]
+
+    def number():
+        n = scenes[-1]
+        scenes.append(n + 1)
+        return mark(int_to_roman(n) if number_scenes == 'roman' else n)
+
+    scene, hr, rest = pieces[0].partition('<hr />')
+    head, sep, scene = scene.partition('</h1>')
+    if not sep:
+        head, scene = '', head
+    pieces[0] = head + sep + '\n' + number() + scene + hr + rest
+    for i in range(0, len(pieces), 2):
+        pieces[i] = re.sub('<hr />', lambda m: number(), pieces[i])
+    return ''.join(pieces)
+
+
+def xhtml(title, body, lang, body_type=''):
+    return XHTML.format(title=htmlmod.escape(title), body=body, lang=lang, body_type=body_type)
+
+
+def title_page(metadata):
+    title = metadata.get('title', '')
+    subtitle = metadata.get('subtitle')
+    author = metadata.get('author')
+    return TITLE_PAGE.format(
+        title=htmlmod.escape(str(title)),
+        subtitle='<p class="subtitle">{}</p>\n'.format(htmlmod.escape(str(subtitle))) if subtitle else '',
+        author='<p class="author">{}</p>\n'.format(htmlmod.escape(str(author))) if author else '')
+
+
+def identifier(metadata):
+    """
+    The book's identifier: metadata `identifier`, or a UUID
+    derived from its title and author so rebuilds keep it.
+    """
+    if metadata.get('identifier'):
+        return str(metadata['identifier'])
+    name = '{}\n{}'.format(metadata.get('title', ''), metadata.get('author', ''))
+    return 'urn:uuid:{}'.format(uuid.uuid5(uuid.NAMESPACE_URL, name))
+
+
+def package(metadata, chapters, lang, modified=None):
+    """
+    Return the OPF package document for chapter files named
+    chapter-NNN.xhtml, last modified at the datetime modified
+    (default: now).
+    """
+    authors = metadata.get('author') or []
+    if isinstance(authors, str):
+        authors = authors.split('\n')
+    return PACKAGE.format(
+        lang=lang,
+        identifier=htmlmod.escape(identifier(metadata)),
+        title=htmlmod.escape(str(metadata.get('title', ''))),
+        creators=''.join('<dc:creator>{}</dc:creator>\n'.format(htmlmod.escape(str(a))) for a in authors),
+        modified=time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                               modified.utctimetuple() if modified else time.gmtime()),
+        items='\n'.join('<item id="chapter-{0:03d}" href="chapter-{0:03d}.xhtml" '
+                        'media-type="application/xhtml+xml"/>'.format(i + 1)
+                        for i in range(len(chapters))),
+        itemrefs='\n'.join('<itemref idref="chapter-{:03d}"/>'.format(i + 1)
+                           for i in range(len(chapters))))
+
+
+def nav(metadata, chapters):
+    title = str(metadata.get('title', 'Contents'))
+    items = '\n'.join('<li><a href="chapter-{:03d}.xhtml">{}</a></li>'.format(
+                          i + 1, htmlmod.escape(chapter_title or title))
+                      for i, (chapter_title, _) in enumerate(chapters))
+    return NAV.format(title=htmlmod.escape(title), items=items)
+
+
+def render_epub(input, output, css=None, metadata=None, jobs=None, source_date=None):
+    """
+    Render a markdown story (with its metadata block) as an EPUB 3
+    book and write it to output.  css is the name of a CSS file to
+    embed instead of mdfic's default; jobs is the number of pandoc
+    runs to use at once for long books (default: the CPU count).
+    Given a source_date, the book's modification time and the
+    times of its zip entries are that date, not now.
+    """
+    if metadata is None:
+        metadata = parse_metadata(input, join='\n')
+    number_scenes = get_in(metadata, ['mdfic', 'number_scenes'], False)
+    lang = str(metadata.get('lang', 'en'))
+    title = str(metadata.get('title', ''))
+
+    fragment = render_fragment(input, jobs or os.cpu_count() or 1)
+
+    with stage('epub.chapters', len(fragment)):
+        chapters = [(chapter_title, scene_breaks(body, number_scenes))
+                    for chapter_title, body in split_chapters(fragment)]
+
+    date_time = zip_date_time(source_date) if source_date else time.localtime()[:6]
+
+    with stage('epub.write'), atomic_write(output, 'wb') as f:
+        with zipfile.ZipFile(f, 'w') as book:
+            def write(name, data, compress_type=zipfile.ZIP_DEFLATED):
+                info = zipfile.ZipInfo(name, date_time=date_time)
+                info.compress_type = compress_type
+                info.external_attr = 0o644 << 16
+                book.writestr(info, data)
+
+            # the mimetype must come first, uncompressed
+            write('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+            write('META-INF/container.xml', CONTAINER)
+            write('EPUB/package.opf', package(metadata, chapters, lang, modified=source_date))
+            write('EPUB/style.css', stylesheet(css))
+            write('EPUB/nav.xhtml', xhtml(title, nav(metadata, chapters), lang))
+            write('EPUB/title.xhtml', xhtml(title, title_page(metadata), lang,
+                                            ' epub:type="frontmatter"'))
+            for i, (chapter_title, body) in enumerate(chapters):
+                write('EPUB/chapter-{:03d}.xhtml'.format(i + 1),
+                      xhtml(chapter_title or title, body, lang, ' epub:type="bodymatter"'))
@@ -0,0 +1,366 @@
+"""
+mdfic.fromdocx - Turn a .docx manuscript back into mdfic Markdown.
+
+`word/document.xml` is read with `iterparse`, a paragraph at a time, and
+each paragraph is dropped as soon as it has been turned into Markdown,
+so memory stays flat however long the manuscript is:
+
+    with open('story.md', 'w') as out:
+        for text in docx_to_markdown('edited.docx'):
+            out.write(text)
+
+Italics and bold become `*` and `**`, heading styles become `#`
+headings, indented or quote-styled paragraphs become blockquotes, list
+styles become list items, and centered `#`, `* * *` or scene numbers
+become `---` scene breaks.  The title, author and scene numbering go in
+the YAML front matter.  Tracked changes are taken as accepted: inserted
+text is kept and deleted text dropped.  The title page, header table and
+end marker that `HTML2DOCX` adds are left out, so a story survives the
+round trip through `mdfic docx`.
+"""
+
+import logging
+import re
+import zipfile
+from xml.etree.ElementTree import iterparse, parse
+
+import yaml
+
+from .instrument import stage
+
+logger = logging.getLogger(__name__)
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+VAL = W + 'val'
+
+DOCUMENT = 'word/document.xml'
+STYLES = 'word/styles.xml'
+CORE = 'docProps/core.xml'
+
+CORE_FIELDS = {
+    '{http://purl.org/dc/elements/1.1/}title': 'title',
+    '{http://purl.org/dc/elements/1.1/}creator': 'author',
+}
+
+# What HTML2DOCX calls a story that doesn't say, and the
+# placeholders it and python-docx fill in, which aren't kept.
+UNTITLED = 'Untitled'
+PLACEHOLDERS = {UNTITLED, 'A. I. Robotsky', 'python-docx'}
+
+# At least this much left indent (in twentieths of a point) is a blockquote.
+QUOTE_INDENT = 720
+
+QUOTE_STYLES = {'quote', 'intense quote', 'block text'}
+
+# Paragraphs that are scene breaks wherever they are, and those that
+# are only scene breaks when centered.
+BREAK = re.compile(r'#|\*(?:\s*\*){2}|~(?:\s*~)*|-{3,}')
+NUMBERED_BREAK = re.compile(r'(?P<roman>[IVXLCDM]+)|(?P<arabic>\d+)')
+# `# # # # #` at the end of a manuscript, or a scene break elsewhere.
+END_MARKER = re.compile(r'#(?:\s*#){2,}')
+
+FALSE = {'0', 'false', 'off', 'none'}
+
+# Markdown that a paragraph's text could be mistaken for.
+INLINE_SPECIAL = re.compile(r'([\\*_`])')
+LINE_SPECIAL = re.compile(r'^([#>+-])(?=[ \t]|$)|^(\d+)([.)])(?=[ \t]|$)', re.MULTILINE)
+
+
+def read_styles(z):
+    """
+    Map each paragraph and character style id in a docx to its
+    lower-case name.
+    """
+    try:
+        f = z.open(STYLES)
+    except KeyError:
+        return {}
+    with f:
+        return {s.get(W + 'styleId'): s.find(W + 'name').get(VAL).lower()
+                for s in parse(f).getroot().iter(W + 'style')
+                if s.find(W + 'name') is not None}
+
+
+def read_metadata(z):
+    """
+    Front matter from a docx's core properties.
+    """
+    try:
+        f = z.open(CORE)
+    except KeyError:
+        return {}
+    metadata = {}
+    with f:
+        for elem in parse(f).getroot():
+            key = CORE_FIELDS.get(elem.tag)
+            text = (elem.text or '').strip()
+            if key and text and text not in PLACEHOLDERS:
+                metadata[key] = text
+    return metadata
+
+
+def flag(rpr, tag):
+    """
+    Whether a run's properties turn tag on, off or (None) leave it.
+    """
+    elem = rpr.find(tag)
+    if elem is None:
+        return None
+    return elem.get(VAL, 'true').lower() not in FALSE
+
+
+def escape(text):
+    return INLINE_SPECIAL.sub(r'\\\1', text)
+
+
+def escape_lines(text):
+    return LINE_SPECIAL.sub(lambda m: '\\' + m.group(1) if m.group(1) else
+                            m.group(2) + '\\' + m.group(3), text)
+
+
+def emphasize(runs):
+    """
+    Join (text, bold, italic) runs into Markdown, opening and closing
+    `*` and `**` where the formatting changes.  Markers hug the text,
+    since Markdown emphasis can't start or end with a space.
+    """
+    out = []
+    stack = []
+    pending = ''
+    for text, bold, italic in runs:
+        core = text.strip()
+        if not core:
+            pending += text
+            continue
+        lead = text[:len(text) - len(text.lstrip())]
+        trail = text[len(text.rstrip()):]
+        want = []
+        if italic:
+            want.append('*')
+        if bold:
+            want.append('**')
+        # close what is no longer wanted, and whatever was opened inside it
+        while any(m not in want for m in stack):
+            out.append(stack.pop())
+        out.append(pending + lead)
+        for marker in want:
+            if marker not in stack:
+                stack.append(marker)
+                out.append(marker)
+        out.append(escape(core))
+        pending = trail
+    out.extend(reversed(stack))
+    return ''.join(out)
+
+
+class Paragraph:
+    """
+    What a paragraph of the document is: kind is 'heading', 'title',
+    'break', 'end', 'item', 'quote' or 'text'.
+    """
+
+    __slots__ = ('kind', 'text', 'plain', 'level', 'centered', 'numbering')
+
+    def __init__(self, kind, text, plain, level=0, centered=False, numbering=None):
+        self.kind = kind
+        self.text = text
+        self.plain = plain
+        self.level = level
+        self.centered = centered
+        self.numbering = numbering
+
+
+def read_paragraph(p, styles):
+    """
+    Classify a <w:p> element and render its text as Markdown.
+    Returns None for an empty paragraph.
+    """
+    style = ''
+    centered = numbered = False
+    indent = 0
+    ppr = p.find(W + 'pPr')
+    if ppr is not None:
+        elem = ppr.find(W + 'pStyle')
+        if elem is not None:
+            style = styles.get(elem.get(VAL), elem.get(VAL, '')).lower()
+        elem = ppr.find(W + 'jc')
+        centered = elem is not None and elem.get(VAL) == 'center'
+        elem = ppr.find(W + 'ind')
+        if elem is not None:
+            try:
+                indent = int(elem.get(W + 'left') or elem.get(W + 'start') or 0)
+            except ValueError:
+                pass
+        numbered = ppr.find(W + 'numPr') is not None
+
+    moved = set()
+    for elem in p.iter(W + 'moveFrom'):
+        moved.update(elem.iter(W + 'r'))
+
+    runs = []
+    for r in p.iter(W + 'r'):
+        if r in moved:
+            continue
+        bold = italic = False
+        rpr = r.find(W + 'rPr')
+        if rpr is not None:
+            elem = rpr.find(W + 'rStyle')
+            rstyle = styles.get(elem.get(VAL), '') if elem is not None else ''
+            b, i = flag(rpr, W + 'b'), flag(rpr, W + 'i')
+            bold = b if b is not None else rstyle in ('strong', 'bold')
+            italic = i if i is not None else rstyle in ('emphasis', 'italic')
+        for child in r:
+            tag = child.tag
+            if tag == W + 't':
+                runs.append((child.text or '', bold, italic))
+            elif tag == W + 'tab':
+                runs.append((' ', bold, italic))
+            elif tag in (W + 'br', W + 'cr'):
+                runs.append(('\n', bold, italic))
+
+    plain = re.sub(r'\s+', ' ', ''.join(t for t, _, _ in runs)).strip()
+    if not plain:
+        return None
+
+    m = re.fullmatch(r'heading ([1-6])', style)
+    if m:
+        return Paragraph('heading', escape(plain), plain, level=int(m.group(1)))
+    if style == 'title':
+        return Paragraph('title', escape(plain), plain, centered=True)
+    if END_MARKER.fullmatch(plain):
+        return Paragraph('end', '', plain)
+    if BREAK.fullmatch(plain):
+        return Paragraph('break', '', plain)
+    m = NUMBERED_BREAK.fullmatch(plain)
+    if m and centered:
+        return Paragraph('break', '', plain, numbering=m.lastgroup)
+
+    text = emphasize(runs)
+    text = escape_lines('\n'.join(line.strip() for line in text.splitlines() if line.strip()))
+    if style.startswith('list number'):
+        return Paragraph('item', '1. ' + text, plain)
+    if style.startswith('list') or numbered:
+        return Paragraph('item', '- ' + text, plain)
+    if style in QUOTE_STYLES or indent >= QUOTE_INDENT:
+        return Paragraph('quote', '> ' + text.replace('\n', '\n> '), plain)
+    return Paragraph('text', text, plain, centered=centered)
+
+
+def paragraphs(f, styles):
+    """
+    Yield a `Paragraph` for each non-empty top-level paragraph of a
+    document.xml stream, skipping tables, and discarding the XML of
+    each one once it is read.
+    """
+    body = None
+    tables = 0
+    for event, elem in iterparse(f, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == W + 'tbl':
+                tables += 1
+            elif tag == W + 'body':
+                body = elem
+        elif tag == W + 'p' and not tables:
+            paragraph = read_paragraph(elem, styles)
+            body.clear()
+            if paragraph is not None:
+                yield paragraph
+        elif tag == W + 'tbl':
+            tables -= 1
+            if not tables:
+                logger.info("skipping a table")
+                body.clear()
+
+
+def front_matter(metadata):
+    return '---\n' + yaml.safe_dump(metadata, sort_keys=False, allow_unicode=True) + '...\n\n'
+
+
+def markdown(metadata, paragraphs):
+    """
+    Yield Markdown for a story's metadata and paragraphs: the front
+    matter, then each block with the blank line before it.  The front
+    matter is written when the story's first paragraph arrives, after
+    the title page and the scene number `HTML2DOCX` puts before it.
+    """
+    metadata = dict(metadata)
+    title = metadata.get('title', UNTITLED).upper()
+    author = metadata.get('author', '').upper()
+    held = []           # headings before the first paragraph
+    started = False
+    previous = None
+    end = None          # an end marker that may turn out to be a scene break
+
+    def block(p):
+        nonlocal previous
+        if p.kind == 'break':
+            text = '---'
+        elif p.kind == 'heading':
+            text = '#' * p.level + ' ' + p.text
+        else:
+            text = p.text
+        if previous is None:
+            sep = ''
+        elif p.kind == previous == 'item':
+            sep = '\n'
+        elif p.kind == previous == 'quote':
+            sep = '\n>\n'
+        else:
+            sep = '\n\n'
+        previous = p.kind
+        return sep + text
+
+    for p in paragraphs:
+        if not started:
+            upper = p.plain.upper()
+            if not held and (p.kind == 'title' or (p.centered and upper == title)):
+                if upper != UNTITLED.upper():
+                    metadata.setdefault('title', p.plain)
+                continue
+            if not held and p.centered and upper.startswith('BY ') and (
+                    not author or upper[3:].strip() == author):
+                if p.plain[3:].strip() not in PLACEHOLDERS:
+                    metadata.setdefault('author', p.plain[3:].strip())
+                continue
+            if p.kind == 'heading':
+                held.append(p)
+                continue
+            if p.kind in ('break', 'end'):
+                if p.numbering and p.plain in ('1', 'I'):
+                    metadata.setdefault('mdfic', {})['number_scenes'] = p.numbering
+                continue
+            started = True
+            yield front_matter(metadata) if metadata else ''
+            for heading in held:
+                yield block(heading)
+
+        if p.kind == 'end':
+            end = end or p
+            continue
+        if end is not None:
+            end = None
+            if previous != 'break' and p.kind != 'break':
+                yield block(Paragraph('break', '', ''))
+        if p.kind == 'break' and previous in ('break', None):
+            continue
+        yield block(p)
+
+    if not started:
+        yield front_matter(metadata) if metadata else ''
+        for heading in held:
+            yield block(heading)
+    if previous is not None:
+        yield '\n'
+
+
+def docx_to_markdown(path):
+    """
+    Read a .docx file (a path or binary file object) and yield
+    its story as mdfic Markdown, a block at a time.
+    """
+    with zipfile.ZipFile(path) as z:
+        styles = read_styles(z)
+        metadata = read_metadata(z)
+        with z.open(DOCUMENT) as f, stage('fromdocx', z.getinfo(DOCUMENT).file_size):
+            yield from markdown(metadata, paragraphs(f, styles))
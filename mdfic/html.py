@@ -0,0 +1,62 @@
+"""
+mdfic.html - Render stories to standalone HTML.
+"""
+
+from .instrument import stage
+from .utils import parse_metadata, pandoc
+from .utils import get_in, int_to_roman
+
+
+END_HTML = "<center><bold>END</bold></center>"
+
+
+def replace_scene_breaks(html, number_scenes=False):
+    """
+    Replace the <hr /> scene breaks in pandoc's standalone HTML
+    with centered dots, or with scene numbers if number_scenes is
+    True or 'roman'.  Numbered stories also get a number for the
+    first scene, right after the title block.
+    """
+    if not number_scenes:
+        return html.replace("<hr />","<center><bold>• • •</bold></center>")
+
+    scenes = html.split("<hr />")
+    html = ""
+    for i,s in enumerate(scenes):
+        scene_num = int_to_roman(i+1) if number_scenes=='roman' else i+1
+        scene_break = f"<center><bold>{scene_num}</bold></center>"
+        if i == 0:
+            h,s = s.split("</header>\n")
+            html += (h
+                 + "</header>\n"
+                 + scene_break
+                 + s)
+        else:
+            html += scene_break + s
+    return html
+
+
+def render_html(input, css=None, metadata=None, optimize=False):
+    """
+    Render a markdown story as a standalone HTML page and
+    return it as a string.  css is the name of a file to
+    include in the page header (see `mdfic css`).  With
+    optimize, the page and its style sheets are minified
+    (see `mdfic.minify`).
+    """
+    if metadata is None:
+        metadata = parse_metadata(input,join='\n')
+    number_scenes = get_in(metadata,['mdfic','number_scenes'],False)
+
+    cssargs = []
+    if css:
+        cssargs = ['-H',css]
+    html = pandoc(input, '--standalone','--from=markdown', '--to=html',*cssargs)
+
+    html += END_HTML
+    html = replace_scene_breaks(html, number_scenes)
+    if optimize:
+        from .minify import minify_html
+        with stage('minify', len(html)):
+            html = minify_html(html)
+    return html
@@ -0,0 +1,135 @@
+"""
+mdfic.instrument - Opt-in per-stage timing for mdfic commands.
+
+Code wraps each stage of its work in `stage()`:
+
+    with instrument.stage('pandoc', nbytes=len(input)):
+        ...
+
+When instrumentation is off (the default), `stage()` returns a shared
+do-nothing context manager.  When it's on, each stage records wall time,
+CPU time and bytes processed, and `write_report()` emits one JSON line
+per command, summed by stage name.  One stage can also be run under
+cProfile and dumped to a file for `pstats` or snakeviz.
+"""
+
+import json
+import sys
+import time
+
+_enabled = False
+_records = {}
+_profile_stage = None
+_profile_output = None
+_profiler = None
+
+
+class _NullStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_bytes(self, n):
+        pass
+
+NULL_STAGE = _NullStage()
+
+
+class _Stage:
+
+    def __init__(self, name, nbytes):
+        self.name = name
+        self.nbytes = nbytes
+
+    def add_bytes(self, n):
+        self.nbytes += n
+
+    def __enter__(self):
+        global _profiler
+        if self.name == _profile_stage and _profiler is None:
+            import cProfile
+            _profiler = self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.profiler = None
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        if self.profiler is not None:
+            self.profiler.disable()
+        record = _records.setdefault(self.name, dict(stage=self.name, calls=0, wall=0.0, cpu=0.0, bytes=0))
+        record['calls'] += 1
+        record['wall'] += wall
+        record['cpu'] += cpu
+        record['bytes'] += self.nbytes
+        return False
+
+
+def stage(name, nbytes=0):
+    """
+    Return a context manager timing the stage `name`.  nbytes is
+    the amount of data it processes, which can also be added
+    later with `add_bytes()`.
+    """
+    if not _enabled:
+        return NULL_STAGE
+    return _Stage(name, nbytes)
+
+
+def enabled():
+    return _enabled
+
+
+def enable(profile_stage=None, profile_output=None):
+    """
+    Turn on instrumentation.  If profile_stage is given, the first
+    run of that stage is profiled with cProfile and dumped to
+    profile_output (default `<stage>.prof`).
+    """
+    global _enabled, _profile_stage, _profile_output, _profiler
+    _enabled = True
+    _records.clear()
+    _profile_stage = profile_stage
+    _profile_output = profile_output or (profile_stage and profile_stage + '.prof')
+    _profiler = None
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def report(command=None, argv=None):
+    """
+    Return the report for the stages recorded so far.  argv is
+    the command's arguments (default: this process's).
+    """
+    return dict(
+        command = command,
+        argv = sys.argv[1:] if argv is None else list(argv),
+        stages = [dict(r, wall=round(r['wall'], 6), cpu=round(r['cpu'], 6))
+                  for r in _records.values()],
+    )
+
+
+def write_report(destination, command=None, argv=None):
+    """
+    Append the report as one JSON line to the file `destination`,
+    or to stderr if it is '-'.  Also dump the cProfile data for
+    the chosen stage, if it ran.
+    """
+    line = json.dumps(report(command, argv)) + '\n'
+    if destination == '-':
+        sys.stderr.write(line)
+    else:
+        with open(destination, 'a') as f:
+            f.write(line)
+    if _profiler is not None:
+        _profiler.dump_stats(_profile_output)
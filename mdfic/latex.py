@@ -1,4 +1,10 @@
+import hashlib
+import os
+import re
+import shutil
 from math import ceil
+from .pandoc import run_many
+from .utils import CROSS_REFERENCE, split_chapters, cache_read, cache_write, cache_prune
 from .utils import get_in
 from .utils import parse_metadata
 from .utils import pandoc
@@ -64,6 +70,41 @@ BOOK_HEADER = """
 
 
 
+BOOK_PANDOC_ARGS = ('--from=markdown', '--to=latex', '--top-level-division=chapter')
+
+# How many converted chapters to keep in the cache; the least recently
+# used beyond that are removed.
+CHAPTER_CACHE_ENTRIES = 2000
+
+# Links to a heading or other identifier, which may be in another
+# chapter, so books that have them are converted whole.
+INTERNAL_LINK = re.compile(r'\]\(#')
+
+# Where pandoc's LaTeX names a label.  pandoc ignores --id-prefix for
+# LaTeX, so chapters converted separately get prefixes added here.
+LABEL_COMMAND = re.compile(r'\\(?:label|ref|pageref|autoref|nameref|hypertarget|hyperlink)\{|\\hyperref\[')
+
+def prefix_labels(latex, prefix):
+    """
+    Prefix every label defined or referred to in latex, so that
+    chapters converted separately can't define the same label.
+    """
+    return LABEL_COMMAND.sub(lambda m: m.group(0) + prefix, latex)
+
+def pandoc_salt():
+    """
+    What besides a chapter's text decides its conversion: the
+    arguments and the pandoc binary, so cached chapters aren't
+    reused after pandoc is upgraded.
+    """
+    path = shutil.which('pandoc') or 'pandoc'
+    try:
+        st = os.stat(path)
+        binary = "{}:{}:{}".format(path, st.st_size, st.st_mtime_ns)
+    except OSError:
+        binary = path
+    return ' '.join(BOOK_PANDOC_ARGS + (binary,)) + '\n'
+
 DEFAULT_METADATA = dict(title = [], author=[], address=[], email=[] )
 SCENE_HR_TEX = "\\begin{center}\\rule{0.5\\linewidth}{0.5pt}\\end{center}"
 END_DOC = "\\end{document}\n"
@@ -148,15 +189,45 @@ class BookStory(LatexStoryBase):
 
     @property
     def latexbody(self):
-        return pandoc(
-            self.markdown,
-            '--from=markdown',
-            '--to=latex',
-            '--top-level-division=chapter',
-            '--toc',
-            '--toc-depth=1',
-        )
-
+        """
+        Convert the book a chapter at a time, running pandoc only on
+        the chapters that aren't in the cache, several at once.  The
+        table of contents comes from \\tableofcontents in the preamble.
+        Each chapter's labels get a prefix of their own (ch1-, ch2-, ...),
+        since pandoc would otherwise name two chapters' "Scene" headings
+        alike.  Books with footnotes, reference links or links to
+        identifiers are converted whole.
+        """
+        if CROSS_REFERENCE.search(self.markdown) or INTERNAL_LINK.search(self.markdown):
+            return pandoc(self.markdown, *BOOK_PANDOC_ARGS)
+
+        chapters = [c for c in split_chapters(self.markdown) if c.strip()]
+        salt = pandoc_salt()
+        keys = [hashlib.sha1((salt + chapter).encode('utf8')).hexdigest() for chapter in chapters]
+        results = [cache_read('chapters', key) for key in keys]
+        missing = [i for i, r in enumerate(results) if r is None]
+        logger.info("{} of {} chapters cached".format(len(chapters) - len(missing), len(chapters)))
+        if missing:
+            converted = run_many([(chapters[i], BOOK_PANDOC_ARGS) for i in missing])
+            for i, result in zip(missing, converted):
+                results[i] = result.output
+                cache_write('chapters', keys[i], result.output)
+            cache_prune('chapters', CHAPTER_CACHE_ENTRIES)
+        return '\n'.join(prefix_labels(result, 'ch{}-'.format(i + 1)) for i, result in enumerate(results))
+
+
+DOCUMENT_CLASSES = dict(
+    sffms = SFFMSStory,
+    article = ArticleStory,
+    book = BookStory,
+    )
+
+def latex_story(input, documentclass='sffms'):
+    """
+    Return the story object for the given document class,
+    falling back to sffms for unknown classes.
+    """
+    return DOCUMENT_CLASSES.get(documentclass, SFFMSStory)(input)
 
 
 def replace_section(s):
@@ -1,18 +1,33 @@
 """
 mdfic.makefile - Create project makefiles
+
+The generated Makefiles are safe to run with `make -j`: mdfic writes
+every output through a unique temporary file and renames it into place,
+and each mdfic command writes a `.d` dependency file listing every
+input it read, which the Makefile includes on the next run.  Where one
+command writes several files make should know about, they are the
+targets of one pattern rule, which make treats as a group: the recipe
+runs once for all of them.
 """
 
 SINGLE_TEMPLATE = """
 STORY={name}
+META := $(wildcard metadata.yaml)
+OPEN ?= $(if $(filter Darwin,$(shell uname -s)),open,xdg-open)
+
+.DELETE_ON_ERROR:
+.SECONDARY:
 
 default: pdf html docx epub
 
-all: pdf html docx epub mobi tex
+all: pdf html htmlpages docx epub mobi tex
 
 pdf: out/$(STORY)-sffms.pdf
 
 html: out/$(STORY).html
 
+htmlpages: out/$(STORY)/index.html
+
 docx: out/$(STORY)-plain.docx out/$(STORY)-sffms.docx
 
 epub: out/$(STORY).epub
@@ -25,48 +40,62 @@ article: out/$(STORY)-article.pdf
 
 css: out/$(STORY).css
 
+web: out/web/$(STORY).html.gz out/web/$(STORY)/index.html
+
 view: .view
 
 ##############################
-%-article.tex: metadata.yaml %.md
-	mdfic latex --documentclass=article --output=$@ $^
+%-article.tex: $(META) %.md
+	mdfic latex --documentclass=article --output=$@ --depfile=$@.d $^
 
-%-sffms.tex: metadata.yaml %.md
-	mdfic latex --documentclass=sffms --output=$@ $^
+%-sffms.tex: $(META) %.md
+	mdfic latex --documentclass=sffms --output=$@ --depfile=$@.d $^
 
 
 {pdftarget}
 
-out/%.html: %.md out/%.css | out
-	mdfic html --css=out/$*.css  $< -o $@ 
+out/%.html: $(META) %.md out/%.css | out
+	mdfic html --css=out/$*.css --output=$@ --depfile=$@.d $(META) $*.md
+
+out/%/index.html: $(META) %.md | out
+	mdfic html-pages --output=out/$* --depfile=out/$*.pages.d $(META) $*.md
 
-out/%-plain.docx: %.md | out
-	mdfic docx --no-sffms --output=$@ $<
+{webtarget}
+out/web/%/index.html: $(META) %.md | out/web
+	mdfic html-pages --optimize --output=out/web/$* --depfile=out/web/$*.pages.d $(META) $*.md
 
-out/%-sffms.docx: %.md | out
-	mdfic docx --sffms --output=$@ $<
+out/%-plain.docx: $(META) %.md | out
+	mdfic docx --no-sffms --output=$@ --depfile=$@.d $(META) $*.md
 
-out/%.epub: %.md | out
-	pandoc metadata.yaml $< -o $@
+out/%-sffms.docx: $(META) %.md | out
+	mdfic docx --sffms --output=$@ --depfile=$@.d $(META) $*.md
 
-out/%.mobi: %.md | out
-	pandoc metadata.yaml $< -o $@
+out/%.epub: $(META) %.md | out
+	mdfic epub --output=$@ --depfile=$@.d $(META) $*.md
+
+out/%.mobi: $(META) %.md | out
+	pandoc $(META) $*.md -o $@
 
 out/%.css: | out
 	mdfic css -o $@
 
 out:
-	mkdir out
+	mkdir -p out
+
+out/web:
+	mkdir -p out/web
 
 .view: out/$(STORY).html
-	open out/$(STORY).html
+	$(OPEN) out/$(STORY).html
 	touch .view
 
+-include $(wildcard *.d out/*.d out/web/*.d)
+
 
 ###########################
 clean:
 	rm -vf  *.aux *.log *.synctex.gz *.toc *.out *~ 
-	rm -vf $(STORY).tex $(STORY)-article.tex $(STORY)-sffms.tex
+	rm -vf $(STORY).tex $(STORY)-article.tex $(STORY)-sffms.tex *.d
 
 out-clean:
 	rm -vrf out
@@ -79,10 +108,15 @@ all-clean: clean out-clean
 
 MULTI_TEMPLATE = """
 STORY={name}
+PARTS = $(sort $(wildcard $(STORY)-*.md))
+OPEN ?= $(if $(filter Darwin,$(shell uname -s)),open,xdg-open)
+
+.DELETE_ON_ERROR:
+.SECONDARY:
 
 HTMLPARTS := $(patsubst %.md,out/%.html,$(wildcard $(STORY)-*.md))
 
-default: pdf html htmlparts docx epub
+default: pdf html htmlpages docx epub
 
 all: default epub mobi tex
 
@@ -92,60 +126,76 @@ html: out/$(STORY).html
 
 htmlparts: $(HTMLPARTS)
 
+htmlpages: out/$(STORY)/index.html
+
 docx: out/$(STORY)-plain.docx out/$(STORY)-sffms.docx
 
 epub: out/$(STORY).epub
 
 mobi: out/$(STORY).mobi
 
-tex: $(STORY).tex
+tex: $(STORY)-article.tex $(STORY)-sffms.tex
+
+web: out/web/$(STORY).html.gz out/web/$(STORY)/index.html
 
 view: .view
 
-$(STORY).md: $(STORY)-*.md metadata.yaml
-	cat $(STORY)-*.md > $@
-	
+$(STORY).md: $(PARTS) metadata.yaml
+	cat $(PARTS) > $@.$$$$.tmp && mv $@.$$$$.tmp $@
+
 #######################
 # Parts
 
 %-article.tex: metadata.yaml %.md 
-	mdfic latex --documentclass=article --output=$@  $^
+	mdfic latex --documentclass=article --output=$@ --depfile=$@.d $^
 
 %-sffms.tex: metadata.yaml %.md 
-	mdfic latex --documentclass=sffms --output=$@ $^
+	mdfic latex --documentclass=sffms --output=$@ --depfile=$@.d $^
 
 {pdftarget}
 
-out/%.html: %.md out/%.css | out
-	mdfic html --css=out/$*.css  $< -o $@ 
+out/%.html: metadata.yaml %.md out/%.css | out
+	mdfic html --css=out/$*.css --output=$@ --depfile=$@.d metadata.yaml $*.md
+
+out/$(STORY)/index.html: metadata.yaml $(PARTS) | out
+	mdfic html-pages --by=part --output=out/$(STORY) --depfile=out/$(STORY).pages.d metadata.yaml $(PARTS)
+
+{webtarget}
+out/web/$(STORY)/index.html: metadata.yaml $(PARTS) | out/web
+	mdfic html-pages --by=part --optimize --output=out/web/$(STORY) --depfile=out/web/$(STORY).pages.d metadata.yaml $(PARTS)
 
-out/%-plain.docx: %.md metadata.yaml | out
-	mdfic docx --no-sffms --output=$@ metadata.yaml $<
+out/%-plain.docx: metadata.yaml %.md | out
+	mdfic docx --no-sffms --output=$@ --depfile=$@.d metadata.yaml $*.md
 
-out/%-sffms.docx: %.md metadata.yaml | out
-	mdfic docx --sffms --output=$@ metadata.yaml $<
+out/%-sffms.docx: metadata.yaml %.md | out
+	mdfic docx --sffms --output=$@ --depfile=$@.d metadata.yaml $*.md
 
-out/%.epub: %.md metadata.yaml | out
-	pandoc metadata.yaml $< -o $@
+out/%.epub: metadata.yaml %.md | out
+	mdfic epub --output=$@ --depfile=$@.d metadata.yaml $*.md
 
-out/%.mobi: %.md metadata.yaml | out
-	pandoc metadata.yaml $< -o $@
+out/%.mobi: metadata.yaml %.md | out
+	pandoc metadata.yaml $*.md -o $@
 
 out/%.css: | out
 	mdfic css -o $@
 
 out:
-	mkdir out
+	mkdir -p out
+
+out/web:
+	mkdir -p out/web
 
 .view: out/$(STORY).html
-	open out/$(STORY).html
+	$(OPEN) out/$(STORY).html
 	touch .view
 
+-include $(wildcard *.d out/*.d out/web/*.d)
+
 ###########################
 clean:
 	rm -vf  *.aux *.log *.synctex.gz *.toc *.out *~ 
 	rm -vf $(STORY).md 
-	rm -vf $(STORY).tex $(STORY)-article.tex $(STORY)-sffms.tex
+	rm -vf $(STORY).tex $(STORY)-article.tex $(STORY)-sffms.tex *.d
 
 out-clean:
 	rm -vrf out
@@ -153,11 +203,22 @@ out-clean:
 all-clean: clean out-clean
 """
 
+# mdfic pdf keeps each document's .aux and .log in its own build
+# directory (out/.NAME.build) and reruns pdflatex only while they change.
 LATEX_PDF_TARGET = """\
 out/%.pdf: %.tex | out
-	pdflatex $<
-	pdflatex $<
-	mv `basename $@` $@
+	mdfic pdf --engine=pdflatex --output=$@ $<
+"""
+
+# html --optimize writes the page and its .gz (and, with brotli, .br)
+# copies in one run; naming both .html and .html.gz as targets of the
+# one rule keeps make -j from running it twice.  The .br copy isn't a
+# target, since it is only written when brotli is installed.  The pages
+# html-pages writes besides index.html are named after the chapters, so
+# make can't know them in advance; index.html stands for the directory.
+WEB_HTML_TARGET = """\
+out/web/%.html out/web/%.html.gz: {meta} %.md out/%.css | out/web
+	mdfic html --optimize --css=out/$*.css --output=out/web/$*.html --depfile=out/web/$*.html.d {meta} $*.md
 """
 
 PAGES_PDF_TARGET = """\
@@ -191,4 +252,6 @@ def makefile(name: str,
 	else:
 		template = SINGLE_TEMPLATE
 
-	return template.format(name=name,pdftarget=pdftarget)
\ No newline at end of file
+	webtarget = WEB_HTML_TARGET.format(meta='metadata.yaml' if multi else '$(META)')
+
+	return template.format(name=name,pdftarget=pdftarget,webtarget=webtarget)
\ No newline at end of file
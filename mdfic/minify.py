@@ -0,0 +1,149 @@
+"""
+mdfic.minify - Shrink HTML pages for serving, and precompress them.
+
+`minify_html` drops comments and the whitespace a browser would ignore
+anyway, and minifies each <style> block with `minify_css`.  The content
+of <pre>, <code>, <textarea> and <script> is left exactly as it was
+(mdfic's style sheet sets `white-space: pre` on <code>).
+
+`precompress` writes `.gz` (and, if the `brotli` package is installed,
+`.br`) siblings of a file, so a static server can send the compressed
+bytes as they are instead of compressing on every request.  The gzip
+header carries no name or time, so the same page gives the same bytes.
+"""
+
+import gzip
+import logging
+import os
+import re
+
+from .utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Tags around which whitespace has no effect on how a page looks.
+BLOCK_TAGS = frozenset("""
+    address article aside blockquote body center dd details dialog div dl dt
+    fieldset figcaption figure footer form h1 h2 h3 h4 h5 h6 head header hr
+    html li link main meta nav noscript ol p pre section style summary table
+    tbody td tfoot th thead title tr ul !doctype
+""".split())
+
+HTML_TOKEN = re.compile(r"""
+    (?P<comment><!--(?!\[if).*?-->)
+  | (?P<raw>(?P<start><(?P<rawtag>pre|code|textarea|script|style)\b[^>]*>)(?P<content>.*?)(?P<end></(?P=rawtag)\s*>))
+  | </?(?P<name>[!A-Za-z][A-Za-z0-9]*)[^>]*>
+""", re.DOTALL | re.IGNORECASE | re.VERBOSE)
+
+WHITESPACE = re.compile(r'\s+')
+
+CSS_STRING = r'"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\''
+CSS_COMMENT = re.compile(r'(' + CSS_STRING + r')|/\*.*?\*/', re.DOTALL)
+CSS_STRINGS = re.compile('(' + CSS_STRING + ')')
+# Punctuation that needs no space on either side.
+CSS_PUNCTUATION = re.compile(r' ?([{};,>]) ?')
+# What comes before each {, ; or }: a selector or at-rule before {,
+# a declaration before ; or }.
+CSS_SEGMENT = re.compile(r'((?:' + CSS_STRING + r'|[^{};"\'])*)([{};]|$)')
+
+
+def tighten_colons(m):
+    """
+    Drop the space after the colons of a declaration or an at-rule's
+    (feature: value) conditions; in a selector it may matter.
+    """
+    segment, end = m.groups()
+    if end == '{' and not segment.startswith('@'):
+        return m.group()
+    pieces = CSS_STRINGS.split(segment)
+    for i in range(0, len(pieces), 2):
+        pieces[i] = pieces[i].replace(': ', ':')
+    return ''.join(pieces) + end
+
+
+def minify_css(css):
+    """
+    Drop comments, needless whitespace and the last semicolon in
+    each rule from a style sheet, leaving strings and selectors alone.
+    """
+    # a comment between two words still separates them
+    css = CSS_COMMENT.sub(lambda m: m.group(1) or ' ', css)
+    pieces = CSS_STRINGS.split(css)
+    # the odd pieces are the strings
+    for i in range(0, len(pieces), 2):
+        piece = WHITESPACE.sub(' ', pieces[i])
+        piece = CSS_PUNCTUATION.sub(r'\1', piece)
+        pieces[i] = piece.replace(';}', '}')
+    return CSS_SEGMENT.sub(tighten_colons, ''.join(pieces).strip())
+
+
+def minify_html(html):
+    """
+    Minify an HTML page, and the style sheets inside it.
+    """
+    out = []
+    pos = 0
+    previous = None         # the last tag written
+
+    def text(chunk, following):
+        chunk = WHITESPACE.sub(' ', chunk)
+        if previous in BLOCK_TAGS:
+            chunk = chunk.lstrip(' ')
+        if following in BLOCK_TAGS:
+            chunk = chunk.rstrip(' ')
+        out.append(chunk)
+
+    for m in HTML_TOKEN.finditer(html):
+        if m.group('comment'):
+            # as if the comment weren't there
+            out.append(WHITESPACE.sub(' ', html[pos:m.start()]))
+            pos = m.end()
+            continue
+        if m.group('raw'):
+            name = m.group('rawtag').lower()
+        else:
+            name = m.group('name').lower()
+        text(html[pos:m.start()], name)
+        pos = m.end()
+        if m.group('raw') and name == 'style':
+            out.append(m.group('start') + minify_css(m.group('content')) + m.group('end'))
+        else:
+            out.append(m.group())
+        previous = name
+    text(html[pos:], None)
+    return ''.join(out).strip() + '\n'
+
+
+def brotli_compress(data):
+    """
+    Brotli-compressed data, or None if brotli isn't installed.
+    """
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+
+def precompress(path):
+    """
+    Write path.gz and, when brotli is available, path.br next to
+    path.  Returns the names written.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = []
+    with atomic_write(path + '.gz', 'wb') as out:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=out, compresslevel=9, mtime=0) as gz:
+            gz.write(data)
+    written.append(path + '.gz')
+    compressed = brotli_compress(data)
+    if compressed is None:
+        logger.info("brotli isn't installed; not writing {}.br".format(path))
+    else:
+        with atomic_write(path + '.br', 'wb') as out:
+            out.write(compressed)
+        written.append(path + '.br')
+    for name in written:
+        logger.info("{}: {} -> {} bytes".format(name, len(data), os.path.getsize(name)))
+    return written
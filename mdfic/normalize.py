@@ -0,0 +1,206 @@
+"""
+mdfic.normalize - Clean up a manuscript's text in one pass.
+
+A `Normalizer` compiles the rules it is given (sentence spacing, quotes,
+dashes, ellipses, whitespace) into one regular expression, so the text
+is scanned once however many rules are on.  Metadata blocks, code
+spans, HTML tags, link targets, horizontal rules and table rows are
+left alone.
+
+`Normalizer.stream()` filters text as it is read, a line-aligned chunk
+at a time, and gives the same result as normalizing the whole text:
+
+    normalizer = Normalizer(pspaces=1, quotes='smart', dashes='unicode')
+    with open('story.md') as f:
+        for chunk in normalizer.stream(chunks(f)):
+            out.write(chunk)
+"""
+
+from functools import partial
+import re
+
+CHUNK_SIZE = 1 << 16
+
+# A YAML metadata block at the start of a file.
+METADATA = re.compile(r'---[ \t]*\n.*?\n(?:---|\.\.\.)[ \t]*(?:\n|\Z)', re.DOTALL)
+
+# Each rule is (the characters a match can start with, the pattern,
+# the replacement).  The first characters let the combined pattern
+# skip quickly over text no rule can match.
+
+# Text no rule may change, in the order they are tried.
+PROTECTED = [
+    ('`', r'``[^\n]*?``', None),
+    ('`', r'`[^`\n]+`', None),
+    ('<', r'<[A-Za-z/!][^>\n]*>', None),
+    (']', r'\]\([^)\n]*\)', None),
+    # horizontal rules, scene breaks and metadata delimiters
+    (' -*_.', r'^[ ]{0,3}(?:(?:-[ \t]*){3,}|(?:\*[ \t]*){3,}|(?:_[ \t]*){3,}|\.\.\.[ \t]*)$', None),
+    # table delimiter rows
+    (' \t|:-', r'^[ \t]*\|?[ \t]*:?-+:?[ \t]*(?:\|[ \t]*:?-+:?[ \t]*)+\|?[ \t]*$', None),
+]
+
+# Characters after which a quote opens rather than closes.
+OPENERS = r'\s(\[{*_—–-'
+
+QUOTES = dict(
+    smart = [
+        ('"', r'(?<![^' + OPENERS + r'])"', '“'),
+        ('"', r'"', '”'),
+        ("'", r"'(?=\d\d)", '’'),
+        ("'", r"(?<![^" + OPENERS + r"])'", '‘'),
+        ("'", r"'", '’'),
+    ],
+    straight = [
+        ('“”„', r'[“”„]', '"'),
+        ('‘’‚', r'[‘’‚]', "'"),
+    ],
+)
+
+DASHES = dict(
+    unicode = [
+        ('-', r'(?<=[^\n-])---(?!-)', '—'),
+        ('-', r'(?<=[^\n-])--(?!-)', '–'),
+    ],
+    ascii = [
+        ('—', r'—', '---'),
+        ('–', r'–', '--'),
+    ],
+)
+
+ELLIPSES = dict(
+    unicode = [
+        ('.', r'\.[ ]?\.[ ]?\.', '…'),
+    ],
+    ascii = [
+        ('.', r'\.[ ]\.[ ]\.', '...'),
+        ('…', r'…', '...'),
+    ],
+)
+
+# What `pspaces` replaces when it is the only rule.
+SENTENCE_SPACE = re.compile(r'[.][ ]+')
+
+WHITESPACE = [
+    # two or more spaces at the end of a line are a hard line break
+    (' ', r'(?<=\S)[ ]{2,}(?=\r?\n)', '  '),
+    (' \t', r'[ \t]+(?=\r|\n|\Z)', ''),
+    ('\r\n', r'\r?\n(?:[ \t]*\r?\n)+', '\n\n'),
+    ('\r', r'\r\n?', '\n'),
+    ('\u200b\ufeff', r'[\u200b\ufeff]', ''),
+    (' ', r'(?<=\S)[ ]{2,}(?=\S)', ' '),
+]
+
+
+def chunks(f, size=CHUNK_SIZE):
+    """
+    Read a file in chunks of size characters.
+    """
+    return iter(partial(f.read, size), '')
+
+
+class Normalizer:
+    """
+    A compiled set of normalization rules:
+
+    pspaces     put this many spaces after a period (None: leave alone);
+                on its own, it is a plain substitution that only
+                spares the metadata block, as `fix_sentence_spacing`
+    quotes      'smart' or 'straight' (None: leave alone)
+    dashes      'unicode' turns -- and --- into en and em dashes,
+                'ascii' turns them back (None: leave alone)
+    ellipses    'unicode' turns ... and . . . into an ellipsis
+                character, 'ascii' into three periods
+    whitespace  drop trailing whitespace, zero-width characters and
+                extra blank lines and spaces, and use \\n line endings
+    """
+
+    def __init__(self, pspaces=None, quotes=None, dashes=None, ellipses=None, whitespace=False):
+        for name, value, choices in [('quotes', quotes, QUOTES), ('dashes', dashes, DASHES),
+                                     ('ellipses', ellipses, ELLIPSES)]:
+            if value is not None and value not in choices:
+                raise ValueError("{} must be one of {}, not {!r}".format(
+                    name, ', '.join(sorted(choices)), value))
+
+        if pspaces is not None and not (quotes or dashes or ellipses or whitespace):
+            # sentence spacing alone is one plain substitution, far
+            # cheaper than the combined pattern; only metadata is kept
+            self.active = True
+            self.pattern = SENTENCE_SPACE
+            self.replacement = '.' + ' ' * pspaces
+            return
+
+        # spaces before the end of a line are the whitespace rules' to trim
+        sentence_space = r'[ ]+(?=\S)' if whitespace else r'[ ]+'
+        rules = list(PROTECTED)
+        if ellipses:
+            for chars, pattern, replacement in ELLIPSES[ellipses]:
+                if pspaces is not None:
+                    # an ellipsis ends a sentence as a period does
+                    rules.append((chars, pattern + sentence_space, replacement + ' ' * pspaces))
+                rules.append((chars, pattern, replacement))
+        if pspaces is not None:
+            rules.append(('.', r'[.]' + sentence_space, '.' + ' ' * pspaces))
+        if quotes:
+            rules += QUOTES[quotes]
+        if dashes:
+            rules += DASHES[dashes]
+        if whitespace:
+            rules += WHITESPACE
+
+        self.active = len(rules) > len(PROTECTED)
+        self.replacement = self._replace
+        self.replacements = {}
+        alternatives = []
+        first = set()
+        for i, (chars, pattern, replacement) in enumerate(rules):
+            name = 'r{}'.format(i)
+            self.replacements[name] = replacement
+            alternatives.append('(?P<{}>{})'.format(name, pattern))
+            first.update(chars)
+        self.pattern = re.compile('(?=[{}])(?:{})'.format(
+            ''.join(map(re.escape, sorted(first))), '|'.join(alternatives)), re.MULTILINE)
+
+    def _replace(self, m):
+        replacement = self.replacements[m.lastgroup]
+        return m.group() if replacement is None else replacement
+
+    def _sub(self, text):
+        return self.pattern.sub(self.replacement, text) if self.active else text
+
+    def __call__(self, text):
+        """
+        Normalize text, leaving a leading metadata block unchanged.
+        """
+        m = METADATA.match(text)
+        head = m.group() if m else ''
+        return head + self._sub(text[len(head):])
+
+    def stream(self, chunks):
+        """
+        Normalize text arriving in chunks and yield the result
+        a line-aligned piece at a time.
+        """
+        pending = ''
+        started = False
+        for chunk in chunks:
+            pending += chunk
+            if not started:
+                # hold back what may be a metadata block until it is complete
+                m = METADATA.match(pending)
+                if not m and '---'.startswith(pending[:3]):
+                    continue
+                if m:
+                    yield m.group()
+                    pending = pending[m.end():]
+                started = True
+            # cut after a newline that isn't followed by whitespace,
+            # so that no rule can match across the cut
+            cut = pending.rfind('\n')
+            while cut >= 0 and (cut + 1 == len(pending) or pending[cut + 1].isspace()):
+                cut = pending.rfind('\n', 0, cut)
+            if cut >= 0:
+                yield self._sub(pending[:cut + 1])
+                pending = pending[cut + 1:]
+        if pending:
+            yield self._sub(pending) if started else self(pending)
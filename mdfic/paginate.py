@@ -0,0 +1,224 @@
+"""
+mdfic.paginate - Render a long story as a small website, a page per chapter.
+
+The story is converted to HTML by pandoc once (see `mdfic.epub`) and
+split at its top-level chapter headings, or at the boundaries between
+its input files (the parts of a multi-part project), into pages named
+chapter-NNN.html.  An index.html holds the title page and the table of
+contents, and every page has previous / contents / next links and asks
+the browser to prefetch the next page.
+
+All the pages share one style sheet whose name carries a hash of its
+contents (style-XXXXXXXX.css), so a server can tell browsers to cache
+it forever: a changed style sheet gets a new name.  Pages and style
+sheets left over from an earlier, longer rendering are removed.
+"""
+
+import glob
+import hashlib
+import html as htmlmod
+import logging
+import os
+import re
+
+from .epub import render_fragment, scene_breaks, split_chapters, stylesheet
+from .instrument import stage
+from .utils import atomic_write, get_in, parse_metadata
+
+logger = logging.getLogger(__name__)
+
+# Put between input files to mark where a part ends; pandoc passes
+# the comment through to the HTML.
+PART_MARKER = '<!-- mdfic:part -->'
+
+HEADING = re.compile(r'<h[1-6][^>]*>(.*?)</h[1-6]>', re.DOTALL)
+
+PAGES_CSS = """
+nav.pager {
+  display: flex;
+  justify-content: space-between;
+  margin: 1em 0;
+}
+nav.pager a {
+  text-decoration: none;
+}
+ol.toc {
+  line-height: 1.6;
+}
+"""
+
+PAGE = """<!DOCTYPE html>
+<html lang="{lang}">
+<head>
+<meta charset="utf-8" />
+<meta name="viewport" content="width=device-width, initial-scale=1" />
+<title>{title}</title>
+<link rel="stylesheet" href="{css}" />
+{prefetch}</head>
+<body>
+{nav}
+<main>
+{body}
+</main>
+{nav}
+</body>
+</html>
+"""
+
+INDEX_BODY = """<header>
+<h1 class="title">{title}</h1>
+{subtitle}{author}</header>
+<ol class="toc">
+{items}
+</ol>"""
+
+
+def join_parts(texts):
+    """
+    Join the texts of a story's input files into one story,
+    marking where each part ends.
+    """
+    return ('\n\n' + PART_MARKER + '\n\n').join(text.rstrip('\n') for text in texts) + '\n'
+
+
+def split_parts(fragment):
+    """
+    Split an HTML fragment at the part markers and return a list of
+    (title, html) pairs, titled by each part's first heading or, for
+    parts without one, 'Part N'.  Empty parts, such as a metadata
+    file's, are left out.
+    """
+    parts = []
+    for part in fragment.split(PART_MARKER):
+        if not part.strip():
+            continue
+        m = HEADING.search(part)
+        title = htmlmod.unescape(re.sub(r'<[^>]+>', '', m.group(1))).strip() if m else None
+        parts.append((title or 'Part {}'.format(len(parts) + 1), part.strip('\n') + '\n'))
+    return parts
+
+
+def page_name(i):
+    """
+    The file name of page i (0 is the index).
+    """
+    return 'chapter-{:03d}.html'.format(i) if i else 'index.html'
+
+
+def pager(i, count):
+    """
+    The navigation links for page i of count pages (0 is the index).
+    """
+    links = []
+    if i > 0:
+        links.append('<a rel="prev" href="{}">&larr; Previous</a>'.format(page_name(i - 1)))
+    if i > 1:
+        links.append('<a href="index.html">Contents</a>')
+    if i < count - 1:
+        links.append('<a rel="next" href="{}">Next &rarr;</a>'.format(page_name(i + 1)))
+    return '<nav class="pager">\n{}\n</nav>'.format('\n'.join(links))
+
+
+def page(title, body, lang, css, i, count):
+    prefetch = ''
+    if i < count - 1:
+        prefetch = '<link rel="prefetch" href="{}" />\n'.format(page_name(i + 1))
+    return PAGE.format(title=htmlmod.escape(title), body=body, lang=lang, css=css,
+                       prefetch=prefetch, nav=pager(i, count))
+
+
+def index_body(metadata, chapters):
+    title = str(metadata.get('title', ''))
+    subtitle = metadata.get('subtitle')
+    author = metadata.get('author')
+    return INDEX_BODY.format(
+        title=htmlmod.escape(title),
+        subtitle='<p class="subtitle">{}</p>\n'.format(htmlmod.escape(str(subtitle))) if subtitle else '',
+        author='<p class="author">{}</p>\n'.format(htmlmod.escape(str(author))) if author else '',
+        items='\n'.join('<li><a href="{}">{}</a></li>'.format(
+                            page_name(i + 1), htmlmod.escape(chapter_title or title or 'Beginning'))
+                        for i, (chapter_title, _) in enumerate(chapters)))
+
+
+def css_name(css):
+    return 'style-{}.css'.format(hashlib.sha256(css.encode('utf8')).hexdigest()[:8])
+
+
+def stale_files(directory, keep, compressed=False):
+    """
+    The pages and style sheets (and their compressed copies) in
+    directory that an earlier rendering wrote and this one didn't,
+    and unless this rendering is compressed, the compressed copies
+    of those it did.
+    """
+    stale = []
+    for pattern in ('index.html', 'chapter-[0-9][0-9][0-9].html', 'style-*.css'):
+        for path in glob.glob(os.path.join(glob.escape(directory), pattern)):
+            kept = os.path.basename(path) in keep
+            stale.extend(path + suffix for suffix in ('', '.gz', '.br')
+                         if not (kept and (compressed or not suffix)) and os.path.exists(path + suffix))
+    return stale
+
+
+def render_pages(input, directory, css=None, metadata=None, by='chapter', jobs=None, optimize=False):
+    """
+    Render a markdown story (with its metadata block) as an index
+    page and a page per chapter in directory, and return the paths
+    written.  With by='part', input comes from `join_parts` and each
+    part is a page.  css is the name of a CSS file to use instead of
+    mdfic's default; jobs is the number of pandoc runs to use at once
+    for long books (default: the CPU count).  With optimize, pages and
+    style sheet are minified and written with precompressed copies
+    (see `mdfic.minify`).
+    """
+    if metadata is None:
+        metadata = parse_metadata(input, join='\n')
+    number_scenes = get_in(metadata, ['mdfic', 'number_scenes'], False)
+    lang = str(metadata.get('lang', 'en'))
+    title = str(metadata.get('title', ''))
+
+    fragment = render_fragment(input, jobs or os.cpu_count() or 1)
+
+    with stage('pages.split', len(fragment)):
+        split = split_parts(fragment) if by == 'part' else split_chapters(fragment)
+        chapters = [(chapter_title, scene_breaks(body, number_scenes)) for chapter_title, body in split]
+        if chapters:
+            chapter_title, body = chapters[-1]
+            chapters[-1] = (chapter_title, body + '<p class="scene-break">END</p>\n')
+
+    style = stylesheet(css) + PAGES_CSS
+    if optimize:
+        from .minify import minify_css, minify_html
+        style = minify_css(style) + '\n'
+    style_name = css_name(style)
+
+    count = len(chapters) + 1
+    pages = [(page_name(0), page(title or 'Contents', index_body(metadata, chapters), lang, style_name, 0, count))]
+    for i, (chapter_title, body) in enumerate(chapters, 1):
+        if chapter_title and title and chapter_title != title:
+            name = '{} - {}'.format(chapter_title, title)
+        else:
+            name = chapter_title or title
+        pages.append((page_name(i), page(name, body, lang, style_name, i, count)))
+    if optimize:
+        with stage('minify'):
+            pages = [(name, minify_html(text)) for name, text in pages]
+
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    with stage('pages.write'):
+        for name, text in [(style_name, style)] + pages:
+            path = os.path.join(directory, name)
+            with atomic_write(path, encoding='utf8') as f:
+                f.write(text)
+            written.append(path)
+    for path in stale_files(directory, {name for name, _ in pages} | {style_name}, optimize):
+        logger.info("removing {}".format(path))
+        os.remove(path)
+    if optimize:
+        from .minify import precompress
+        with stage('precompress'):
+            for path in list(written):
+                written.extend(precompress(path))
+    logger.info("wrote {} pages to {}".format(len(pages), directory))
+    return written
@@ -0,0 +1,161 @@
+"""
+mdfic.pandoc - Run pandoc, alone or many conversions at once.
+
+`convert()` runs one conversion and blocks; `run()` is its asyncio
+counterpart, and `run_many()` runs a list of conversions concurrently,
+at most `jobs` pandoc processes at a time.  All of them kill pandoc
+if it runs longer than the timeout, raise `PandocError` if it fails,
+and return pandoc's output along with the warnings it printed on
+stderr, which are also logged.
+
+The defaults come from the environment:
+
+    MDFIC_PANDOC_JOBS     concurrent pandoc processes (default: CPU count)
+    MDFIC_PANDOC_TIMEOUT  seconds before pandoc is killed (default: none)
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import re
+import subprocess
+from collections import namedtuple
+
+from .instrument import stage
+
+logger = logging.getLogger(__name__)
+
+Result = namedtuple('Result', 'output warnings')
+
+# One message from pandoc's stderr: level is 'WARNING', 'INFO', ... or
+# None for output that isn't in pandoc's `[LEVEL] message` form.
+PandocWarning = namedtuple('PandocWarning', 'level message')
+
+LEVEL = re.compile(r'^\[(\w+)\]\s*(.*)$')
+
+
+class PandocError(RuntimeError):
+    """
+    Pandoc failed or timed out.  stderr is what it printed.
+    """
+
+    def __init__(self, message, returncode=None, stderr=''):
+        super().__init__(message)
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+@functools.lru_cache(maxsize=None)
+def pandoc_version():
+    """
+    The first line of `pandoc --version`, or '' if pandoc can't be run.
+    """
+    try:
+        p = subprocess.run(['pandoc', '--version'], capture_output=True, encoding='utf8')
+    except OSError:
+        return ''
+    return p.stdout.partition('\n')[0].strip()
+
+
+def default_jobs():
+    return int(os.environ.get('MDFIC_PANDOC_JOBS') or 0) or os.cpu_count() or 1
+
+
+def default_timeout():
+    timeout = os.environ.get('MDFIC_PANDOC_TIMEOUT')
+    return float(timeout) if timeout else None
+
+
+def parse_warnings(stderr):
+    """
+    Split pandoc's stderr into PandocWarnings.  Indented lines
+    continue the message before them.
+    """
+    warnings = []
+    for line in stderr.splitlines():
+        if not line.strip():
+            continue
+        m = LEVEL.match(line)
+        if m:
+            warnings.append(PandocWarning(m.group(1), m.group(2)))
+        elif warnings and line[:1].isspace():
+            level, message = warnings[-1]
+            warnings[-1] = PandocWarning(level, message + '\n' + line.strip())
+        else:
+            warnings.append(PandocWarning(None, line.strip()))
+    return warnings
+
+
+def _result(args, returncode, stdout, stderr):
+    if returncode != 0:
+        raise PandocError("pandoc {} exited with status {}: {}".format(
+            ' '.join(args), returncode, stderr.strip()), returncode, stderr)
+    warnings = parse_warnings(stderr)
+    for w in warnings:
+        logger.warning("pandoc: {}".format(w.message))
+    return Result(stdout, warnings)
+
+
+def convert(input, *args, timeout=None):
+    """
+    Run pandoc with the given arguments on input and return a Result.
+    """
+    timeout = timeout if timeout is not None else default_timeout()
+    with stage('pandoc', len(input)):
+        try:
+            p = subprocess.run(['pandoc'] + list(args), input=input, encoding='utf8',
+                               capture_output=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise PandocError("pandoc {} timed out after {}s".format(' '.join(args), timeout))
+    return _result(args, p.returncode, p.stdout, p.stderr)
+
+
+async def run(input, *args, timeout=None, semaphore=None):
+    """
+    Run pandoc with the given arguments on input and return a Result,
+    waiting for the semaphore first if one is given.
+    """
+    timeout = timeout if timeout is not None else default_timeout()
+    if semaphore is not None:
+        async with semaphore:
+            return await run(input, *args, timeout=timeout)
+
+    with stage('pandoc', len(input)):
+        proc = await asyncio.create_subprocess_exec(
+            'pandoc', *args,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(input.encode('utf8')), timeout)
+        except asyncio.TimeoutError:
+            # communicate() again to drain and close the pipes
+            proc.kill()
+            await proc.communicate()
+            raise PandocError("pandoc {} timed out after {}s".format(' '.join(args), timeout))
+        except asyncio.CancelledError:
+            proc.kill()
+            await proc.communicate()
+            raise
+    return _result(args, proc.returncode, stdout.decode('utf8'), stderr.decode('utf8'))
+
+
+async def _run_all(conversions, jobs=None, timeout=None):
+    semaphore = asyncio.Semaphore(jobs or default_jobs())
+    # let every run finish (or time out) before raising, rather than
+    # cancelling the others part way through cleaning up
+    results = await asyncio.gather(*(run(input, *args, timeout=timeout, semaphore=semaphore)
+                                     for input, args in conversions), return_exceptions=True)
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    return results
+
+
+def run_many(conversions, jobs=None, timeout=None):
+    """
+    Run a list of (input, args) conversions with at most jobs pandoc
+    processes at once and return their Results in the same order.
+    If any fails, raises its PandocError.
+    """
+    return asyncio.run(_run_all(conversions, jobs=jobs, timeout=timeout))
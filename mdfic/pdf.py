@@ -0,0 +1,181 @@
+"""
+mdfic.pdf - Compile LaTeX to PDF, rerunning only while needed.
+
+The .tex file is compiled in a private build directory that is kept
+between builds.  After each run the auxiliary files (.aux, .toc, ...)
+are hashed; LaTeX is run again only while they keep changing, so a
+draft usually takes one or two runs and a book with a table of contents
+three.  LaTeX runs with `-recorder`, and every file it read (`\\input`
+files, graphics, .bib, .cls and .sty files) is hashed along with the
+.tex file.  If none of them has changed since the last successful build,
+the PDF is copied from the build directory without running LaTeX.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+
+from .instrument import stage
+from .utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Files whose contents feed back into the next run.
+AUX_EXTENSIONS = ('.aux', '.toc', '.lof', '.lot', '.out')
+
+STATE_FILE = 'mdfic-pdf.json'
+
+
+class LatexError(RuntimeError):
+    """
+    LaTeX failed.  log is the tail of its log file.
+    """
+
+    def __init__(self, message, log=''):
+        super().__init__(message)
+        self.log = log
+
+
+def file_hash(path):
+    """
+    The sha1 of a file's contents, or None if it doesn't exist.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def aux_hashes(build_dir, jobname):
+    return {ext: file_hash(os.path.join(build_dir, jobname + ext)) for ext in AUX_EXTENSIONS}
+
+
+def default_build_dir(output):
+    """
+    The build directory for an output: a hidden directory
+    next to it, e.g. out/.story-sffms.build for out/story-sffms.pdf.
+    """
+    directory, name = os.path.split(os.path.abspath(output))
+    return os.path.join(directory, '.{}.build'.format(os.path.splitext(name)[0]))
+
+
+def errors(log):
+    """
+    Return the error lines (those starting with '!') from a LaTeX
+    log and the lines after each, or the last lines if there are none.
+    """
+    lines = log.splitlines()
+    found = []
+    for i, line in enumerate(lines):
+        if line.startswith('!'):
+            found.extend(lines[i:i + 3])
+    return '\n'.join(found or lines[-20:])
+
+
+def recorded_inputs(build_dir, jobname, tex):
+    """
+    The files LaTeX read on its last run, from the .fls file written
+    by -recorder, leaving out tex itself and the build directory's own
+    files.  Relative names are taken from the directory LaTeX ran in.
+    """
+    inputs = []
+    cwd = os.path.dirname(tex)
+    try:
+        with open(os.path.join(build_dir, jobname + '.fls'), errors='replace') as f:
+            for line in f:
+                kind, _, name = line.rstrip('\n').partition(' ')
+                if kind == 'PWD':
+                    cwd = name
+                elif kind == 'INPUT':
+                    path = os.path.normpath(os.path.join(cwd, name))
+                    if (path != tex and not path.startswith(build_dir + os.sep)
+                            and path not in inputs):
+                        inputs.append(path)
+    except OSError:
+        pass
+    return inputs
+
+
+def input_hashes(paths):
+    return {path: file_hash(path) for path in paths}
+
+
+def read_state(build_dir):
+    try:
+        with open(os.path.join(build_dir, STATE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_state(build_dir, state):
+    with atomic_write(os.path.join(build_dir, STATE_FILE)) as f:
+        json.dump(state, f)
+
+
+def run_latex(engine, tex, build_dir, jobname):
+    """
+    Run LaTeX once on tex, from the directory tex is in so
+    that relative \\input and graphics paths work.
+    """
+    command = [engine, '-interaction=nonstopmode', '-halt-on-error', '-recorder',
+               '-output-directory=' + build_dir, '-jobname=' + jobname,
+               os.path.basename(tex)]
+    with stage('latex.run', os.path.getsize(tex)):
+        p = subprocess.run(command, cwd=os.path.dirname(tex) or '.',
+                           stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                           stderr=subprocess.STDOUT)
+    if p.returncode != 0:
+        try:
+            with open(os.path.join(build_dir, jobname + '.log'), errors='replace') as f:
+                log = f.read()
+        except OSError:
+            log = p.stdout.decode('utf8', 'replace')
+        raise LatexError("{} failed on {}:\n{}".format(engine, tex, errors(log)), log)
+
+
+def compile_pdf(tex, output, engine='pdflatex', build_dir=None, max_runs=5):
+    """
+    Compile the LaTeX file tex and write the PDF to output.
+    Returns the number of times LaTeX was run, which is 0 if
+    the document hasn't changed since the last build.
+    """
+    tex = os.path.abspath(tex)
+    build_dir = os.path.abspath(build_dir or default_build_dir(output))
+    jobname = os.path.splitext(os.path.basename(tex))[0]
+    pdf = os.path.join(build_dir, jobname + '.pdf')
+    os.makedirs(build_dir, exist_ok=True)
+
+    source = dict(tex=file_hash(tex), engine=engine)
+    state = read_state(build_dir)
+    inputs = state.get('inputs', {})
+    if (state.get('source') == source and state.get('pdf') and state['pdf'] == file_hash(pdf)
+            and input_hashes(inputs) == inputs):
+        logger.info("{} is up to date".format(pdf))
+        runs = 0
+    else:
+        # forget the last build until this one succeeds
+        write_state(build_dir, {})
+        before = aux_hashes(build_dir, jobname)
+        runs = 0
+        while True:
+            run_latex(engine, tex, build_dir, jobname)
+            runs += 1
+            after = aux_hashes(build_dir, jobname)
+            if after == before:
+                break
+            if runs >= max_runs:
+                logger.warning("{} still changing after {} runs".format(tex, runs))
+                break
+            before = after
+        logger.info("{}: {} LaTeX run(s)".format(tex, runs))
+        inputs = input_hashes(recorded_inputs(build_dir, jobname, tex))
+        write_state(build_dir, dict(source=source, inputs=inputs, pdf=file_hash(pdf)))
+
+    with stage('write', os.path.getsize(pdf)), open(pdf, 'rb') as src, atomic_write(output, 'wb') as out:
+        shutil.copyfileobj(src, out)
+    return runs
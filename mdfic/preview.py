@@ -0,0 +1,184 @@
+"""
+mdfic.preview - Serve a live preview of a story's HTML from memory.
+
+The rendered page is cached and only re-rendered after the sources
+change, so reloading the page never re-runs pandoc.  Browsers listen
+on `/events?since=N` (server-sent events), where N is the generation of
+the sources the page was rendered from, and reload themselves as soon as
+the sources are newer, even if they changed before the listener connected.
+"""
+
+import hashlib
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .watch import snapshot
+
+logger = logging.getLogger(__name__)
+
+RELOAD_SCRIPT = """
+<script>
+  new EventSource("/events?since={generation}").onmessage = function() { location.reload(); };
+</script>
+"""
+
+
+def inline_head(html, extra):
+    """
+    Insert extra markup at the end of the page's <head>,
+    or at the top if it has none.
+    """
+    i = html.find("</head>")
+    if i < 0:
+        return extra + html
+    return html[:i] + extra + html[i:]
+
+
+class Preview:
+    """
+    The story built from `files`, re-rendered on demand
+    when their contents change.
+    """
+
+    def __init__(self, files, css=None, interval=0.5):
+        self.files = list(files)
+        self.css = css
+        self.interval = interval
+        self.generation = 0
+        self.changed = threading.Condition()
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._digest = None
+        self._page = None
+        self._page_generation = -1
+        self._stopped = threading.Event()
+        self.poll()
+
+    def read(self):
+        input = ""
+        for name in self.files:
+            with open(name) as f:
+                input += f.read()
+        if self.css:
+            with open(self.css) as f:
+                css = f.read()
+        else:
+            from .css import CSS as css
+        return input, css
+
+    def poll(self):
+        """
+        Check the sources, and bump the generation if their
+        contents changed.  Return True if they did.
+        """
+        current = snapshot(self.files + ([self.css] if self.css else []))
+        if current == self._snapshot:
+            return False
+        self._snapshot = current
+        try:
+            input, css = self.read()
+        except OSError as e:
+            logger.error("Can't read sources: {}".format(e))
+            return False
+        digest = hashlib.sha1((input + css).encode('utf8')).hexdigest()
+        if digest == self._digest:
+            return False
+        self._digest = digest
+        with self.changed:
+            self.generation += 1
+            self.changed.notify_all()
+        return True
+
+    def page(self):
+        """
+        Return the rendered page as bytes, rendering it only if
+        the sources changed since the last render.
+        """
+        from .html import render_html
+
+        with self._lock:
+            if self._page_generation != self.generation:
+                generation = self.generation
+                input, css = self.read()
+                html = render_html(input)
+                html = inline_head(html, css + RELOAD_SCRIPT.replace('{generation}', str(generation)))
+                self._page = html.encode('utf8')
+                self._page_generation = generation
+            return self._page
+
+    def watch(self):
+        while not self._stopped.wait(self.interval):
+            if self.poll():
+                logger.info("Sources changed, generation {}".format(self.generation))
+
+    def stop(self):
+        self._stopped.set()
+        with self.changed:
+            self.changed.notify_all()
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        logger.info(format % args)
+
+    def do_GET(self):
+        preview = self.server.preview
+        url = urlsplit(self.path)
+        if url.path == '/':
+            try:
+                body = preview.page()
+            except Exception as e:
+                logger.exception("Error rendering preview")
+                self.send_error(500, str(e))
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.write(body)
+        elif url.path == '/events':
+            try:
+                # the generation of the page that is listening
+                seen = int(parse_qs(url.query)['since'][0])
+            except (KeyError, ValueError):
+                seen = preview.generation
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.stream_events(preview, seen)
+        else:
+            self.send_error(404)
+
+    def stream_events(self, preview, seen):
+        try:
+            while not preview._stopped.is_set():
+                with preview.changed:
+                    preview.changed.wait_for(
+                        lambda: preview.generation != seen or preview._stopped.is_set(),
+                        timeout=15)
+                if preview.generation != seen:
+                    seen = preview.generation
+                    self.wfile.write(b"data: reload\n\n")
+                else:
+                    # keepalive, also notices closed connections
+                    self.wfile.write(b": ping\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def make_server(preview, host='127.0.0.1', port=8000):
+    """
+    Return an HTTP server for the preview.  The caller runs
+    `serve_forever()`; the watch thread is started here.
+    """
+    server = ThreadingHTTPServer((host, port), PreviewHandler)
+    server.daemon_threads = True
+    server.preview = preview
+    threading.Thread(target=preview.watch, daemon=True).start()
+    return server
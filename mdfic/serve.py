@@ -0,0 +1,211 @@
+"""
+mdfic.serve - A daemon that runs mdfic commands with everything warm.
+
+`mdfic serve` imports click, python-docx, the renderers and (if it is
+installed) langchain, builds the docx templates and runs pandoc once,
+then listens on a Unix socket.  Each request from `mdfic.client` is
+run in a forked child, which starts with all of that already loaded,
+takes over the client's stdin, stdout, stderr, working directory,
+environment and umask, and sends back the exit status.  Nothing a
+command does can leak into the next one.
+
+Only the user who started the daemon can connect to it.  If the client
+goes away (say, on Ctrl-C), the child is interrupted as if it had been
+run in the terminal.
+"""
+
+import logging
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import traceback
+
+from .client import STATUS, connect, recv_message, send_message, socket_path
+
+logger = logging.getLogger(__name__)
+
+SO_PEERCRED = getattr(socket, 'SO_PEERCRED', None)
+
+# Seconds a client has to send its request once connected, so that
+# one that connects and says nothing can't hold up the others.
+REQUEST_TIMEOUT = 2
+
+
+class ServeError(RuntimeError):
+    pass
+
+
+def warm():
+    """
+    Import and build everything a command might need, so that
+    forked children don't have to.
+    """
+    from . import cli, docx, epub, html, latex, normalize, stats, echoes, fromdocx, minify, paginate  # noqa: F401
+    from .pandoc import convert, PandocError
+    docx.template_bytes(sffms=False)
+    docx.template_bytes(sffms=True)
+    try:
+        # not mdfic.copyedit itself, which reads the environment
+        # (the client's, in a child) when it is imported
+        import keyring, langchain_core.output_parsers, langchain_core.prompts, langchain_openai  # noqa: F401
+    except ImportError as e:
+        logger.info("copyedit not available: {}".format(e))
+    try:
+        convert('warm', '-t', 'html')
+    except (OSError, PandocError) as e:
+        logger.info("pandoc not available: {}".format(e))
+
+
+def listen(path):
+    """
+    Bind a listening socket at path, readable only by this user,
+    replacing a stale socket but not a running daemon.
+    """
+    sock = connect(path)
+    if sock is not None:
+        sock.close()
+        raise ServeError("mdfic serve is already running on {}".format(path))
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(umask)
+    sock.listen(64)
+    return sock
+
+
+def peer_uid(conn):
+    if SO_PEERCRED is None:
+        return os.getuid()
+    creds = conn.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, struct.calcsize('3i'))
+    return struct.unpack('3i', creds)[1]
+
+
+def stop(path=None):
+    """
+    Ask the daemon at path to exit.  Returns False if none is running.
+    """
+    sock = connect(path or socket_path())
+    if sock is None:
+        return False
+    with sock:
+        send_message(sock, dict(stop=True))
+        sock.recv(STATUS.size)
+    return True
+
+
+def run_request(conn, request, fds):
+    """
+    In a forked child: take over the client's streams and
+    surroundings, run its command and return the exit status.
+    """
+    from . import utils
+    from .cli import cli
+
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    for fd, target in zip(fds, (0, 1, 2)):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdin = open(0, 'r', closefd=False)
+    sys.stdout = open(1, 'w', closefd=False)
+    sys.stderr = open(2, 'w', closefd=False)
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(sys.stderr)
+
+    os.chdir(request['cwd'])
+    os.environ.clear()
+    os.environ.update(request['env'])
+    os.umask(request['umask'])
+    utils._UMASK = request['umask']
+    logging.getLogger().setLevel(os.environ.get('LOG_LEVEL', 'ERROR'))
+
+    def hangup():
+        # the client only closes the connection early if it was interrupted
+        if not conn.recv(1):
+            os.kill(os.getpid(), signal.SIGINT)
+    threading.Thread(target=hangup, daemon=True).start()
+
+    try:
+        cli.main(args=request['argv'], prog_name='mdfic')
+        status = 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            status = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            status = 1
+    except KeyboardInterrupt:
+        status = 130
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return status
+
+
+def serve(path=None, idle_timeout=None):
+    """
+    Warm up and serve requests until stopped, interrupted or
+    idle for idle_timeout seconds.
+    """
+    path = path or socket_path()
+    sock = listen(path)
+    try:
+        logger.info("warming up")
+        warm()
+        # forked children are reaped automatically
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+        sock.settimeout(idle_timeout)
+        print("mdfic serve listening on {}".format(path), flush=True)
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except socket.timeout:
+                logger.info("idle for {}s, exiting".format(idle_timeout))
+                break
+            conn.settimeout(REQUEST_TIMEOUT)
+            with conn:
+                if peer_uid(conn) != os.getuid():
+                    logger.warning("refused a connection from another user")
+                    continue
+                try:
+                    request, fds = recv_message(conn, maxfds=3)
+                except (OSError, ValueError) as e:
+                    logger.warning("bad request: {}".format(e))
+                    continue
+                conn.settimeout(None)
+                if request.get('stop'):
+                    conn.sendall(STATUS.pack(0))
+                    break
+                logger.info("mdfic {}".format(' '.join(request['argv'])))
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    status = 1
+                    try:
+                        sock.close()
+                        status = run_request(conn, request, fds)
+                        # the client hangs up once it has the status
+                        signal.signal(signal.SIGINT, signal.SIG_IGN)
+                        conn.sendall(STATUS.pack(status))
+                    except BaseException:
+                        traceback.print_exc()
+                    finally:
+                        os._exit(status)
+                for fd in fds:
+                    os.close(fd)
+    finally:
+        sock.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,213 @@
+"""
+mdfic.stats - Per-scene and per-chapter statistics for a manuscript.
+
+The text is tokenized in one pass into compact arrays of counts (words
+per paragraph, sentence, scene, ...), and every metric is computed from
+those arrays.  Sentences end at the delimiters `mdfic.tweets` uses.
+Chapters are numbered by their level-one headings; text before the
+first heading is chapter 0.
+"""
+
+import re
+import statistics
+from array import array
+from bisect import bisect_left
+
+from .tweets import SENTENCE_DELIM
+from .utils import split_metadata_and_text
+
+BLANK_LINE = re.compile(r'\n[ \t]*\n')
+RULE = re.compile(r'[ ]{0,3}(?:(?:-[ \t]*){3,}|(?:\*[ \t]*){3,}|(?:_[ \t]*){3,})$')
+DIALOGUE = re.compile(r'"[^"]*"|“[^”]*”')
+
+# Upper bounds of the paragraph-length histogram buckets, in words.
+PARAGRAPH_BUCKETS = (10, 25, 50, 100, 200)
+
+
+class Manuscript:
+    """
+    The counts for one manuscript.  Each array has one entry
+    per paragraph, sentence, scene or chapter.
+    """
+
+    def __init__(self):
+        self.paragraph_words = array('I')
+        self.paragraph_dialogue = array('I')
+        self.sentence_words = array('I')
+        self.scene_words = array('I')
+        self.scene_chapter = array('I')
+        self.chapter_titles = []
+
+
+def blocks(text):
+    """
+    Walk a markdown manuscript (with or without its metadata block)
+    and yield ('chapter', title) at each level-one heading, ('scene',
+    None) at each scene break and ('paragraph', text) for each
+    paragraph of body text.
+    """
+    _, text = split_metadata_and_text(text)
+    for para in BLANK_LINE.split(text):
+        para = para.strip()
+        if not para:
+            continue
+        first, _, rest = para.partition('\n')
+        if first.startswith('# '):
+            yield 'chapter', first[2:].strip()
+            para = rest.strip()
+        elif RULE.match(first):
+            yield 'scene', None
+            para = rest.strip()
+        if para:
+            yield 'paragraph', para
+
+
+def tokenize(text):
+    """
+    Count the words in each paragraph, sentence, scene and
+    chapter of a markdown manuscript (with or without its
+    metadata block).  Headings and scene breaks aren't counted.
+    """
+    m = Manuscript()
+    scene = None
+    for kind, para in blocks(text):
+        if kind == 'chapter':
+            m.chapter_titles.append(para)
+            scene = None
+            continue
+        if kind == 'scene':
+            scene = None
+            continue
+
+        words = len(para.split())
+        if scene is None:
+            if not m.chapter_titles:
+                m.chapter_titles.append(None)
+            scene = len(m.scene_words)
+            m.scene_words.append(0)
+            m.scene_chapter.append(len(m.chapter_titles) - 1)
+        m.scene_words[scene] += words
+        m.paragraph_words.append(words)
+        m.paragraph_dialogue.append(sum(len(d.split()) for d in DIALOGUE.findall(para)))
+        m.sentence_words.extend(n for n in map(len, map(str.split, SENTENCE_DELIM.split(para))) if n)
+    return m
+
+
+def percentile(ordered, p):
+    """
+    The p-th percentile (0-100) of a sorted sequence, by the
+    nearest-rank method.
+    """
+    if not ordered:
+        return 0
+    k = max(0, min(len(ordered) - 1, -(-len(ordered) * p // 100) - 1))
+    return ordered[k]
+
+
+def histogram(values, bounds):
+    """
+    Count the values falling in each bucket (prev bound, bound],
+    plus one bucket for those above the last bound.
+    """
+    counts = [0] * (len(bounds) + 1)
+    for v in values:
+        counts[bisect_left(bounds, v)] += 1
+    labels = []
+    low = 1
+    for b in bounds:
+        labels.append("{}-{}".format(low, b))
+        low = b + 1
+    labels.append("{}+".format(low))
+    return dict(zip(labels, counts))
+
+
+def distribution(values):
+    ordered = sorted(values)
+    return dict(
+        min = ordered[0] if ordered else 0,
+        median = percentile(ordered, 50),
+        mean = round(statistics.fmean(ordered), 1) if ordered else 0,
+        p90 = percentile(ordered, 90),
+        max = ordered[-1] if ordered else 0,
+    )
+
+
+def stats(text, wpm=260):
+    """
+    Return a dict of statistics for the manuscript: totals, reading
+    time at wpm words per minute, dialogue against narration, the
+    sentence- and paragraph-length distributions, and the words in
+    each chapter and scene.
+    """
+    m = tokenize(text)
+    words = sum(m.paragraph_words)
+    dialogue = sum(m.paragraph_dialogue)
+    narration = words - dialogue
+
+    chapter_words = array('I', bytes(4 * len(m.chapter_titles)))
+    chapter_scenes = array('I', bytes(4 * len(m.chapter_titles)))
+    for n, c in zip(m.scene_words, m.scene_chapter):
+        chapter_words[c] += n
+        chapter_scenes[c] += 1
+
+    # chapter 0 is what comes before the first heading
+    first = 0 if m.chapter_titles and m.chapter_titles[0] is None else 1
+
+    scene_in_chapter = []
+    last, i = None, 0
+    for c in m.scene_chapter:
+        i = i + 1 if c == last else 1
+        last = c
+        scene_in_chapter.append(i)
+
+    return dict(
+        words = words,
+        paragraphs = len(m.paragraph_words),
+        sentences = len(m.sentence_words),
+        scenes = len(m.scene_words),
+        chapters = len(m.chapter_titles),
+        reading_minutes = round(words / wpm, 1),
+        dialogue_words = dialogue,
+        narration_words = narration,
+        dialogue_ratio = round(dialogue / narration, 3) if narration else None,
+        sentence_length = distribution(m.sentence_words),
+        paragraph_length = dict(distribution(m.paragraph_words),
+                                histogram=histogram(m.paragraph_words, PARAGRAPH_BUCKETS)),
+        chapter_list = [
+            dict(chapter=c + first, title=title, words=chapter_words[c], scenes=chapter_scenes[c],
+                 reading_minutes=round(chapter_words[c] / wpm, 1))
+            for c, title in enumerate(m.chapter_titles)],
+        scene_list = [
+            dict(chapter=c + first, scene=s, words=n)
+            for c, s, n in zip(m.scene_chapter, scene_in_chapter, m.scene_words)],
+    )
+
+
+def format_table(result):
+    """
+    Format the result of `stats()` as plain text tables.
+    """
+    lines = [
+        "{words} words, {paragraphs} paragraphs, {sentences} sentences, "
+        "{scenes} scenes, {chapters} chapters".format(**result),
+        "reading time: {reading_minutes} minutes".format(**result),
+        "dialogue: {dialogue_words} words, narration: {narration_words} words, "
+        "ratio {dialogue_ratio}".format(**result),
+        "",
+        "{:<12}{:>6}{:>8}{:>8}{:>6}{:>6}".format('', 'min', 'median', 'mean', 'p90', 'max'),
+    ]
+    for name in ['sentence', 'paragraph']:
+        lines.append("{:<12}{min:>6}{median:>8}{mean:>8}{p90:>6}{max:>6}".format(
+            name, **result[name + '_length']))
+    lines += ["", "paragraph length (words):"]
+    for label, count in result['paragraph_length']['histogram'].items():
+        lines.append("  {:>8}  {:>6}".format(label, count))
+    lines += ["", "{:>8}{:>7}{:>9}  {}".format('chapter', 'scene', 'words', 'title')]
+    scenes = iter(result['scene_list'])
+    for chapter in result['chapter_list']:
+        lines.append("{:>8}{:>7}{:>9}  {}".format(
+            chapter['chapter'], '', chapter['words'], chapter['title'] or ''))
+        for _ in range(chapter['scenes']):
+            scene = next(scenes)
+            lines.append("{chapter:>8}{scene:>7}{words:>9}".format(**scene))
+    return '\n'.join(lines)
@@ -0,0 +1,105 @@
+"""
+mdfic.trace - Opt-in structured tracing of mdfic's inner loops.
+
+Modules whose loops run once per HTML token or per lookup don't log
+there, since even a `logger.debug()` call that is dropped costs a call
+and a level check, and building its message costs far more.  Instead
+they get a tracer and guard each event with its `on` flag:
+
+    trace = tracer(__name__)
+    ...
+    if trace.on:
+        trace('starttag', tag=tag, stack=self.stack)
+
+When tracing is off (the default), that is one attribute test.  When
+it's on for a module (`mdfic --trace docx ...`, or `MDFIC_TRACE`), each
+event is written as one JSON line, with its fields, the module and the
+seconds since tracing started; fields are only turned into JSON then.
+"""
+
+import json
+import sys
+import threading
+import time
+
+ALL = 'all'
+
+_tracers = {}
+_modules = set()
+_stream = None
+_start = 0.0
+_lock = threading.Lock()
+
+
+class Tracer:
+    """
+    Writes a module's trace events while tracing is on for it.
+    """
+
+    __slots__ = ('module', 'on')
+
+    def __init__(self, module):
+        self.module = module
+        self.on = False
+
+    def __call__(self, event, **fields):
+        """
+        Write one event.  Callers check `on` first, so that their
+        arguments aren't even gathered when tracing is off.
+        """
+        if not self.on:
+            return
+        record = dict(t=round(time.perf_counter() - _start, 6), module=self.module, event=event)
+        record.update(fields)
+        line = json.dumps(record, default=repr, ensure_ascii=False) + '\n'
+        with _lock:
+            if _stream is not None:
+                _stream.write(line)
+
+
+def module_name(name):
+    """
+    The short name ('docx') of a module name ('mdfic.docx').
+    """
+    return name[len('mdfic.'):] if name.startswith('mdfic.') else name
+
+
+def tracer(name):
+    """
+    Return the tracer for the module called name (pass __name__).
+    """
+    module = module_name(name)
+    with _lock:
+        t = _tracers.get(module)
+        if t is None:
+            t = _tracers[module] = Tracer(module)
+            t.on = _stream is not None and (module in _modules or ALL in _modules)
+        return t
+
+
+def enable(modules, stream=None):
+    """
+    Turn tracing on for modules (short or full names, or 'all'),
+    writing to stream (default: stderr).  Modules imported later
+    are traced too.
+    """
+    global _stream, _start
+    with _lock:
+        _modules.update(module_name(m) for m in modules)
+        _stream = stream or sys.stderr
+        _start = time.perf_counter()
+        for module, t in _tracers.items():
+            t.on = module in _modules or ALL in _modules
+
+
+def disable():
+    """
+    Turn tracing off everywhere.
+    """
+    global _stream
+    with _lock:
+        _modules.clear()
+        _stream = None
+        for t in _tracers.values():
+            t.on = False
+
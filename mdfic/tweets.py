@@ -7,7 +7,7 @@ import logging
 PARAGRAPH_DELIM = re.compile("\n")
 SENTENCE_DELIM = re.compile("[.?!]")
 PHRASE_DELIM = re.compile("[,]")
-WORD_DELIM = re.compile("\s")
+WORD_DELIM = re.compile(r"\s")
 METADATA_DELIM = "\n...\n"
 
 
@@ -1,13 +1,37 @@
 '''
 utilities
 '''
+import os
 import re
+import tempfile
 import yaml
+from contextlib import contextmanager
 from subprocess import Popen,PIPE
 
 import logging
 
+from .instrument import stage
+from .trace import tracer
+
 logger = logging.getLogger(__name__)
+trace = tracer(__name__)
+
+# mkstemp creates files readable only by their owner; atomic_write
+# gives new files the usual permissions instead.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# A markdown horizontal rule (`---`, `***`, `- - -`, ...) on its own line,
+# preceded by a blank line so that it isn't read as a setext heading.
+# This is what mdfic treats as a scene break.
+SCENE_BREAK = re.compile(r'(?:^|\n)[ \t]*\n[ ]{0,3}(?:(?:-[ \t]*){3,}|(?:\*[ \t]*){3,}|(?:_[ \t]*){3,})(?=\n|$)')
+
+# An ATX level-one heading, which starts a chapter.
+CHAPTER_HEADING = re.compile(r'^#[ \t]+\S', re.MULTILINE)
+
+# Footnotes and reference links, which have to be converted in the
+# same pandoc run as the text that refers to them.
+CROSS_REFERENCE = re.compile(r'\[\^|^[ ]{0,3}\[[^\]]+\]:', re.MULTILINE)
 
 
 def fix_sentence_spacing(txt,N=1):
@@ -38,11 +62,41 @@ def split_metadata_and_text(doc):
     else:
         return None,doc
 
+def split_scenes(text):
+    """
+    Split the text of a story (without its metadata block)
+    at scene breaks and return the list of scenes.
+    """
+    return SCENE_BREAK.split(text)
+
+def count_scenes(text):
+    """
+    Return the number of scenes in the text of a story
+    (without its metadata block).  Empty text has no scenes.
+    """
+    if not text.strip():
+        return 0
+    return len(SCENE_BREAK.findall(text)) + 1
+
+def split_chapters(text):
+    """
+    Split the text of a story (without its metadata block) before
+    each level-one heading and return the pieces.  Text before the
+    first heading, if any, is the first piece.
+    """
+    starts = [m.start() for m in CHAPTER_HEADING.finditer(text)]
+    bounds = [0] + [s for s in starts if s > 0] + [len(text)]
+    return [text[a:b] for a, b in zip(bounds, bounds[1:]) if a < b]
+
 def parse_metadata(doc,join='\n'):
     """
     Parse the metadata from a document and parse it
     as a YAML dict and return it.
     """
+    with stage('parse_metadata', len(doc)):
+        return _parse_metadata(doc,join)
+
+def _parse_metadata(doc,join):
     doc = doc.strip()
     yblock,_ = split_metadata_and_text(doc)
     if yblock is not None:
@@ -61,13 +115,175 @@ def parse_metadata(doc,join='\n'):
 def pandoc(input, *args):
     """
     Run pandoc with the given arguments and return
-    the contents of stdout as a string.
+    the contents of stdout as a string.  See `mdfic.pandoc`
+    for timeouts, warnings and running many at once.
+    """
+    from .pandoc import convert
+    return convert(input, *args).output
+
+@contextmanager
+def atomic_write(path, mode='w', **kwargs):
+    """
+    Open a uniquely named temporary file next to path for writing,
+    and rename it to path only if the block completes.  Parallel
+    writers never see each other's partial output.
+    """
+    dirname, basename = os.path.split(os.path.abspath(path))
+    try:
+        perm = os.stat(path).st_mode & 0o7777
+    except OSError:
+        perm = 0o666 & ~_UMASK
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.' + basename + '.', suffix='.tmp')
+    os.chmod(tmp, perm)
+    try:
+        with open(fd, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def write_depfile(path, target, inputs):
+    """
+    Write a make dependency file declaring that target depends on
+    the given input files.  Each input also gets an empty rule, so
+    make doesn't fail if one of them is later deleted.
+    """
+    def escape(name):
+        return name.replace('$', '$$').replace('#', '\\#').replace(' ', '\\ ')
+    inputs = [i for i in inputs if i != '-']
+    lines = ["{}: {}".format(escape(target), ' '.join(escape(i) for i in inputs))]
+    lines += ["{}:".format(escape(i)) for i in inputs]
+    with atomic_write(path) as f:
+        f.write('\n'.join(lines) + '\n')
+
+def cache_dir():
+    """
+    The directory for mdfic's on-disk caches: $MDFIC_CACHE_DIR, or
+    `mdfic` in $XDG_CACHE_HOME (default ~/.cache).  It isn't created
+    here; writers create it when they need it.
+    """
+    if os.environ.get('MDFIC_CACHE_DIR'):
+        return os.environ['MDFIC_CACHE_DIR']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'mdfic')
+
+def cache_read(namespace, key):
+    """
+    Return the text cached under namespace/key, or None.  Reading
+    an entry marks it recently used for `cache_prune`.
+    """
+    path = os.path.join(cache_dir(), namespace, key)
+    try:
+        with open(path, encoding='utf8') as f:
+            text = f.read()
+    except OSError:
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return text
+
+def cache_write(namespace, key, text):
+    """
+    Cache text under namespace/key.  Failing to write the
+    cache is logged, not raised.
     """
-    out,err = Popen(["pandoc"] + list(args),encoding='utf8',stdin=PIPE,stdout=PIPE).communicate(input=input)
+    path = os.path.join(cache_dir(), namespace, key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_write(path, encoding='utf8') as f:
+            f.write(text)
+    except OSError as e:
+        logger.warning("Can't write cache {}: {}".format(path, e))
 
-    if err:
-        print(err)
-    return out
+def cache_prune(namespace, keep):
+    """
+    Remove all but the keep most recently used entries
+    under namespace.  Returns the number removed.
+    """
+    directory = os.path.join(cache_dir(), namespace)
+    entries = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+    except OSError:
+        return 0
+    entries.sort(reverse=True)
+    removed = 0
+    for _, path in entries[keep:]:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+def package_version(name):
+    """
+    The installed version of the distribution name, or 'dev'
+    when running from a checkout that isn't installed.
+    """
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return 'dev'
+
+def source_date(files=()):
+    """
+    The time to stamp on a reproducible build, as an aware UTC
+    datetime: $SOURCE_DATE_EPOCH, else the time of the last git
+    commit touching files, else the newest of their mtimes.
+    """
+    import datetime
+    import subprocess
+
+    files = [f for f in files if f != '-']
+    epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    if not epoch:
+        try:
+            epoch = subprocess.run(['git', 'log', '-1', '--format=%ct', '--'] + files,
+                                   capture_output=True, encoding='utf8', check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            epoch = None
+    if not epoch:
+        mtimes = [os.path.getmtime(f) for f in files if os.path.exists(f)]
+        logger.warning("No SOURCE_DATE_EPOCH or git history; using the inputs' modification time")
+        epoch = max(mtimes) if mtimes else 0
+    return datetime.datetime.fromtimestamp(int(float(epoch)), datetime.timezone.utc)
+
+def zip_date_time(date):
+    """
+    A datetime as a zip entry's date_time; zip can't go before 1980.
+    """
+    return max(date.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+
+def rezip(path, date_time, first=()):
+    """
+    Rewrite the zip file at path reproducibly: entries named in
+    first, then the rest sorted by name, all stamped date_time
+    with the same permissions.
+    """
+    import zipfile
+
+    with zipfile.ZipFile(path) as old:
+        infos = old.infolist()
+        order = sorted(infos, key=lambda i: (i.filename not in first,
+                                             first.index(i.filename) if i.filename in first else 0,
+                                             i.filename))
+        with atomic_write(path, 'wb') as out, zipfile.ZipFile(out, 'w') as new:
+            for info in order:
+                entry = zipfile.ZipInfo(info.filename, date_time=date_time)
+                entry.compress_type = info.compress_type
+                entry.create_system = 3
+                entry.external_attr = 0o644 << 16
+                new.writestr(entry, old.read(info))
 
 def oascript(script):
     """
@@ -77,18 +293,15 @@ def oascript(script):
     Popen(['osascript', '-'], encoding='utf8', stdin=PIPE, stdout=PIPE).communicate(script)
 
 def get_in(D,keys,default):
-    logger.debug(f"GET_IN {D} {keys} {default}")
     try:
         value = D[keys[0]]
         if len(keys) > 1:
             return get_in(value,keys[1:],default)
         else:
             return value
-    except KeyError as e:
-        logger.debug(f"get_in KeyError: {e}")
-        return default
-    except TypeError as e:
-        logger.debug(f"get_in TypeError: {e}")
+    except (KeyError, TypeError) as e:
+        if trace.on:
+            trace('get_in.default', keys=keys, error=type(e).__name__, default=default)
         return default
 
 def int_to_roman(input):
@@ -0,0 +1,187 @@
+"""
+mdfic.watch - Rebuild a story's outputs in-process whenever its sources change.
+
+Changes are found by polling file sizes and mtimes, so this works on any
+system without inotify or other services.  A burst of saves is debounced
+into a single rebuild, and each output is only rebuilt when the contents
+of its own inputs changed.  Imports, the docx template and the parsed
+metadata stay loaded between rebuilds.
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import time
+
+from .normalize import Normalizer
+from .utils import parse_metadata
+
+logger = logging.getLogger(__name__)
+
+# format -> output filename, following the generated Makefiles
+FORMATS = dict(
+    html = 'out/{name}.html',
+    plain = 'out/{name}-plain.docx',
+    sffms = 'out/{name}-sffms.docx',
+    tex = '{name}-sffms.tex',
+    )
+
+
+def snapshot(paths):
+    """
+    Return a dict mapping each path to its (mtime_ns, size),
+    or None if it doesn't exist.
+    """
+    result = {}
+    for p in paths:
+        try:
+            st = os.stat(p)
+            result[p] = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            result[p] = None
+    return result
+
+
+class StoryWatcher:
+    """
+    Watch the sources of the story `name` in `directory` and
+    rebuild the requested formats when they change.
+    """
+
+    def __init__(self, name, directory='.', formats=('html', 'sffms'), css=None,
+                 date=True, pspaces=1, interval=0.5, debounce=0.5):
+        unknown = set(formats) - set(FORMATS)
+        if unknown:
+            raise ValueError("Unknown formats: {}".format(', '.join(sorted(unknown))))
+        self.name = name
+        self.directory = directory
+        self.formats = list(formats)
+        self.css = css
+        self.date = date
+        self.pspaces = pspaces
+        self.normalize = Normalizer(pspaces=pspaces)
+        self.interval = interval
+        self.debounce = debounce
+        # warm state kept between rebuilds
+        self.built = {}
+        self.metadata = {}
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    @property
+    def inputs(self):
+        """
+        metadata.yaml (if present) followed by STORY.md,
+        or the STORY-*.md parts of a multi-part story.
+        """
+        parts = sorted(glob.glob(glob.escape(self.path(self.name)) + '-*.md'))
+        if not parts:
+            parts = [self.path(self.name + '.md')]
+        meta = self.path('metadata.yaml')
+        return ([meta] if os.path.exists(meta) else []) + parts
+
+    def output(self, fmt):
+        return self.path(FORMATS[fmt].format(name=self.name))
+
+    def watched(self):
+        paths = self.inputs + [self.path('metadata.yaml')]
+        if self.css:
+            paths.append(self.css)
+        return sorted(set(paths))
+
+    def read_inputs(self):
+        sources = []
+        for p in self.inputs:
+            with open(p) as f:
+                sources.append(f.read())
+        return sources
+
+    def story_metadata(self, input):
+        digest = hashlib.sha1(input.encode('utf8')).hexdigest()
+        if digest not in self.metadata:
+            if len(self.metadata) > 4:
+                self.metadata.clear()
+            self.metadata[digest] = parse_metadata(input, join='\n')
+        return self.metadata[digest]
+
+    def build(self, force=False):
+        """
+        Rebuild every format whose inputs changed since its last
+        build.  Return a list of (format, output, seconds, error)
+        tuples for the formats that were rebuilt.
+        """
+        from .html import render_html
+        from .docx import render_docx
+        from .latex import latex_story
+
+        try:
+            sources = self.read_inputs()
+            css = b''
+            if self.css:
+                with open(self.css, 'rb') as f:
+                    css = f.read()
+        except OSError as e:
+            # e.g. an editor that saves by delete-and-rename
+            logger.error("Can't read sources: {}".format(e))
+            return [(fmt, self.output(fmt), 0.0, e) for fmt in self.formats]
+        input = ''.join(sources)
+
+        results = []
+        for fmt in self.formats:
+            digest = hashlib.sha1(input.encode('utf8'))
+            if fmt == 'html':
+                digest.update(css)
+            digest = digest.hexdigest()
+            if not force and self.built.get(fmt) == digest:
+                continue
+
+            output = self.output(fmt)
+            os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+            start = time.monotonic()
+            error = None
+            try:
+                if fmt == 'html':
+                    html = render_html(input, css=self.css, metadata=self.story_metadata(input))
+                    with open(output, 'w') as f:
+                        f.write(html)
+                elif fmt == 'tex':
+                    with open(output, 'w') as f:
+                        f.write(latex_story(input, 'sffms').document)
+                else:
+                    spaced = ''.join(map(self.normalize, sources))
+                    render_docx(spaced, output, sffms=(fmt == 'sffms'), date=self.date,
+                                metadata=self.story_metadata(spaced))
+                self.built[fmt] = digest
+            except Exception as e:
+                logger.exception("Error building {}".format(output))
+                error = e
+            results.append((fmt, output, time.monotonic() - start, error))
+        return results
+
+    def wait_for_change(self, timeout=None):
+        """
+        Poll until a watched file changes, then keep polling until
+        nothing has changed for `debounce` seconds.  Return the
+        set of paths that changed, or an empty set on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        before = snapshot(self.watched())
+        while True:
+            time.sleep(self.interval)
+            now = snapshot(self.watched())
+            if now != before:
+                break
+            if deadline is not None and time.monotonic() > deadline:
+                return set()
+
+        quiet_since = time.monotonic()
+        latest = now
+        while time.monotonic() - quiet_since < self.debounce:
+            time.sleep(min(self.interval, self.debounce))
+            current = snapshot(self.watched())
+            if current != latest:
+                latest = current
+                quiet_since = time.monotonic()
+        return {p for p in set(before) | set(latest) if before.get(p) != latest.get(p)}
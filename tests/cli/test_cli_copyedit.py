@@ -28,6 +28,10 @@ class _FakeChain:
         self.calls.append(msg)
         return self.response
 
+    def stream(self, msg):
+        self.calls.append(msg)
+        yield from self.response.partition(" ")
+
 
 def test_copyedit_emits_yaml_frontmatter(cli_runner, monkeypatch, single_story, tmp_path):
     fake = _FakeChain()
@@ -68,3 +72,111 @@ def test_copyedit_passes_strength_to_chain(cli_runner, monkeypatch, single_story
 
     assert all(call["strength"] == "heavy" for call in fake.calls)
     assert all("text" in call for call in fake.calls)
+
+
+@pytest.fixture
+def mock_backend(monkeypatch):
+    """Point the chain at a local benchmarks.mock_llm server."""
+    import threading
+
+    import mdfic.copyedit
+    from benchmarks.mock_llm import Backend, base_url, make_server
+    from langchain_core.output_parsers import StrOutputParser
+
+    backend = Backend(retry_after=0.01)
+    server = make_server(backend)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    chain = (mdfic.copyedit.editprompt
+             | mdfic.copyedit.chat_model(base_url=base_url(server), max_retries=5)
+             | StrOutputParser())
+    monkeypatch.setattr("mdfic.copyedit.copy_editor_chain", chain)
+    yield backend
+    server.shutdown()
+    server.server_close()
+
+
+def test_copyedit_against_mock_keeps_chunk_order(cli_runner, monkeypatch, mock_backend, single_story, tmp_path):
+    from mdfic.copyedit import split_story
+    from mdfic.utils import split_metadata_and_text
+
+    monkeypatch.setattr("mdfic.copyedit.MAX_WORDS", 20)
+    mock_backend.jitter = 0.05
+
+    out = tmp_path / "edited.md"
+    result = cli_runner.invoke(cli, ["copyedit", "--jobs", "4", "-o", str(out), str(single_story)])
+    assert result.exit_code == 0, result.output
+
+    # the mock returns each chunk unchanged
+    _, chunks = split_story(single_story.read_text())
+    _, edited = split_metadata_and_text(out.read_text())
+    assert len(chunks) > 4
+    assert edited.strip() == "\n\n".join(c.strip() for c in chunks)
+    assert mock_backend.counts["completed"] == len(chunks)
+
+
+def test_copyedit_retries_rate_limits(cli_runner, mock_backend, single_story, tmp_path):
+    # with this seed the first request is refused and the retry isn't
+    mock_backend.random.seed(1)
+    mock_backend.rate_limit = 0.5
+
+    out = tmp_path / "edited.md"
+    result = cli_runner.invoke(cli, ["copyedit", "-o", str(out), str(single_story)])
+    assert result.exit_code == 0, result.output
+    assert mock_backend.counts["rate_limited"] > 0
+    assert mock_backend.counts["completed"] == 1
+
+
+class _SlowStartChain:
+    """Streams each chunk's text back, the first chunk slowest."""
+
+    def __init__(self, delays):
+        self.delays = delays
+
+    def stream(self, msg):
+        import time
+
+        n = int(msg["text"].split()[1])
+        time.sleep(self.delays.get(n, 0))
+        for word in msg["text"].split():
+            yield word + " "
+
+
+def test_copyedit_stream_keeps_order_with_jobs(monkeypatch):
+    from mdfic.copyedit import copyedit_stream
+
+    monkeypatch.setattr("mdfic.copyedit.copy_editor_chain", _SlowStartChain({0: 0.2, 1: 0.1}))
+    monkeypatch.setattr("mdfic.copyedit.MAX_WORDS", 1)
+    text = "---\ntitle: T\n...\n\n" + "\n\n".join("chunk {} here.".format(i) for i in range(4))
+
+    pieces = list(copyedit_stream(text, jobs=4))
+    assert pieces[0] == "---\ntitle: T\n...\n\n"
+    assert "".join(pieces[1:]) == "\n\n".join("chunk {} here. ".format(i) for i in range(4)) + "\n"
+
+
+def test_copyedit_without_front_matter(monkeypatch):
+    from mdfic.copyedit import copyedit
+
+    monkeypatch.setattr("mdfic.copyedit.copy_editor_chain", _FakeChain("edited"))
+    assert copyedit("Just a story.") == "edited\n"
+
+
+def test_copyedit_writes_chunks_as_they_arrive(cli_runner, monkeypatch, tmp_path):
+    out = tmp_path / "edited.md"
+    seen = []
+
+    class Chain:
+        def stream(self, msg):
+            # by the time a chunk is sent, the ones before it are in the file
+            seen.append(out.read_text() if out.exists() else "")
+            yield msg["text"].upper()
+
+    monkeypatch.setattr("mdfic.copyedit.copy_editor_chain", Chain())
+    monkeypatch.setattr("mdfic.copyedit.MAX_WORDS", 1)
+    story = tmp_path / "story.md"
+    story.write_text("---\ntitle: T\n...\n\nFirst part.\n\nSecond part.\n")
+
+    result = cli_runner.invoke(cli, ["copyedit", "-o", str(out), str(story)])
+    assert result.exit_code == 0, result.output
+    assert seen[0] == "---\ntitle: T\n...\n\n"
+    assert "FIRST PART." in seen[1]
+    assert out.read_text() == "---\ntitle: T\n...\n\nFIRST PART.\n\nSECOND PART.\n"
@@ -64,6 +64,16 @@ def test_latex_multi_file(cli_runner, multi_metadata, multi_parts):
     assert "\\textbf{Part Two}" in result.output
 
 
+def test_latex_depfile(cli_runner, multi_metadata, multi_parts, tmp_path):
+    out = tmp_path / "story.tex"
+    dep = tmp_path / "story.tex.d"
+    args = ["latex", "-o", str(out), "--depfile", str(dep), str(multi_metadata)] + [str(p) for p in multi_parts]
+    result = cli_runner.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    first = dep.read_text().splitlines()[0]
+    assert first == "{}: {}".format(out, " ".join(str(p) for p in [multi_metadata] + multi_parts))
+
+
 # docx ---------------------------------------------------------
 
 def test_docx_plain_single(cli_runner, single_story, tmp_path):
@@ -94,6 +104,31 @@ def test_docx_sffms_injects_header(cli_runner, single_story, tmp_path):
         assert "word/header1.xml" in z.namelist()
 
 
+def test_docx_sffms_leaves_no_temp_files(cli_runner, single_story, tmp_path):
+    out = tmp_path / "story.docx"
+    dep = tmp_path / "story.docx.d"
+    result = cli_runner.invoke(
+        cli,
+        ["docx", "--sffms", "--no-date", "-o", str(out), "--depfile", str(dep), str(single_story)],
+    )
+    assert result.exit_code == 0, result.output
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["story.docx", "story.docx.d"]
+    assert str(single_story) in dep.read_text()
+
+
+def test_docx_trace_file(cli_runner, single_story, tmp_path):
+    import json
+
+    trace_file = tmp_path / "trace.jsonl"
+    result = cli_runner.invoke(cli, ["--trace", "docx", "--trace-file", str(trace_file),
+                                     "docx", "-o", str(tmp_path / "story.docx"), str(single_story)])
+    assert result.exit_code == 0, result.output
+    events = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    assert {e["module"] for e in events} == {"docx"}
+    assert {"starttag", "endtag", "data"} <= {e["event"] for e in events}
+    assert not result.output
+
+
 def test_docx_multi(cli_runner, multi_metadata, multi_parts, tmp_path):
     out = tmp_path / "story.docx"
     args = [
@@ -108,6 +143,17 @@ def test_docx_multi(cli_runner, multi_metadata, multi_parts, tmp_path):
     assert "Part Two" in body
 
 
+def test_docx_reproducible_uses_artifact_cache(cli_runner, single_story, tmp_path, monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1700000000")
+    monkeypatch.setenv("MDFIC_ARTIFACT_CACHE", str(tmp_path / "artifacts"))
+    outs = [tmp_path / "a.docx", tmp_path / "b.docx"]
+    for out in outs:
+        result = cli_runner.invoke(cli, ["docx", "--sffms", "-o", str(out), str(single_story)])
+        assert result.exit_code == 0, result.output
+    assert outs[0].read_bytes() == outs[1].read_bytes()
+    assert len(list((tmp_path / "artifacts").glob("*/*"))) == 1
+    assert "2023-11-14 22:13" in Document(str(outs[0])).tables[0].cell(0, 0).text
+
 # html ---------------------------------------------------------
 
 def test_html_single(cli_runner, single_story, tmp_path):
@@ -137,3 +183,96 @@ def test_html_multi(cli_runner, multi_metadata, multi_parts, tmp_path):
     content = out.read_text()
     assert "Part One" in content
     assert "Part Two" in content
+
+
+def test_html_pandoc_failure_is_an_error_message(cli_runner, single_story, tmp_path):
+    result = cli_runner.invoke(cli, ["html", "--css", str(tmp_path / "missing.css"),
+                                     "-o", str(tmp_path / "story.html"), str(single_story)])
+    assert result.exit_code == 1
+    assert isinstance(result.exception, SystemExit)
+    assert "Error: pandoc" in result.output
+    assert "missing.css" in result.output
+
+
+def test_html_optimize(cli_runner, single_story, tmp_path):
+    import gzip
+
+    css = tmp_path / "story.css"
+    result = cli_runner.invoke(cli, ["css", "-o", str(css)])
+    out = tmp_path / "story.html"
+    result = cli_runner.invoke(cli, ["html", "--optimize", "-c", str(css), "-o", str(out), str(single_story)])
+    assert result.exit_code == 0, result.output
+    content = out.read_text()
+    assert "\n" not in content.strip()
+    assert ".author:before{content:\"By \"}" in content
+    assert "the <em>quick</em> brown fox" in content
+    assert gzip.decompress((tmp_path / "story.html.gz").read_bytes()).decode("utf8") == content
+
+
+def test_docx_batch(cli_runner, single_story, multi_metadata, multi_parts, tmp_path):
+    jobs = tmp_path / "jobs.yaml"
+    jobs.write_text(
+        "- {{files: [{}], output: {}, sffms: true}}\n"
+        "- {{files: [{}], output: {}}}\n"
+        "- {{files: [{}, {}], output: {}}}\n".format(
+            single_story, tmp_path / "single.docx",
+            tmp_path / "missing.md", tmp_path / "missing.docx",
+            multi_metadata, multi_parts[0], tmp_path / "multi.docx"))
+    result = cli_runner.invoke(cli, ["docx", "--batch", str(jobs), "--jobs", "2"])
+    assert result.exit_code == 1
+    lines = result.output.splitlines()
+    assert lines[0].startswith("ok")
+    assert lines[1].startswith("FAILED") and "missing.md" in lines[1]
+    assert lines[2].startswith("ok")
+    assert lines[3] == "1 of 3 jobs failed"
+    assert Document(str(tmp_path / "single.docx")).paragraphs
+    assert (tmp_path / "multi.docx").exists()
+    assert not (tmp_path / "missing.docx").exists()
+
+
+def test_docx_batch_rejects_files(cli_runner, single_story, tmp_path):
+    jobs = tmp_path / "jobs.yaml"
+    jobs.write_text("[]")
+    result = cli_runner.invoke(cli, ["docx", "--batch", str(jobs), str(single_story)])
+    assert result.exit_code == 2
+
+
+# epub ---------------------------------------------------------
+
+def test_epub_multi(cli_runner, multi_metadata, multi_parts, tmp_path):
+    out = tmp_path / "story.epub"
+    args = ["epub", "-o", str(out), str(multi_metadata)] + [str(p) for p in multi_parts]
+    result = cli_runner.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    with zipfile.ZipFile(out) as z:
+        assert z.namelist()[0] == "mimetype"
+        assert "Two-Part Lipsum" in z.read("EPUB/package.opf").decode("utf8")
+        nav = z.read("EPUB/nav.xhtml").decode("utf8")
+        assert "Part One" in nav
+        assert "EPUB/chapter-002.xhtml" in z.namelist()
+        assert ".author" in z.read("EPUB/style.css").decode("utf8")
+
+
+def test_epub_numbered_scenes(cli_runner, single_story, tmp_path):
+    out = tmp_path / "story.epub"
+    result = cli_runner.invoke(cli, ["epub", "-o", str(out), str(single_story)])
+    assert result.exit_code == 0, result.output
+    with zipfile.ZipFile(out) as z:
+        chapter = z.read("EPUB/chapter-001.xhtml").decode("utf8")
+    assert '<p class="scene-break">I</p>' in chapter
+    assert '<p class="scene-break">II</p>' in chapter
+    assert "<hr />" not in chapter
+
+
+def test_html_pages_by_part(cli_runner, multi_metadata, multi_parts, tmp_path):
+    site = tmp_path / "site"
+    depfile = tmp_path / "site.d"
+    result = cli_runner.invoke(cli, ["html-pages", "--by", "part", "-o", str(site), "--depfile", str(depfile),
+                                     str(multi_metadata)] + [str(p) for p in multi_parts])
+    assert result.exit_code == 0, result.output
+    index = (site / "index.html").read_text()
+    assert '<h1 class="title">Two-Part Lipsum</h1>' in index
+    assert '<a href="chapter-002.html">Part Two</a>' in index
+    assert "Vivamus elementum" in (site / "chapter-002.html").read_text()
+    assert not (site / "chapter-003.html").exists()
+    assert depfile.read_text().startswith("{}: ".format(site / "index.html"))
@@ -0,0 +1,45 @@
+"""End-to-end tests for `mdfic pdf` with the LaTeX run mocked."""
+from mdfic.cli import cli
+
+
+def fake_latex(calls):
+    def run_latex(engine, tex, build_dir, jobname):
+        calls.append(engine)
+        with open(tex) as f:
+            src = f.read()
+        if "\\fail" in src:
+            from mdfic.pdf import LatexError
+            raise LatexError("pdflatex failed on {}:\n! Undefined control sequence.".format(tex))
+        with open("{}/{}.pdf".format(build_dir, jobname), "w") as f:
+            f.write("PDF " + src)
+        with open("{}/{}.aux".format(build_dir, jobname), "w") as f:
+            f.write("aux")
+    return run_latex
+
+
+def test_pdf_default_output_next_to_tex(cli_runner, monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr("mdfic.pdf.run_latex", fake_latex(calls))
+    tex = tmp_path / "story.tex"
+    tex.write_text("hello")
+
+    result = cli_runner.invoke(cli, ["pdf", "--engine", "xelatex", str(tex)])
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "story.pdf").read_text() == "PDF hello"
+    assert (tmp_path / ".story.build" / "story.aux").exists()
+    assert calls == ["xelatex", "xelatex"]
+
+    result = cli_runner.invoke(cli, ["pdf", "--engine", "xelatex", str(tex)])
+    assert result.exit_code == 0, result.output
+    assert len(calls) == 2
+
+
+def test_pdf_reports_latex_errors(cli_runner, monkeypatch, tmp_path):
+    monkeypatch.setattr("mdfic.pdf.run_latex", fake_latex([]))
+    tex = tmp_path / "story.tex"
+    tex.write_text("\\fail")
+
+    result = cli_runner.invoke(cli, ["pdf", "-o", str(tmp_path / "x.pdf"), str(tex)])
+    assert result.exit_code == 1
+    assert "Undefined control sequence" in result.output
+    assert not (tmp_path / "x.pdf").exists()
@@ -19,6 +19,40 @@ def test_wc_uses_asset(cli_runner, single_story):
     assert "TOTAL" in result.output
 
 
+# stats ----------------------------------------------------
+
+def test_stats_table(cli_runner, single_story):
+    result = cli_runner.invoke(cli, ["stats", str(single_story)])
+    assert result.exit_code == 0, result.output
+    assert "2 scenes, 1 chapters" in result.output
+    assert "paragraph length (words):" in result.output
+
+
+def test_stats_json(cli_runner, multi_metadata, multi_parts):
+    import json
+    args = ["stats", "--json", "--wpm", "100", str(multi_metadata)] + [str(p) for p in multi_parts]
+    result = cli_runner.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    data = json.loads(result.output)
+    assert [c["title"] for c in data["chapter_list"]] == ["Part One", "Part Two"]
+    assert data["reading_minutes"] == round(data["words"] / 100, 1)
+
+
+# echoes ---------------------------------------------------
+
+def test_echoes_json(cli_runner, tmp_path):
+    import json
+    story = tmp_path / "story.md"
+    story.write_text("# One\n\nA beat later the door opened.\n\n* * *\n\nA beat later the door shut.\n")
+    result = cli_runner.invoke(cli, ["echoes", "--json", "--n", "3", "--n", "4", str(story)])
+    assert result.exit_code == 0, result.output
+    data = json.loads(result.output)
+    phrases = {p["phrase"]: p for p in data["phrases"]}
+    assert phrases["a beat later"]["locations"] == [[1, 1, 1], [1, 2, 1]]
+    assert "a beat later the" in phrases
+    assert {e["word"] for e in data["echoes"]} == {"beat", "later", "door"}
+
+
 # gitignore ------------------------------------------------
 
 def test_gitignore_default(cli_runner):
@@ -107,3 +141,85 @@ def test_strip_word_doc(cli_runner, tmp_path):
     result = cli_runner.invoke(cli, ["strip-word-doc", str(inp)])
     assert result.exit_code == 0, result.output
     assert result.output == 'hello"world"\n\n'
+
+
+# normalize ------------------------------------------------
+
+def test_normalize(cli_runner, tmp_path):
+    inp = tmp_path / "in.md"
+    inp.write_text('---\ntitle: "A"\n---\n\n"Hi" -- she said...  Ok.\n')
+    out = tmp_path / "out.md"
+    result = cli_runner.invoke(cli, ["normalize", "--quotes", "smart", "--dashes", "unicode",
+                                     "--ellipses", "unicode", "--pspaces", "1",
+                                     "-o", str(out), str(inp)])
+    assert result.exit_code == 0, result.output
+    assert out.read_text() == '---\ntitle: "A"\n---\n\n“Hi” – she said… Ok.\n'
+
+
+# from-docx ------------------------------------------------
+
+def test_from_docx(cli_runner, tmp_path):
+    import docx
+
+    doc = docx.Document()
+    doc.core_properties.title = "Back"
+    doc.add_paragraph("Some ").add_run("edited").italic = True
+    doc.save(str(tmp_path / "in.docx"))
+    out = tmp_path / "out.md"
+    result = cli_runner.invoke(cli, ["from-docx", "-o", str(out), str(tmp_path / "in.docx")])
+    assert result.exit_code == 0, result.output
+    assert out.read_text() == "---\ntitle: Back\n...\n\nSome *edited*\n"
+
+
+def test_from_docx_rejects_other_files(cli_runner, single_story):
+    result = cli_runner.invoke(cli, ["from-docx", str(single_story)])
+    assert result.exit_code == 1
+    assert "isn't a .docx file" in result.output
+
+
+# catalog --------------------------------------------------
+
+def test_catalog_scan_and_query(cli_runner, asset_dir, tmp_path):
+    db = str(tmp_path / "catalog.sqlite")
+    result = cli_runner.invoke(cli, ["catalog", "--db", db, "scan", str(asset_dir)])
+    assert result.exit_code == 0, result.output
+    assert "2 added" in result.output
+
+    result = cli_runner.invoke(
+        cli, ["catalog", "--db", db, "query", "--where", "mdfic.number_scenes=roman"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "A Lipsum Day" in result.output
+    assert "Two-Part Lipsum" not in result.output
+
+
+def test_catalog_query_bad_where(cli_runner, tmp_path):
+    db = str(tmp_path / "catalog.sqlite")
+    result = cli_runner.invoke(cli, ["catalog", "--db", db, "query", "--where", "title"])
+    assert result.exit_code != 0
+
+
+# --profile ------------------------------------------------
+
+def test_profile_writes_stage_report(cli_runner, tmp_path):
+    import json
+
+    inp = tmp_path / "story.md"
+    inp.write_text("one two three")
+    report = tmp_path / "profile.jsonl"
+    result = cli_runner.invoke(cli, ["--profile", str(report), "wc", str(inp)])
+    assert result.exit_code == 0, result.output
+    (line,) = report.read_text().splitlines()
+    record = json.loads(line)
+    assert record["command"] == "wc"
+    stages = {s["stage"]: s for s in record["stages"]}
+    assert stages["count"]["bytes"] == len("one two three")
+    assert "total" in stages
+
+
+def test_profile_env_var(cli_runner, tmp_path, monkeypatch):
+    report = tmp_path / "profile.jsonl"
+    monkeypatch.setenv("MDFIC_PROFILE", str(report))
+    result = cli_runner.invoke(cli, ["css", "-o", str(tmp_path / "x.css")])
+    assert result.exit_code == 0, result.output
+    assert report.exists()
@@ -15,6 +15,14 @@ def pytest_collection_modifyitems(config, items):
             item.add_marker(skip_pandoc)
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    """Keep on-disk caches (e.g. the SFFMS template) out of ~/.cache."""
+    path = tmp_path_factory.mktemp("cache")
+    monkeypatch.setenv("MDFIC_CACHE_DIR", str(path))
+    return path
+
+
 @pytest.fixture
 def cli_runner():
     return CliRunner()
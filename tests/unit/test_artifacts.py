@@ -0,0 +1,64 @@
+import pytest
+
+from mdfic import artifacts
+from mdfic.artifacts import artifact_key, cached_render
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    path = tmp_path / "artifacts"
+    monkeypatch.setenv("MDFIC_ARTIFACT_CACHE", str(path))
+    monkeypatch.setattr(artifacts, "pandoc_version", lambda: "pandoc 9.9")
+    return path
+
+
+def renderer(output, text, calls):
+    def render():
+        calls.append(text)
+        with open(output, "w") as f:
+            f.write(text)
+    return render
+
+
+def test_key_covers_inputs_options_and_files(store, tmp_path):
+    css = tmp_path / "a.css"
+    css.write_text("p {}")
+    key = artifact_key("html", "story", dict(css=True), [str(css)])
+    assert key == artifact_key("html", "story", dict(css=True), [str(css)])
+    assert key != artifact_key("html", "story!", dict(css=True), [str(css)])
+    assert key != artifact_key("tex", "story", dict(css=True), [str(css)])
+    assert key != artifact_key("html", "story", dict(css=False), [str(css)])
+    css.write_text("p { margin: 0 }")
+    assert key != artifact_key("html", "story", dict(css=True), [str(css)])
+
+
+def test_key_covers_pandoc_version(store, monkeypatch):
+    key = artifact_key("html", "story")
+    monkeypatch.setattr(artifacts, "pandoc_version", lambda: "pandoc 10.0")
+    assert key != artifact_key("html", "story")
+
+
+def test_cached_render_reuses_artifact(store, tmp_path):
+    calls = []
+    a, b = tmp_path / "a.html", tmp_path / "b.html"
+    assert not cached_render("html", "story", {}, str(a), renderer(str(a), "<p>1</p>", calls))
+    assert cached_render("html", "story", {}, str(b), renderer(str(b), "<p>2</p>", calls))
+    assert calls == ["<p>1</p>"]
+    assert b.read_text() == "<p>1</p>"
+    assert len(list(store.glob("*/*"))) == 1
+
+
+def test_cached_render_off(tmp_path, monkeypatch):
+    monkeypatch.delenv("MDFIC_ARTIFACT_CACHE", raising=False)
+    calls = []
+    out = tmp_path / "a.html"
+    for _ in range(2):
+        assert not cached_render("html", "story", {}, str(out), renderer(str(out), "x", calls))
+    assert len(calls) == 2
+
+
+def test_stdout_not_cached(store):
+    calls = []
+    assert not cached_render("tex", "story", {}, "-", lambda: calls.append(1))
+    assert calls == [1]
+    assert not store.exists()
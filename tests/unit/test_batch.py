@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from mdfic import batch
+from mdfic.batch import convert, load_jobs
+
+
+@pytest.fixture
+def fake_render(monkeypatch):
+    calls = []
+
+    def render_docx(input, output, sffms=False, date=True, metadata=None, jobs=None, source_date=None):
+        if "BAD" in input:
+            raise ValueError("bad manuscript")
+        if "CRASH" in input:
+            os._exit(1)
+        calls.append(dict(input=input, output=output, sffms=sffms, date=date, source_date=source_date))
+
+    monkeypatch.setattr("mdfic.docx.render_docx", render_docx)
+    monkeypatch.setattr(batch, "warm", lambda: None)
+    return calls
+
+
+# load_jobs ------------------------------------------------
+
+def test_load_jobs_fills_defaults(tmp_path):
+    path = tmp_path / "jobs.yaml"
+    path.write_text("- {files: a.md, output: a.docx}\n- {files: [m.yaml, b.md], output: b.docx, sffms: true}\n")
+    jobs = load_jobs(str(path))
+    assert jobs[0] == dict(files=["a.md"], output="a.docx", sffms=False, date=True, pspaces=1,
+                          reproducible=False)
+    assert jobs[1]["files"] == ["m.yaml", "b.md"]
+    assert jobs[1]["sffms"] is True
+
+
+def test_load_jobs_accepts_json(tmp_path):
+    path = tmp_path / "jobs.json"
+    path.write_text('[{"files": ["a.md"], "output": "a.docx", "date": false}]')
+    assert load_jobs(str(path))[0]["date"] is False
+
+
+@pytest.mark.parametrize("text", ["{files: a.md}", "- {files: a.md}", "- {output: a.docx}"])
+def test_load_jobs_rejects_incomplete(tmp_path, text):
+    path = tmp_path / "jobs.yaml"
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        load_jobs(str(path))
+
+
+# convert --------------------------------------------------
+
+def test_convert_keeps_going_after_failure(fake_render, tmp_path):
+    good = tmp_path / "good.md"
+    good.write_text("One.   Two.")
+    bad = tmp_path / "bad.md"
+    bad.write_text("BAD")
+    jobs = [
+        dict(files=[str(bad)], output="bad.docx", sffms=True, date=True, pspaces=1, reproducible=False),
+        dict(files=[str(tmp_path / "missing.md")], output="missing.docx", sffms=True, date=True, pspaces=1, reproducible=False),
+        dict(files=[str(good)], output="good.docx", sffms=False, date=False, pspaces=2, reproducible=False),
+    ]
+    results = list(convert(jobs, workers=1))
+    assert [r["output"] for r in results] == ["bad.docx", "missing.docx", "good.docx"]
+    assert [r["ok"] for r in results] == [False, False, True]
+    assert results[0]["error"] == "ValueError: bad manuscript"
+    assert results[1]["error"].startswith("FileNotFoundError")
+    assert all(r["seconds"] >= 0 for r in results)
+    assert fake_render == [dict(input="One.  Two.", output="good.docx", sffms=False, date=False,
+                                source_date=None)]
+
+
+def test_convert_reproducible_job(fake_render, tmp_path, monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1700000000")
+    story = tmp_path / "story.md"
+    story.write_text("One.")
+    job = dict(files=[str(story)], output="out.docx", sffms=False, date=True, pspaces=1, reproducible=True)
+    assert [r["ok"] for r in convert([job], workers=1)] == [True]
+    assert fake_render[0]["source_date"].timestamp() == 1700000000
+
+
+def test_convert_survives_a_worker_dying(fake_render, tmp_path):
+    jobs = []
+    for name in ["one", "crash", "two", "three"]:
+        path = tmp_path / (name + ".md")
+        path.write_text(name.upper())
+        jobs.append(dict(files=[str(path)], output=name + ".docx", sffms=False, date=True, pspaces=1,
+                         reproducible=False))
+    results = list(convert(jobs, workers=2))
+    assert [r["output"] for r in results] == ["one.docx", "crash.docx", "two.docx", "three.docx"]
+    assert [r["ok"] for r in results] == [True, False, True, True]
+    assert "worker process died" in results[1]["error"]
@@ -0,0 +1,162 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from benchmarks.bench_cli import mac_word_bytes, regressions
+from benchmarks.manuscript import manuscript
+from mdfic.utils import count_scenes, parse_metadata, split_metadata_and_text
+
+
+# manuscript -----------------------------------------------
+
+def test_manuscript_is_deterministic():
+    assert manuscript(3000, seed=7) == manuscript(3000, seed=7)
+    assert manuscript(3000, seed=7) != manuscript(3000, seed=8)
+
+
+def test_manuscript_hits_word_target():
+    _, body = split_metadata_and_text(manuscript(20000))
+    assert 20000 <= len(body.split()) < 21000
+
+
+def test_manuscript_has_front_matter_and_scenes():
+    text = manuscript(20000, number_scenes="roman")
+    assert parse_metadata(text)["mdfic"]["number_scenes"] == "roman"
+    _, body = split_metadata_and_text(text)
+    assert count_scenes(body) > 4
+    assert "# Chapter 1" in body
+    assert "\n> " in body
+    assert "\n- " in body
+    assert "*" in body
+
+
+# bench_cli helpers ----------------------------------------
+
+def test_mac_word_bytes_uses_carriage_returns():
+    assert mac_word_bytes('"a"\n\nb') == b"\xd2a\xd2\rb"
+
+
+def test_regressions_flags_slowdowns():
+    old = {"results": [{"size": "s", "command": "wc", "median": 1.0},
+                       {"size": "s", "command": "html", "median": 1.0}]}
+    new = {"results": [{"size": "s", "command": "wc", "median": 1.1},
+                       {"size": "s", "command": "html", "median": 2.0},
+                       {"size": "s", "command": "latex", "error": "boom"}]}
+    assert regressions(old, new, 1.25) == [("s", "html", 1.0, 2.0)]
+
+
+# bench_memory helpers -------------------------------------
+
+def test_budgets_cover_every_target_and_size():
+    from benchmarks.bench_memory import TARGETS, load_budgets
+    from benchmarks.manuscript import SIZES
+
+    budgets = load_budgets()
+    for target in TARGETS:
+        assert set(budgets[target]) == set(SIZES)
+
+
+def test_over_budget():
+    from benchmarks.bench_memory import over_budget
+
+    budgets = {"docx": {"novel": 100}}
+    results = [
+        {"target": "docx", "size": "novel", "peak_rss_mib": 150.0},
+        {"target": "docx", "size": "short-story", "peak_rss_mib": 500.0},
+        {"target": "latex", "size": "novel", "peak_rss_mib": 50.0},
+    ]
+    assert over_budget(results, budgets) == results[:1]
+
+
+def test_peak_rss_is_positive():
+    from benchmarks.bench_memory import peak_rss_mib
+
+    assert peak_rss_mib() > 0
+
+
+# mock_llm -------------------------------------------------
+
+@pytest.fixture
+def mock_server():
+    from benchmarks.mock_llm import Backend, make_server
+
+    server = make_server(Backend())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, body):
+    from benchmarks.mock_llm import base_url
+
+    request = urllib.request.Request(base_url(server) + "/chat/completions",
+                                     data=json.dumps(body).encode("utf8"),
+                                     headers={"Content-Type": "application/json"})
+    return urllib.request.urlopen(request, timeout=10)
+
+
+def test_reply_text_is_below_the_rule():
+    from benchmarks.mock_llm import reply_text
+
+    assert reply_text([{"role": "user", "content": "Edit below the #### line.\n####\n\nSome text.\n"}]) == "Some text."
+    assert reply_text([{"role": "user", "content": "no rule"}]) == "no rule"
+
+
+def test_backend_outcomes_follow_rates():
+    from benchmarks.mock_llm import Backend
+
+    backend = Backend(rate_limit=0.25, failure_rate=0.25, seed=1)
+    outcomes = [backend.outcome()[0] for _ in range(2000)]
+    assert 400 < outcomes.count("rate_limited") < 600
+    assert 400 < outcomes.count("failed") < 600
+    assert backend.counts["requests"] == 2000
+
+
+def test_mock_completion(mock_server):
+    with post(mock_server, {"model": "m", "messages": [{"role": "user", "content": "x\n####\nHello there."}]}) as r:
+        body = json.load(r)
+    assert body["choices"][0]["message"]["content"] == "Hello there."
+    assert mock_server.backend.counts["completed"] == 1
+
+
+def test_mock_streams_tokens(mock_server):
+    body = {"model": "m", "stream": True, "messages": [{"role": "user", "content": "####\nHello there."}]}
+    with post(mock_server, body) as r:
+        events = [line[6:] for line in r.read().decode("utf8").splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    deltas = [json.loads(e)["choices"][0]["delta"].get("content", "") for e in events[:-1]]
+    assert "".join(deltas) == "Hello there."
+    assert len(deltas) > 2
+
+
+def test_mock_rate_limits(mock_server):
+    mock_server.backend.rate_limit = 1.0
+    with pytest.raises(urllib.error.HTTPError) as e:
+        post(mock_server, {"messages": [{"role": "user", "content": "hi"}]})
+    assert e.value.code == 429
+    assert e.value.headers["retry-after-ms"] == "100"
+
+
+# bench_copyedit helpers -----------------------------------
+
+def test_percentile():
+    from benchmarks.bench_copyedit import percentile
+
+    assert percentile([], 95) is None
+    assert percentile([3.0], 95) == 3.0
+    assert percentile(list(range(101)), 95) == 95
+    assert percentile([1, 2], 50) == 1.5
+
+
+# bench_trace ----------------------------------------------
+
+def test_guarded_trace_costs_less_than_eager_debug():
+    from benchmarks.bench_trace import call_costs
+
+    costs = call_costs(number=2000)
+    assert set(costs) == {"silent", "guarded", "lazy", "eager"}
+    assert costs["guarded"] < costs["eager"]
@@ -0,0 +1,116 @@
+import os
+import shutil
+
+import pytest
+
+from mdfic.catalog import connect, find_stories, parse_where, query, scan, story_inputs
+
+
+@pytest.fixture
+def tree(tmp_path, asset_dir):
+    shutil.copytree(asset_dir / "single", tmp_path / "single")
+    shutil.copytree(asset_dir / "multi", tmp_path / "multi")
+    return tmp_path
+
+
+@pytest.fixture
+def db(tmp_path):
+    conn = connect(str(tmp_path / "catalog.sqlite"))
+    yield conn
+    conn.close()
+
+
+# story_inputs ---------------------------------------------
+
+def test_story_inputs_puts_metadata_first():
+    inputs = story_inputs("d", ["b.md", "metadata.yaml", "a.md"])
+    assert inputs == [os.path.join("d", f) for f in ["metadata.yaml", "a.md", "b.md"]]
+
+
+def test_story_inputs_skips_generated_multi_story():
+    inputs = story_inputs("d", ["s.md", "s-01.md", "s-02.md", "metadata.yaml"])
+    assert [os.path.basename(p) for p in inputs] == ["metadata.yaml", "s-01.md", "s-02.md"]
+
+
+def test_story_inputs_keeps_single_story_next_to_like_named_file():
+    inputs = story_inputs("d", ["ghost.md", "ghost-notes.md"])
+    assert [os.path.basename(p) for p in inputs] == ["ghost-notes.md", "ghost.md"]
+
+
+def test_story_inputs_multi_part_makefile(tmp_path):
+    from mdfic.makefile import makefile
+
+    (tmp_path / "Makefile").write_text(makefile(name="s", multi=True))
+    names = ["Makefile", "s.md", "s-01.md", "s-02.md", "notes.md"]
+    inputs = story_inputs(str(tmp_path), names)
+    assert [os.path.basename(p) for p in inputs] == ["notes.md", "s-01.md", "s-02.md"]
+
+
+def test_story_inputs_not_a_story():
+    assert story_inputs("d", ["metadata.yaml", "notes.txt"]) == []
+
+
+def test_find_stories_skips_out_dirs(tree):
+    (tree / "single" / "out").mkdir()
+    (tree / "single" / "out" / "x.md").write_text("x")
+    stories = [os.path.basename(s) for s, _ in find_stories(tree)]
+    assert stories == ["multi", "single"]
+
+
+# scan -----------------------------------------------------
+
+def test_scan_records_stories(tree, db):
+    assert scan(db, tree) == dict(added=2, updated=0, unchanged=0, removed=0)
+    rows = {r["title"]: r for r in query(db)}
+    assert rows["A Lipsum Day"]["scenes"] == 2
+    assert rows["Two-Part Lipsum"]["scenes"] == 1
+    assert rows["Two-Part Lipsum"]["words"] > 0
+
+
+def test_rescan_skips_unchanged(tree, db):
+    scan(db, tree)
+    assert scan(db, tree)["unchanged"] == 2
+
+
+def test_rescan_touch_without_change_is_unchanged(tree, db):
+    scan(db, tree)
+    story = tree / "single" / "single.md"
+    st = story.stat()
+    os.utime(story, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert scan(db, tree)["unchanged"] == 2
+
+
+def test_rescan_picks_up_edits_and_removals(tree, db):
+    scan(db, tree)
+    with open(tree / "single" / "single.md", "a") as f:
+        f.write("\n\n---\n\nOne more scene.\n")
+    shutil.rmtree(tree / "multi")
+    counts = scan(db, tree)
+    assert counts["updated"] == 1
+    assert counts["removed"] == 1
+    (row,) = query(db)
+    assert row["scenes"] == 3
+
+
+# query ----------------------------------------------------
+
+def test_query_metadata_condition(tree, db):
+    scan(db, tree)
+    rows = query(db, where=[parse_where("mdfic.number_scenes=roman")])
+    assert [r["title"] for r in rows] == ["A Lipsum Day"]
+
+
+def test_query_word_bounds(tree, db):
+    scan(db, tree)
+    assert query(db, min_words=10**6) == []
+    assert len(query(db, max_words=10**6)) == 2
+
+
+def test_parse_where_reads_yaml_values():
+    assert parse_where("mdfic.number_scenes=true") == ("mdfic.number_scenes", 1)
+    assert parse_where("title=Foo") == ("title", "Foo")
+
+
+def test_parse_where_rejects_missing_equals():
+    with pytest.raises(ValueError):
+        parse_where("title")
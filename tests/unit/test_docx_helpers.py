@@ -1,5 +1,10 @@
+import io
 from xml.dom import minidom
 
+import docx
+import pytest
+
+from mdfic import docx as mdocx
 from mdfic.docx import (
     isemphasis,
     isstrong,
@@ -78,3 +83,128 @@ def test_xml_rel_nums_extracts_numeric_suffixes():
         '</Relationships>'
     )
     assert xml_rel_nums(doc) == [1, 42]
+
+
+# template_bytes -------------------------------------------
+
+@pytest.fixture
+def fresh_templates():
+    mdocx.template_bytes.cache_clear()
+    yield
+    mdocx.template_bytes.cache_clear()
+
+
+def test_sffms_template_cached_on_disk(fresh_templates, cache_dir, monkeypatch):
+    data = mdocx.template_bytes(sffms=True)
+    assert [p.name for p in cache_dir.iterdir()] == [
+        "sffms-template-{}-{}-{}.docx".format(
+            mdocx.package_version("mdfic"), mdocx.package_version("python-docx"),
+            mdocx.SFFMS_STYLE_VERSION)
+    ]
+    normal = docx.Document(io.BytesIO(data)).styles["Normal"]
+    assert normal.font.name == "Courier"
+    assert normal.paragraph_format.line_spacing == 2.0
+
+    # a new process reads the cached file instead of restyling
+    mdocx.template_bytes.cache_clear()
+    monkeypatch.setattr(mdocx, "set_sffms_styles", lambda d: pytest.fail("restyled"))
+    assert mdocx.template_bytes(sffms=True) == data
+
+
+def test_plain_template_not_styled_or_cached(fresh_templates, cache_dir):
+    doc = docx.Document(io.BytesIO(mdocx.template_bytes()))
+    assert doc.styles["Normal"].font.name != "Courier"
+    assert list(cache_dir.iterdir()) == []
+
+
+def test_html2docx_styles_each_document_from_template(fresh_templates, monkeypatch):
+    calls = []
+    styles = mdocx.set_sffms_styles
+    monkeypatch.setattr(mdocx, "set_sffms_styles", lambda d: calls.append(d) or styles(d))
+    for _ in range(3):
+        h = mdocx.HTML2DOCX({"title": "T"}, sffms=True)
+        assert h.doc.styles["Normal"].font.name == "Courier"
+    assert len(calls) == 1
+
+
+def test_html2docx_does_not_leak_metadata():
+    mdocx.HTML2DOCX({"title": "First", "author": "Someone"})
+    h = mdocx.HTML2DOCX({})
+    assert h.title == "Untitled"
+    assert mdocx.METADATA_DEFAULTS["title"] == "Untitled"
+
+
+# html_fragments / paragraph styles ------------------------
+
+STORY = "---\ntitle: T\nmdfic:\n  number_scenes: true\n...\n" + "\n\n---\n\n".join(
+    "Scene {} *one* two.".format(i) for i in range(1, 11)) + "\n"
+
+
+@pytest.fixture
+def fake_pandoc(monkeypatch):
+    calls = []
+
+    def html(input):
+        calls.append(input)
+        _, text = mdocx.split_metadata_and_text(input)
+        return "\n<hr />\n".join(
+            "<p>{}</p>".format(scene.strip().replace("*one*", "<em>one</em>"))
+            for scene in mdocx.split_scenes(text))
+
+    def run_many(conversions, jobs=None):
+        from mdfic.pandoc import Result
+        return [Result(html(input), []) for input, args in conversions]
+
+    monkeypatch.setattr(mdocx, "pandoc", lambda input, *args: html(input))
+    monkeypatch.setattr(mdocx, "run_many", run_many)
+    return calls
+
+
+def document_text(doc):
+    return [(p.text, [(r.text, r.italic) for r in p.runs]) for p in doc.paragraphs]
+
+
+def test_html_fragments_shards_long_stories(fake_pandoc):
+    fragments = list(mdocx.html_fragments(STORY, jobs=4))
+    assert len(fake_pandoc) == 10
+    assert fragments.count("<hr />\n") == 9
+    assert list(mdocx.html_fragments(STORY, jobs=1)) == [mdocx.pandoc(STORY)]
+
+
+def test_html_fragments_whole_story_with_footnotes(fake_pandoc):
+    list(mdocx.html_fragments(STORY + "\nA[^1].\n\n[^1]: n\n", jobs=4))
+    assert len(fake_pandoc) == 1
+
+
+def test_sharded_docx_matches_whole(fake_pandoc, tmp_path, monkeypatch):
+    docs = []
+    monkeypatch.setattr(mdocx.HTML2DOCX, "save", lambda self, output: docs.append(self))
+    mdocx.render_docx(STORY, "a.docx", sffms=True, date=False, jobs=1)
+    mdocx.render_docx(STORY, "b.docx", sffms=True, date=False, jobs=4)
+    whole, sharded = docs
+    assert document_text(whole.doc) == document_text(sharded.doc)
+    assert whole.wordcount == sharded.wordcount == 40
+    assert sharded.scene_number == 11
+
+
+@pytest.mark.parametrize("sffms", [False, True])
+def test_reproducible_docx(fake_pandoc, tmp_path, sffms):
+    import datetime
+    import zipfile
+    built = datetime.datetime(2024, 5, 6, 7, 8, 10, tzinfo=datetime.timezone.utc)
+    for name in ("a.docx", "b.docx"):
+        mdocx.render_docx(STORY, str(tmp_path / name), sffms=sffms, jobs=1, source_date=built)
+    assert (tmp_path / "a.docx").read_bytes() == (tmp_path / "b.docx").read_bytes()
+    with zipfile.ZipFile(tmp_path / "a.docx") as z:
+        assert z.namelist()[0] == "[Content_Types].xml"
+        assert {i.date_time for i in z.infolist()} == {(2024, 5, 6, 7, 8, 10)}
+        assert b"2024-05-06T07:08:10Z" in z.read("docProps/core.xml")
+        assert b"2024-05-06 07:08" in z.read("word/document.xml")
+
+
+def test_heading_runs_take_style_bold(fresh_templates):
+    h = mdocx.HTML2DOCX({"title": "T"}, sffms=True)
+    h.feed("<h1>Chapter</h1><p>plain <strong>bold</strong></p>")
+    heading, para = h.doc.paragraphs[-2:]
+    assert [r.bold for r in heading.runs] == [True]
+    assert [r.bold for r in para.runs] == [False, True]
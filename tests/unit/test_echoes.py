@@ -0,0 +1,78 @@
+from mdfic.echoes import Tokens, repeated_phrases, echoes, format_report
+
+TEXT = """\
+---
+title: T
+---
+
+# One
+
+A beat later she opened the door. The door creaked.
+
+He waited. A beat later the lamp went out.
+
+* * *
+
+The lamp was cold. A beat later nothing.
+
+# Two
+
+She said that it was in the house, and it was.
+"""
+
+
+def test_tokens_locations():
+    tokens = Tokens(TEXT)
+    assert tokens.words[tokens.ids[0]] == "a"
+    assert tokens.location(0) == (1, 1, 1)
+    assert tokens.location(len(tokens.ids) - 1) == (2, 1, 1)
+    # "The lamp was cold" opens the second scene of chapter one
+    lamp = [i for i, t in enumerate(tokens.ids) if tokens.words[t] == "lamp"]
+    assert [tokens.location(i) for i in lamp] == [(1, 1, 2), (1, 2, 1)]
+
+
+def test_repeated_phrases():
+    found = repeated_phrases(Tokens(TEXT))
+    assert found[0]["phrase"] == "a beat later"
+    assert found[0]["count"] == 3
+    assert found[0]["locations"] == [(1, 1, 1), (1, 1, 2), (1, 2, 1)]
+    # stop words only: "it was in", "was in the", ... aren't reported
+    assert all(f["phrase"] != "it was" for f in found)
+    assert not repeated_phrases(Tokens(TEXT), min_count=4)
+
+
+def test_repeated_phrases_stay_in_paragraphs():
+    text = "one two\n\nthree\n\none two\n\nthree\n"
+    # "two three" spans paragraphs
+    assert [f["phrase"] for f in repeated_phrases(Tokens(text), n=2)] == ["one two"]
+    assert repeated_phrases(Tokens("one two three\n\none two three\n"), n=3)[0]["count"] == 2
+
+
+def test_repeated_phrases_stay_in_sentences():
+    text = "Go now, he said. Consectetur went.\n\nStay, he said. Consectetur stayed.\n"
+    assert "he said consectetur" not in [f["phrase"] for f in repeated_phrases(Tokens(text))]
+
+
+def test_text_before_first_chapter_is_chapter_zero():
+    tokens = Tokens("Prologue words.\n\n# Chapter 1\n\nFirst words.\n")
+    assert tokens.location(0) == (0, 1, 1)
+    assert tokens.location(len(tokens.ids) - 1) == (1, 1, 1)
+
+
+def test_echoes():
+    found = {e["word"]: e for e in echoes(Tokens(TEXT), distance=10)}
+    assert found["door"]["count"] == 2
+    assert found["door"]["span"] == 3
+    assert found["lamp"]["locations"] == [(1, 1, 2), (1, 2, 1)]
+    # "beat" comes back 12 words later
+    assert "beat" not in found
+    assert "beat" in {e["word"] for e in echoes(Tokens(TEXT), distance=30)}
+    assert "door" not in {e["word"] for e in echoes(Tokens(TEXT), ignore=["Door"])}
+    assert "door" not in {e["word"] for e in echoes(Tokens(TEXT), min_length=5)}
+
+
+def test_format_report():
+    tokens = Tokens(TEXT)
+    report = format_report(repeated_phrases(tokens), echoes(tokens))
+    assert "3x  a beat later" in report
+    assert "ch1 sc2 p1" in report
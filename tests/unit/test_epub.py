@@ -0,0 +1,148 @@
+import re
+import zipfile
+
+import pytest
+
+from mdfic import epub
+from mdfic.pandoc import Result
+from mdfic.epub import markdown_chunks, render_epub, scene_breaks, split_chapters, stylesheet
+
+
+@pytest.fixture
+def fake_pandoc(monkeypatch):
+    calls = []
+
+    def pandoc(input, *args):
+        calls.append(input)
+        # one <h1> per '# ' line, one <hr /> per '---' line
+        out = []
+        for line in input.splitlines():
+            if line.startswith('# '):
+                out.append('<h1 id="x">{}</h1>'.format(line[2:]))
+            elif line == '---' and out:
+                out.append('<hr />')
+            elif line and not line.startswith(('title:', 'author:', '---', '...')):
+                out.append('<p>{}</p>'.format(line))
+        return '\n'.join(out) + '\n'
+
+    def run_many(conversions, jobs=None):
+        assert len(conversions) <= jobs
+        return [Result(pandoc(input, *args), []) for input, args in conversions]
+
+    monkeypatch.setattr("mdfic.epub.pandoc", pandoc)
+    monkeypatch.setattr("mdfic.epub.run_many", run_many)
+    return calls
+
+
+BOOK = "---\ntitle: A & B\nauthor: Jane\n...\n" + "".join(
+    "# Chapter {}\n\ntext {}\n\n---\n\nmore\n\n".format(i, i) for i in range(1, 11))
+
+
+# helpers --------------------------------------------------
+
+def test_split_chapters():
+    chapters = split_chapters('<p>front</p>\n<h1 id="a">One &amp; <em>Two</em></h1>\n<p>x</p>\n')
+    assert chapters == [
+        (None, '<p>front</p>\n'),
+        ('One & Two', '<h1 id="a">One &amp; <em>Two</em></h1>\n<p>x</p>\n'),
+    ]
+
+
+def test_scene_breaks_dots():
+    assert scene_breaks('<p>a</p><hr /><p>b</p>') == '<p>a</p><p class="scene-break">• • •</p><p>b</p>'
+
+
+def test_scene_breaks_numbered_per_chapter():
+    out = scene_breaks('<h1>C</h1><p>a</p><hr /><p>b</p>', number_scenes='roman')
+    assert out == ('<h1>C</h1>\n<p class="scene-break">I</p><p>a</p>'
+                   '<p class="scene-break">II</p><p>b</p>')
+
+
+def test_scene_breaks_skip_footnotes():
+    out = scene_breaks('<p>a</p><aside id="footnotes"><hr /><ol></ol></aside>')
+    assert 'scene-break' not in out
+    assert '<hr />' in out
+
+
+@pytest.mark.parametrize("number_scenes", [False, True])
+def test_scene_breaks_skip_every_chapters_footnotes(number_scenes):
+    # pandoc --reference-location=section numbers the later asides
+    html = ('<h1>A</h1><p>a</p><hr /><p>b</p><aside id="footnotes" class="footnotes"><hr /><ol></ol></aside>'
+            '<h1>B</h1><p>c</p><hr /><p>d</p><aside id="footnotes-2" class="footnotes"><hr /><ol></ol></aside>')
+    out = ''.join(scene_breaks(body, number_scenes) for _, body in split_chapters(html))
+    asides = re.findall(r'<aside.*?</aside>', out)
+    assert len(asides) == 2
+    assert all('scene-break' not in a and '<hr />' in a for a in asides)
+    assert out.count('scene-break') == (4 if number_scenes else 2)
+
+
+def test_stylesheet_strips_style_tags():
+    css = stylesheet()
+    assert '<style' not in css and '</style>' not in css
+    assert '.scene-break' in css
+
+
+def test_markdown_chunks_split_at_chapters():
+    text = "intro\n" + "".join("# C{}\n\nbody\n\n".format(i) for i in range(8))
+    chunks = markdown_chunks(text, 4)
+    assert ''.join(chunks) == text
+    assert len(chunks) == 4
+    assert all(c.startswith('# ') for c in chunks[1:])
+
+
+# render_epub ----------------------------------------------
+
+def test_render_epub_layout(fake_pandoc, tmp_path):
+    out = tmp_path / "book.epub"
+    render_epub(BOOK, str(out), jobs=1)
+    assert len(fake_pandoc) == 1
+    with zipfile.ZipFile(out) as z:
+        first = z.infolist()[0]
+        assert first.filename == 'mimetype'
+        assert first.compress_type == zipfile.ZIP_STORED
+        assert z.read('mimetype') == b'application/epub+zip'
+        names = z.namelist()
+        assert 'EPUB/chapter-010.xhtml' in names
+        assert 'EPUB/chapter-011.xhtml' not in names
+        opf = z.read('EPUB/package.opf').decode('utf8')
+        assert '<dc:title>A &amp; B</dc:title>' in opf
+        assert '<dc:creator>Jane</dc:creator>' in opf
+        assert '<itemref idref="chapter-010"/>' in opf
+        nav = z.read('EPUB/nav.xhtml').decode('utf8')
+        assert '<a href="chapter-003.xhtml">Chapter 3</a>' in nav
+        chapter = z.read('EPUB/chapter-002.xhtml').decode('utf8')
+        assert 'scene-break' in chapter
+        assert 'href="style.css"' in chapter
+
+
+def test_render_epub_parallel_matches_serial(fake_pandoc, tmp_path):
+    render_epub(BOOK, str(tmp_path / "serial.epub"), jobs=1)
+    render_epub(BOOK, str(tmp_path / "parallel.epub"), jobs=3)
+    assert len(fake_pandoc) == 4
+    with zipfile.ZipFile(tmp_path / "serial.epub") as a, zipfile.ZipFile(tmp_path / "parallel.epub") as b:
+        assert a.namelist() == b.namelist()
+        for name in a.namelist():
+            if name != 'EPUB/package.opf':
+                assert a.read(name) == b.read(name)
+
+
+def test_render_epub_reproducible(fake_pandoc, tmp_path):
+    import datetime
+    built = datetime.datetime(2024, 5, 6, 7, 8, 9, tzinfo=datetime.timezone.utc)
+    render_epub(BOOK, str(tmp_path / "a.epub"), jobs=1, source_date=built)
+    render_epub(BOOK, str(tmp_path / "b.epub"), jobs=3, source_date=built)
+    assert (tmp_path / "a.epub").read_bytes() == (tmp_path / "b.epub").read_bytes()
+    with zipfile.ZipFile(tmp_path / "a.epub") as z:
+        assert {i.date_time for i in z.infolist()} == {(2024, 5, 6, 7, 8, 8)}
+        assert b'dcterms:modified">2024-05-06T07:08:09Z' in z.read('EPUB/package.opf')
+
+
+def test_render_epub_footnotes_single_run(fake_pandoc, tmp_path):
+    render_epub(BOOK + "Note[^1].\n\n[^1]: note\n", str(tmp_path / "b.epub"), jobs=4)
+    assert len(fake_pandoc) == 1
+
+
+def test_identifier_is_stable():
+    meta = dict(title="T", author="A")
+    assert epub.identifier(meta) == epub.identifier(dict(meta))
+    assert epub.identifier(dict(meta, identifier="isbn:1")) == "isbn:1"
@@ -0,0 +1,141 @@
+import io
+import zipfile
+from xml.etree.ElementTree import fromstring
+
+import docx
+import yaml
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from mdfic.docx import HTML2DOCX
+from mdfic.fromdocx import W, docx_to_markdown, emphasize, escape_lines, paragraphs, read_paragraph
+from mdfic.utils import parse_metadata, split_metadata_and_text
+
+NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def to_markdown(source):
+    return "".join(docx_to_markdown(source))
+
+
+def html_docx(tmp_path, html, **metadata):
+    hdocx = HTML2DOCX(metadata)
+    hdocx.feed(html)
+    path = tmp_path / "story.docx"
+    hdocx.save(str(path))
+    return path
+
+
+# emphasize / escaping -------------------------------------
+
+def test_emphasize_hugs_text():
+    runs = [("a ", False, False), ("quick ", False, True), ("fox", False, False)]
+    assert emphasize(runs) == "a *quick* fox"
+
+
+def test_emphasize_nests_bold_in_italic():
+    runs = [("one ", False, True), ("two", True, True), (" three", False, True)]
+    assert emphasize(runs) == "*one **two** three*"
+
+
+def test_emphasize_escapes_markdown():
+    assert emphasize([("2*3_x", False, False)]) == "2\\*3\\_x"
+
+
+def test_escape_lines():
+    assert escape_lines("# not a heading\n1984. A year\n- no list") == \
+        "\\# not a heading\n1984\\. A year\n\\- no list"
+
+
+# read_paragraph -------------------------------------------
+
+def paragraph(xml, styles=None):
+    return read_paragraph(fromstring('<w:p {}>{}</w:p>'.format(NS, xml)), styles or {})
+
+
+def test_tracked_changes_are_accepted():
+    p = paragraph('<w:r><w:t xml:space="preserve">She </w:t></w:r>'
+                  '<w:del><w:r><w:delText>walked</w:delText></w:r></w:del>'
+                  '<w:ins><w:r><w:t>ran</w:t></w:r></w:ins>'
+                  '<w:r><w:t>.</w:t></w:r>')
+    assert p.kind == "text"
+    assert p.text == "She ran."
+
+
+def test_character_styles_and_off_flags():
+    p = paragraph('<w:r><w:rPr><w:rStyle w:val="Emph"/></w:rPr><w:t>so</w:t></w:r>'
+                  '<w:r><w:rPr><w:i w:val="0"/></w:rPr><w:t xml:space="preserve"> plain</w:t></w:r>',
+                  styles={"Emph": "emphasis"})
+    assert p.text == "*so* plain"
+
+
+def test_indented_paragraph_is_a_quote():
+    p = paragraph('<w:pPr><w:ind w:left="1440" w:firstLine="0"/></w:pPr>'
+                  '<w:r><w:t>Quoted</w:t><w:br/><w:t>twice</w:t></w:r>')
+    assert p.kind == "quote"
+    assert p.text == "> Quoted\n> twice"
+
+
+def test_centered_numbers_are_breaks_only_when_centered():
+    assert paragraph('<w:pPr><w:jc w:val="center"/></w:pPr><w:r><w:t>IV</w:t></w:r>').numbering == "roman"
+    assert paragraph('<w:r><w:t>IV</w:t></w:r>').kind == "text"
+    assert paragraph('<w:r><w:t>* * *</w:t></w:r>').kind == "break"
+
+
+def test_empty_paragraph():
+    assert paragraph('<w:r><w:br/><w:br/></w:r>') is None
+
+
+# docx_to_markdown -----------------------------------------
+
+def test_round_trip_through_html2docx(tmp_path):
+    path = html_docx(
+        tmp_path,
+        "<h1>Start</h1>\n<p>One <em>quick</em> line.</p>\n<blockquote><p>A quote.</p></blockquote>\n"
+        "<ul><li>first</li><li>second</li></ul>\n<hr />\n<p>After the <strong>break</strong>.</p>\n",
+        title="A Story", author="Jane Q. Author", mdfic={"number_scenes": "roman"})
+
+    text = to_markdown(path)
+    metadata = parse_metadata(text)
+    assert metadata["title"] == "A Story"
+    assert metadata["author"] == "Jane Q. Author"
+    assert metadata["mdfic"] == {"number_scenes": "roman"}
+    _, body = split_metadata_and_text(text)
+    assert body.strip() == ("# Start\n\nOne *quick* line.\n\n> A quote.\n\n- first\n- second\n\n"
+                            "---\n\nAfter the **break**.")
+
+
+def test_placeholders_and_end_marker_are_dropped(tmp_path):
+    path = html_docx(tmp_path, "<p>Only text.</p>\n")
+    assert to_markdown(path) == "Only text.\n"
+
+
+def test_word_document(tmp_path):
+    doc = docx.Document()
+    doc.core_properties.title = "From Word"
+    doc.core_properties.author = "E. Ditor"
+    doc.add_paragraph("From Word", style="Title")
+    doc.add_paragraph("Chapter", style="Heading 2")
+    table = doc.add_table(rows=1, cols=1)
+    table.cell(0, 0).text = "not story text"
+    doc.add_paragraph("First.")
+    doc.add_paragraph("# # #").alignment = WD_ALIGN_PARAGRAPH.CENTER
+    doc.add_paragraph("A quote", style="Quote")
+    doc.add_paragraph("# # #").alignment = WD_ALIGN_PARAGRAPH.CENTER
+    buf = io.BytesIO()
+    doc.save(buf)
+
+    text = to_markdown(buf)
+    head, body = split_metadata_and_text(text)
+    assert yaml.safe_load(head) == {"title": "From Word", "author": "E. Ditor"}
+    assert body.strip() == "## Chapter\n\nFirst.\n\n---\n\n> A quote"
+
+
+def test_paragraphs_are_released_once_read(tmp_path):
+    path = html_docx(tmp_path, "".join("<p>Paragraph {}.</p>\n".format(i) for i in range(200)))
+
+    with zipfile.ZipFile(path) as z, z.open("word/document.xml") as f:
+        gen = paragraphs(f, {})
+        seen = [next(gen) for _ in range(150)]
+        body = gen.gi_frame.f_locals["body"]
+        assert body.findall(W + "p") == []
+    assert seen[-1].plain == "Paragraph 147."
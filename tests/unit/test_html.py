@@ -0,0 +1,22 @@
+from mdfic.html import replace_scene_breaks
+
+
+PAGE = "<header>\n<h1>T</h1>\n</header>\n<p>a</p>\n<hr />\n<p>b</p>"
+
+
+def test_replace_scene_breaks_dots():
+    out = replace_scene_breaks(PAGE)
+    assert "<hr />" not in out
+    assert "• • •" in out
+
+
+def test_replace_scene_breaks_numbers_first_scene():
+    out = replace_scene_breaks(PAGE, number_scenes=True)
+    assert "</header>\n<center><bold>1</bold></center>" in out
+    assert "<bold>2</bold>" in out
+
+
+def test_replace_scene_breaks_roman():
+    out = replace_scene_breaks(PAGE, number_scenes="roman")
+    assert "<bold>I</bold>" in out
+    assert "<bold>II</bold>" in out
@@ -0,0 +1,62 @@
+import json
+import pstats
+
+import pytest
+
+from mdfic import instrument
+
+
+@pytest.fixture(autouse=True)
+def reset_instrument():
+    yield
+    instrument.disable()
+
+
+def test_disabled_stage_is_shared_noop():
+    assert instrument.stage("x") is instrument.NULL_STAGE
+    with instrument.stage("x") as st:
+        st.add_bytes(10)
+    instrument.enable()
+    assert instrument.report()["stages"] == []
+
+
+def test_enabled_stages_are_summed_by_name():
+    instrument.enable()
+    for _ in range(2):
+        with instrument.stage("read", nbytes=3) as st:
+            st.add_bytes(2)
+    with instrument.stage("write"):
+        pass
+    stages = instrument.report("cmd")["stages"]
+    assert [s["stage"] for s in stages] == ["read", "write"]
+    assert stages[0]["calls"] == 2
+    assert stages[0]["bytes"] == 10
+    assert stages[0]["wall"] >= 0 and stages[0]["cpu"] >= 0
+
+
+def test_stage_records_on_exception():
+    instrument.enable()
+    with pytest.raises(RuntimeError):
+        with instrument.stage("boom"):
+            raise RuntimeError()
+    assert instrument.report()["stages"][0]["calls"] == 1
+
+
+def test_write_report_appends_json_lines(tmp_path):
+    dest = tmp_path / "profile.jsonl"
+    for command in ["a", "b"]:
+        instrument.enable()
+        with instrument.stage("s"):
+            pass
+        instrument.write_report(str(dest), command)
+    lines = [json.loads(line) for line in dest.read_text().splitlines()]
+    assert [r["command"] for r in lines] == ["a", "b"]
+
+
+def test_profile_stage_dumps_cprofile(tmp_path):
+    out = tmp_path / "s.prof"
+    instrument.enable(profile_stage="s", profile_output=str(out))
+    with instrument.stage("s"):
+        sum(range(1000))
+    instrument.write_report(str(tmp_path / "r.jsonl"))
+    assert pstats.Stats(str(out)).total_calls > 0
@@ -1,7 +1,11 @@
+import pytest
+
 from mdfic.latex import (
     SCENE_HR_TEX,
+    BookStory,
     convert_newscenes_to_numbers,
     get_packages,
+    prefix_labels,
     replace_newscene,
     replace_section,
 )
@@ -78,3 +82,63 @@ def test_convert_newscenes_no_breaks_still_numbers_first():
     out = convert_newscenes_to_numbers("just text")
     assert "\\textbf{1}" in out
     assert "just text" in out
+
+
+# BookStory ------------------------------------------------
+
+BOOK = "---\ntitle: B\n...\n" + "".join("# Chapter {}\n\ntext {}\n\n".format(i, i) for i in range(1, 6))
+
+
+@pytest.fixture
+def fake_pandoc(monkeypatch):
+    calls = []
+
+    def convert(input):
+        calls.append(input)
+        return input.replace("# ", "\\chapter{").replace("\n\n", "}\\label{ch}\n", 1)
+
+    def run_many(conversions, jobs=None):
+        from mdfic.pandoc import Result
+        return [Result(convert(input), []) for input, args in conversions]
+
+    monkeypatch.setattr("mdfic.latex.run_many", run_many)
+    monkeypatch.setattr("mdfic.latex.pandoc", lambda input, *args: convert(input))
+    return calls
+
+
+def test_book_converts_each_chapter_once(fake_pandoc):
+    body = BookStory(BOOK).latexbody
+    assert len(fake_pandoc) == 5
+    assert body.count("\\chapter{") == 5
+    assert body.index("Chapter 1") < body.index("Chapter 5")
+
+
+def test_book_reconverts_only_edited_chapter(fake_pandoc):
+    first = BookStory(BOOK).latexbody
+    del fake_pandoc[:]
+    assert BookStory(BOOK).latexbody == first
+    assert fake_pandoc == []
+    edited = BookStory(BOOK.replace("text 3", "text three")).latexbody
+    assert fake_pandoc == ["# Chapter 3\n\ntext three\n\n"]
+    assert "text three" in edited and "text 2" in edited
+
+
+def test_book_with_footnotes_converted_whole(fake_pandoc):
+    BookStory(BOOK + "A note[^1].\n\n[^1]: note\n").latexbody
+    assert len(fake_pandoc) == 1
+
+
+def test_book_labels_are_unique_per_chapter(fake_pandoc):
+    body = BookStory(BOOK).latexbody
+    assert ["\\label{{ch{}-ch}}".format(i) in body for i in range(1, 6)] == [True] * 5
+
+
+def test_book_with_internal_links_converted_whole(fake_pandoc):
+    BookStory(BOOK + "See [the start](#chapter-1).\n").latexbody
+    assert len(fake_pandoc) == 1
+
+
+def test_prefix_labels():
+    latex = "\\section{Scene}\\label{scene}\nsee \\hyperref[scene]{here}, p.~\\pageref{scene}"
+    assert prefix_labels(latex, "ch2-") == (
+        "\\section{Scene}\\label{ch2-scene}\nsee \\hyperref[ch2-scene]{here}, p.~\\pageref{ch2-scene}")
@@ -32,3 +32,58 @@ def test_makefile_multi_latex():
 def test_makefile_substitutes_arbitrary_name():
     out = makefile(name="my-special-story")
     assert "STORY=my-special-story" in out
+
+
+def test_makefile_single_targets_depend_on_metadata():
+    out = makefile(name="foo")
+    for rule in ["out/%.html:", "out/%-plain.docx:", "out/%-sffms.docx:", "out/%.epub:"]:
+        line = next(l for l in out.splitlines() if l.startswith(rule))
+        assert "$(META)" in line
+
+
+def test_makefile_writes_and_includes_depfiles():
+    for multi in [False, True]:
+        out = makefile(name="foo", multi=multi)
+        assert out.count("--depfile=$@.d") == 6
+        assert "-include $(wildcard *.d out/*.d out/web/*.d)" in out
+
+
+def test_makefile_is_parallel_safe():
+    for multi in [False, True]:
+        out = makefile(name="foo", multi=multi, latex=True)
+        assert "mkdir -p out" in out
+        assert "\topen " not in out
+        assert "$(OPEN)" in out
+        assert "mdfic pdf --engine=pdflatex --output=$@ $<" in out
+        assert "mv `basename" not in out
+
+
+def test_makefile_multi_concatenates_atomically():
+    out = makefile(name="foo", multi=True)
+    assert "> $@.$$$$.tmp && mv $@.$$$$.tmp $@" in out
+    assert "tex: $(STORY)-article.tex $(STORY)-sffms.tex" in out
+
+
+def test_makefile_epub_uses_mdfic():
+    for multi in [False, True]:
+        out = makefile(name="foo", multi=multi)
+        assert "mdfic epub --output=$@" in out
+
+
+def test_makefile_html_pages():
+    out = makefile(name="foo")
+    assert "htmlpages: out/$(STORY)/index.html" in out
+    assert "mdfic html-pages --output=out/$* " in out
+    out = makefile(name="foo", multi=True)
+    assert "default: pdf html htmlpages docx epub" in out
+    assert "mdfic html-pages --by=part --output=out/$(STORY) " in out
+
+
+def test_makefile_optimized_html_is_one_grouped_rule():
+    for multi in [False, True]:
+        out = makefile(name="foo", multi=multi)
+        assert "web: out/web/$(STORY).html.gz out/web/$(STORY)/index.html" in out
+        rules = [l for l in out.splitlines() if l.startswith("out/web/%.html out/web/%.html.gz:")]
+        assert len(rules) == 1
+        assert "mdfic html --optimize --css=out/$*.css --output=out/web/$*.html " in out
+        assert "html-pages" in out and "--optimize --output=out/web/" in out
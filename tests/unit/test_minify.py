@@ -0,0 +1,76 @@
+import gzip
+
+from mdfic import minify
+from mdfic.minify import minify_css, minify_html, precompress
+
+
+# minify_css -----------------------------------------------
+
+def test_minify_css_drops_comments_and_space():
+    css = "/* note */\nbody {\n  color : red;\n  margin: 0 auto;\n}\np, h2 > em { x: 1 }\n"
+    assert minify_css(css) == "body{color :red;margin:0 auto}p,h2>em{x:1}"
+
+
+def test_minify_css_keeps_strings_and_descendant_selectors():
+    css = '.author:before { content: "By  /* not a comment */ "; }\na :hover { y: 2; }'
+    assert minify_css(css) == '.author:before{content:"By  /* not a comment */ "}a :hover{y:2}'
+
+
+def test_minify_css_leaves_selector_colons():
+    css = 'p: first-line { x: 1 }\na :hover, b[title="a: b"] { content: "c: d"; y: 2 }'
+    assert minify_css(css) == 'p: first-line{x:1}a :hover,b[title="a: b"]{content:"c: d";y:2}'
+
+
+def test_minify_css_media_queries():
+    assert minify_css("@media (max-width: 600px) {\n  body { font-size: 0.9em; }\n}") == \
+        "@media (max-width:600px){body{font-size:0.9em}}"
+
+
+# minify_html ----------------------------------------------
+
+def test_minify_html_drops_space_between_blocks():
+    html = "<html>\n<head>\n  <title>T</title>\n</head>\n<body>\n<p>One\n  two</p>\n\n<p>Three</p>\n</body>\n</html>\n"
+    assert minify_html(html) == "<html><head><title>T</title></head><body><p>One two</p><p>Three</p></body></html>\n"
+
+
+def test_minify_html_keeps_inline_spaces():
+    assert minify_html("<p>a <em>quick</em>\n<strong>fox</strong> ran</p>") == \
+        "<p>a <em>quick</em> <strong>fox</strong> ran</p>\n"
+
+
+def test_minify_html_keeps_inline_code():
+    assert minify_html("<p>run <code>a  b\n  c</code>  now</p>") == "<p>run <code>a  b\n  c</code> now</p>\n"
+
+
+def test_minify_html_keeps_pre_and_script():
+    html = "<pre>  keep\n   this</pre>\n<script>if (a  <  b) {}</script>"
+    assert minify_html(html) == "<pre>  keep\n   this</pre><script>if (a  <  b) {}</script>\n"
+
+
+def test_minify_html_comments_and_styles():
+    html = "<head><!-- gone --><!--[if IE]>kept<![endif]--><style>\n p { color: red; }\n</style></head>"
+    assert minify_html(html) == "<head><!--[if IE]>kept<![endif]--><style>p{color:red}</style></head>\n"
+
+
+# precompress ----------------------------------------------
+
+def test_precompress_gzip_is_reproducible(tmp_path, monkeypatch):
+    monkeypatch.setattr(minify, "brotli_compress", lambda data: None)
+    page = tmp_path / "story.html"
+    page.write_text("<p>hello</p>\n" * 100)
+
+    assert precompress(str(page)) == [str(page) + ".gz"]
+    first = (tmp_path / "story.html.gz").read_bytes()
+    assert gzip.decompress(first) == page.read_bytes()
+    precompress(str(page))
+    assert (tmp_path / "story.html.gz").read_bytes() == first
+    assert not (tmp_path / "story.html.br").exists()
+
+
+def test_precompress_brotli_when_available(tmp_path, monkeypatch):
+    monkeypatch.setattr(minify, "brotli_compress", lambda data: b"BR" + data)
+    page = tmp_path / "story.html"
+    page.write_text("<p>hello</p>\n")
+
+    assert precompress(str(page)) == [str(page) + ".gz", str(page) + ".br"]
+    assert (tmp_path / "story.html.br").read_bytes() == b"BR<p>hello</p>\n"
@@ -0,0 +1,98 @@
+import io
+
+import pytest
+
+from mdfic.normalize import Normalizer, chunks
+from mdfic.utils import fix_sentence_spacing
+
+STORY = """\
+---
+title: "Dr. Who's Story" ...
+---
+
+# One
+
+"Hello," she said -- and then---nothing. It's the '90s...   Wait.  
+He said 'hi' . . . then `a--b "x"` and <a href="x--y">a link</a> [here](http://a--b).
+
+
+
+---
+
+| a | b |
+|---|---|
+*"Quoted"*\t
+"""
+
+
+def test_nothing_on_leaves_text_alone():
+    assert Normalizer()(STORY) == STORY
+
+
+def test_pspaces_matches_fix_sentence_spacing():
+    text = "Hi.  There.   Friend. Done."
+    for n in (0, 1, 2):
+        assert Normalizer(pspaces=n)(text) == fix_sentence_spacing(text, N=n)
+
+
+def test_pspaces_alone_spares_metadata():
+    text = "---\ntitle: Mr.  Smith\n...\nHi.  There.\n"
+    assert Normalizer(pspaces=1)(text) == "---\ntitle: Mr.  Smith\n...\nHi. There.\n"
+
+
+def test_pspaces_with_whitespace_trims_line_ends():
+    normalizer = Normalizer(pspaces=1, whitespace=True)
+    assert normalizer("End. \nNext.   Then.\n") == "End.\nNext. Then.\n"
+    # two or more are still a hard line break
+    assert normalizer("End.   \nNext.\n") == "End.  \nNext.\n"
+
+
+def test_smart_quotes_dashes_and_ellipses():
+    out = Normalizer(quotes='smart', dashes='unicode', ellipses='unicode')(STORY)
+    assert '“Hello,” she said – and then—nothing.' in out
+    assert "It’s the ’90s…" in out
+    assert "He said ‘hi’ … then" in out
+    assert '*“Quoted”*' in out
+
+
+def test_protected_text_is_unchanged():
+    out = Normalizer(pspaces=2, quotes='smart', dashes='unicode', ellipses='unicode', whitespace=True)(STORY)
+    assert out.startswith('---\ntitle: "Dr. Who\'s Story" ...\n---\n')
+    assert '`a--b "x"`' in out
+    assert '<a href="x--y">' in out
+    assert '(http://a--b)' in out
+    assert '\n---\n' in out
+    assert '|---|---|' in out
+
+
+def test_straight_and_ascii_undo_smart_and_unicode():
+    smart = Normalizer(quotes='smart', dashes='unicode')(STORY)
+    back = Normalizer(quotes='straight', dashes='ascii')(smart)
+    assert back == STORY
+    assert Normalizer(ellipses='ascii')("Wait… and . . . then") == "Wait... and ... then"
+
+
+def test_whitespace():
+    text = "One  two.  \nhard break  \nsoft \t\n\n \n\n\r\nthree​\r\n"
+    out = Normalizer(whitespace=True)(text)
+    assert out == "One two.  \nhard break  \nsoft\n\nthree\n"
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_stream_matches_whole_text(size):
+    normalizer = Normalizer(pspaces=1, quotes='smart', dashes='unicode', ellipses='unicode',
+                            whitespace=True)
+    text = STORY * 3 + "no newline at the end"
+    streamed = ''.join(normalizer.stream(chunks(io.StringIO(text), size)))
+    assert streamed == normalizer(text)
+
+
+def test_stream_without_metadata():
+    normalizer = Normalizer(dashes='unicode')
+    text = "--- is a rule only\n\nsaid -- she\n" * 2
+    assert ''.join(normalizer.stream(chunks(io.StringIO(text), 2))) == normalizer(text)
+
+
+def test_unknown_choice():
+    with pytest.raises(ValueError):
+        Normalizer(quotes='curly')
@@ -0,0 +1,88 @@
+import pytest
+
+from mdfic.paginate import join_parts, pager, render_pages, split_parts, stale_files
+
+
+@pytest.fixture
+def fake_pandoc(monkeypatch):
+    def pandoc(input, *args):
+        # one <h1> per '# ' line, one <hr /> per '---' line, tags and comments kept
+        out = []
+        for line in input.splitlines():
+            if line.startswith('# '):
+                out.append('<h1 id="x">{}</h1>'.format(line[2:]))
+            elif line == '---' and out:
+                out.append('<hr />')
+            elif line.startswith('<'):
+                out.append(line)
+            elif line and not line.startswith(('title:', 'author:', '---', '...')):
+                out.append('<p>{}</p>'.format(line))
+        return '\n'.join(out) + '\n'
+
+    monkeypatch.setattr("mdfic.epub.pandoc", pandoc)
+
+
+BOOK = "---\ntitle: A & B\nauthor: Jane\n...\n" + "".join(
+    "# Chapter {}\n\ntext {}\n\n---\n\nmore\n\n".format(i, i) for i in range(1, 4))
+
+
+def test_split_parts():
+    # what pandoc makes of a metadata file and two parts
+    fragment = join_parts(["", "<p>one</p>\n", "<h2>Two &amp; a</h2>\n<p>2</p>\n"])
+    assert split_parts(fragment) == [("Part 1", "<p>one</p>\n"), ("Two & a", "<h2>Two &amp; a</h2>\n<p>2</p>\n")]
+
+
+def test_pager():
+    assert 'rel="prev"' not in pager(0, 3)
+    assert 'href="chapter-001.html">Next' in pager(0, 3)
+    assert 'rel="prev" href="index.html"' in pager(1, 3)
+    assert 'Contents' in pager(2, 3)
+    assert 'rel="next"' not in pager(2, 3)
+
+
+def test_render_pages(fake_pandoc, tmp_path):
+    written = render_pages(BOOK, str(tmp_path / "site"), jobs=1)
+    names = sorted(p.name for p in (tmp_path / "site").iterdir())
+    css = [n for n in names if n.startswith("style-")]
+    assert len(css) == 1
+    assert names == ["chapter-001.html", "chapter-002.html", "chapter-003.html", "index.html"] + css
+    assert len(written) == 5
+
+    index = (tmp_path / "site" / "index.html").read_text()
+    assert '<h1 class="title">A &amp; B</h1>' in index
+    assert '<li><a href="chapter-002.html">Chapter 2</a></li>' in index
+    for name in names:
+        if name.endswith(".html"):
+            assert 'href="{}"'.format(css[0]) in (tmp_path / "site" / name).read_text()
+
+    second = (tmp_path / "site" / "chapter-002.html").read_text()
+    assert "<title>Chapter 2 - A &amp; B</title>" in second
+    assert '<link rel="prefetch" href="chapter-003.html" />' in second
+    assert '<p class="scene-break">• • •</p>' in second
+    assert "END" not in second
+    assert '<p class="scene-break">END</p>' in (tmp_path / "site" / "chapter-003.html").read_text()
+
+
+def test_render_pages_removes_stale_pages(fake_pandoc, tmp_path):
+    site = tmp_path / "site"
+    render_pages(BOOK, str(site), jobs=1, optimize=True)
+    assert (site / "chapter-003.html.gz").exists()
+    render_pages("# Only\n\ntext\n", str(site), jobs=1)
+    assert sorted(p.name for p in site.iterdir() if not p.name.startswith("style-")) == \
+        ["chapter-001.html", "index.html"]
+    assert stale_files(str(site), {"index.html", "chapter-001.html"}) == \
+        [str(p) for p in site.iterdir() if p.name.startswith("style-")]
+
+
+@pytest.mark.parametrize("number_scenes", [False, True])
+def test_render_pages_leaves_later_footnotes_alone(fake_pandoc, tmp_path, number_scenes):
+    notes = '<aside id="footnotes{}" class="footnotes"><hr /><ol><li>note</li></ol></aside>'
+    book = "".join("# Chapter {}\n\ntext\n\n---\n\nmore\n\n{}\n\n".format(i, notes.format(suffix))
+                   for i, suffix in [(1, ""), (2, "-2"), (3, "-3")])
+    metadata = dict(title="T", mdfic=dict(number_scenes=number_scenes))
+    render_pages(book, str(tmp_path / "site"), metadata=metadata, jobs=1)
+    for i in (1, 2, 3):
+        page = (tmp_path / "site" / "chapter-00{}.html".format(i)).read_text()
+        aside = page[page.index("<aside"):page.index("</aside>")]
+        assert "<hr />" in aside and "scene-break" not in aside
+        assert "scene-break" in page[:page.index("<aside")]
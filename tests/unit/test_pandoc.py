@@ -0,0 +1,116 @@
+import os
+import stat
+import sys
+import textwrap
+import time
+
+import pytest
+
+from mdfic.pandoc import PandocError, PandocWarning, convert, parse_warnings, run_many
+from mdfic.utils import pandoc
+
+
+FAKE = """\
+#!{python}
+import os, sys, time
+mode = os.environ.get("FAKE_PANDOC", "echo")
+log = os.environ.get("FAKE_PANDOC_LOG")
+if log:
+    with open(log, "a") as f:
+        f.write("start\\n")
+data = sys.stdin.read()
+if mode == "warn":
+    sys.stderr.write("[WARNING] Missing character: x\\n  in font y\\nplain line\\n")
+elif mode == "fail":
+    sys.stderr.write("pandoc: unknown option\\n")
+    sys.exit(2)
+elif mode == "sleep":
+    time.sleep(float(os.environ.get("FAKE_PANDOC_SLEEP", "10")))
+sys.stdout.write(data.upper())
+if log:
+    with open(log, "a") as f:
+        f.write("end\\n")
+"""
+
+
+@pytest.fixture
+def fake_pandoc(tmp_path, monkeypatch):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    script = bindir / "pandoc"
+    script.write_text(FAKE.format(python=sys.executable))
+    script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", str(bindir) + os.pathsep + os.environ["PATH"])
+    monkeypatch.delenv("MDFIC_PANDOC_TIMEOUT", raising=False)
+    return monkeypatch
+
+
+# parse_warnings -------------------------------------------
+
+def test_parse_warnings_levels_and_continuations():
+    stderr = "[WARNING] Missing character\n  continued here\n\n[INFO] note\nstray\n"
+    assert parse_warnings(stderr) == [
+        PandocWarning("WARNING", "Missing character\ncontinued here"),
+        PandocWarning("INFO", "note"),
+        PandocWarning(None, "stray"),
+    ]
+
+
+def test_parse_warnings_empty():
+    assert parse_warnings("") == []
+
+
+# convert / run_many ---------------------------------------
+
+def test_convert_captures_warnings(fake_pandoc, caplog):
+    fake_pandoc.setenv("FAKE_PANDOC", "warn")
+    result = convert("abc", "--to=html")
+    assert result.output == "ABC"
+    assert result.warnings == [
+        PandocWarning("WARNING", "Missing character: x\nin font y"),
+        PandocWarning(None, "plain line"),
+    ]
+    assert "Missing character" in caplog.text
+
+
+def test_convert_failure_raises(fake_pandoc):
+    fake_pandoc.setenv("FAKE_PANDOC", "fail")
+    with pytest.raises(PandocError) as e:
+        convert("abc")
+    assert e.value.returncode == 2
+    assert "unknown option" in e.value.stderr
+
+
+def test_convert_timeout_from_environment(fake_pandoc):
+    fake_pandoc.setenv("FAKE_PANDOC", "sleep")
+    fake_pandoc.setenv("MDFIC_PANDOC_TIMEOUT", "0.5")
+    start = time.monotonic()
+    with pytest.raises(PandocError, match="timed out"):
+        convert("abc")
+    assert time.monotonic() - start < 5
+
+
+def test_utils_pandoc_wrapper_returns_output(fake_pandoc):
+    assert pandoc("abc", "--to=html") == "ABC"
+
+
+def test_run_many_keeps_order_and_caps_concurrency(fake_pandoc, tmp_path):
+    log = tmp_path / "log"
+    fake_pandoc.setenv("FAKE_PANDOC", "sleep")
+    fake_pandoc.setenv("FAKE_PANDOC_SLEEP", "0.3")
+    fake_pandoc.setenv("FAKE_PANDOC_LOG", str(log))
+    results = run_many([(c, ("--to=html",)) for c in "abcde"], jobs=2)
+    assert [r.output for r in results] == list("ABCDE")
+    running = peak = 0
+    for line in log.read_text().split():
+        running += 1 if line == "start" else -1
+        peak = max(peak, running)
+    assert peak <= 2
+
+
+def test_run_many_kills_hung_pandoc(fake_pandoc):
+    fake_pandoc.setenv("FAKE_PANDOC", "sleep")
+    start = time.monotonic()
+    with pytest.raises(PandocError, match="timed out"):
+        run_many([("a", ()), ("b", ())], jobs=2, timeout=0.5)
+    assert time.monotonic() - start < 5
@@ -0,0 +1,140 @@
+import os
+import stat
+import sys
+
+import pytest
+
+from mdfic.pdf import LatexError, compile_pdf, default_build_dir, errors
+
+
+# A stand-in for pdflatex: each run bumps a counter in the .aux file
+# until it reaches the number of passes the document asks for with
+# `%passes=N`, and writes the document into the .pdf.  `\fail` in the
+# document makes it fail like LaTeX does.  With -recorder, files named
+# by `%input=NAME` are listed in the .fls file, as LaTeX lists what it
+# reads.
+FAKE = """\
+#!{python}
+import os, sys
+args = sys.argv[1:]
+opts = dict(a.lstrip('-').split('=', 1) for a in args[:-1] if '=' in a)
+tex = args[-1]
+with open(os.environ['FAKE_LATEX_LOG'], 'a') as f:
+    f.write(tex + '\\n')
+src = open(tex).read()
+base = os.path.join(opts['output-directory'], opts['jobname'])
+if '\\\\fail' in src:
+    open(base + '.log', 'w').write('This is fake\\n! Undefined control sequence.\\nl.3 \\\\fail\\n')
+    sys.exit(1)
+passes = int(src.split('%passes=')[1].split()[0]) if '%passes=' in src else 1
+try:
+    n = int(open(base + '.aux').read())
+except OSError:
+    n = 0
+open(base + '.aux', 'w').write(str(min(n + 1, passes)))
+pdf = 'PDF ' + src
+inputs = [w.split('=', 1)[1] for w in src.split() if w.startswith('%input=')]
+for name in inputs:
+    pdf += open(name).read()
+if '-recorder' in args:
+    with open(base + '.fls', 'w') as f:
+        f.write('PWD ' + os.getcwd() + '\\n')
+        f.write('INPUT ' + tex + '\\n')
+        f.write('INPUT ' + base + '.aux\\n')
+        for name in inputs:
+            f.write('INPUT ' + name + '\\n')
+open(base + '.pdf', 'w').write(pdf)
+"""
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    script = tmp_path / "fakelatex"
+    script.write_text(FAKE.format(python=sys.executable))
+    script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    log = tmp_path / "runs.log"
+    log.write_text("")
+    monkeypatch.setenv("FAKE_LATEX_LOG", str(log))
+    return str(script), log
+
+
+def runs(log):
+    return len(log.read_text().splitlines())
+
+
+def test_default_build_dir():
+    assert default_build_dir("out/story.pdf") == os.path.abspath("out/.story.build")
+
+
+def test_errors_picks_error_lines():
+    log = "noise\n! Missing $ inserted.\nl.12 x\n\nmore\n"
+    assert errors(log) == "! Missing $ inserted.\nl.12 x\n"
+
+
+def test_runs_until_aux_is_stable(engine, tmp_path):
+    script, log = engine
+    tex = tmp_path / "story.tex"
+    tex.write_text("draft %passes=1\n")
+    out = tmp_path / "out" / "story.pdf"
+    out.parent.mkdir()
+    assert compile_pdf(str(tex), str(out), engine=script) == 2
+    assert out.read_text() == "PDF draft %passes=1\n"
+
+    book = tmp_path / "book.tex"
+    book.write_text("toc %passes=2\n")
+    assert compile_pdf(str(book), str(tmp_path / "book.pdf"), engine=script) == 3
+
+
+def test_unchanged_document_skips_latex(engine, tmp_path):
+    script, log = engine
+    tex = tmp_path / "story.tex"
+    tex.write_text("draft\n")
+    out = tmp_path / "story.pdf"
+    compile_pdf(str(tex), str(out), engine=script)
+    before = runs(log)
+    out.unlink()
+    assert compile_pdf(str(tex), str(out), engine=script) == 0
+    assert runs(log) == before
+    assert out.read_text() == "PDF draft\n"
+
+    # an edit that leaves the aux files alone needs a single run
+    tex.write_text("draft, revised\n")
+    assert compile_pdf(str(tex), str(out), engine=script) == 1
+    assert out.read_text() == "PDF draft, revised\n"
+
+
+def test_edited_input_file_reruns_latex(engine, tmp_path):
+    script, log = engine
+    tex = tmp_path / "story.tex"
+    tex.write_text("book %input=chapter.tex\n")
+    chapter = tmp_path / "chapter.tex"
+    chapter.write_text("one\n")
+    out = tmp_path / "story.pdf"
+    compile_pdf(str(tex), str(out), engine=script)
+    assert compile_pdf(str(tex), str(out), engine=script) == 0
+
+    chapter.write_text("one, revised\n")
+    assert compile_pdf(str(tex), str(out), engine=script) == 1
+    assert out.read_text().endswith("one, revised\n")
+
+
+def test_max_runs(engine, tmp_path):
+    script, log = engine
+    tex = tmp_path / "story.tex"
+    tex.write_text("%passes=10\n")
+    assert compile_pdf(str(tex), str(tmp_path / "story.pdf"), engine=script, max_runs=3) == 3
+
+
+def test_failure_raises_and_forgets_build(engine, tmp_path):
+    script, log = engine
+    tex = tmp_path / "story.tex"
+    tex.write_text("ok\n")
+    out = tmp_path / "story.pdf"
+    compile_pdf(str(tex), str(out), engine=script)
+    tex.write_text("\\fail\n")
+    with pytest.raises(LatexError, match="Undefined control sequence"):
+        compile_pdf(str(tex), str(out), engine=script)
+    assert out.read_text() == "PDF ok\n"
+    # fixing the document back to the last good one still runs LaTeX
+    tex.write_text("ok\n")
+    assert compile_pdf(str(tex), str(out), engine=script) >= 1
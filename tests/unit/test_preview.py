@@ -0,0 +1,118 @@
+import threading
+import urllib.request
+
+import pytest
+
+from mdfic.preview import Preview, inline_head, make_server
+
+
+@pytest.fixture
+def fake_pandoc(monkeypatch):
+    calls = []
+
+    def pandoc(input, *args):
+        calls.append(input)
+        return "<html><head><title>t</title></head><body><header>\n</header>\n%s</body></html>" % input
+
+    monkeypatch.setattr("mdfic.html.pandoc", pandoc)
+    return calls
+
+
+@pytest.fixture
+def story(tmp_path):
+    path = tmp_path / "story.md"
+    path.write_text("first draft\n")
+    return path
+
+
+# inline_head ----------------------------------------------
+
+def test_inline_head_before_close():
+    assert inline_head("<head><title/></head><body/>", "X") == "<head><title/>X</head><body/>"
+
+
+def test_inline_head_without_head():
+    assert inline_head("<p/>", "X") == "X<p/>"
+
+
+# Preview --------------------------------------------------
+
+def test_page_inlines_css_and_reload_script(fake_pandoc, story):
+    from mdfic.css import CSS
+    page = Preview([str(story)]).page().decode("utf8")
+    assert CSS in page
+    assert 'EventSource("/events?since=1")' in page
+    assert page.index(CSS) < page.index("</head>")
+
+
+def test_page_is_cached_until_sources_change(fake_pandoc, story):
+    preview = Preview([str(story)])
+    preview.page()
+    preview.page()
+    assert len(fake_pandoc) == 1
+
+    assert not preview.poll()
+    story.write_text("second draft\n")
+    assert preview.poll()
+    assert b"second draft" in preview.page()
+    assert len(fake_pandoc) == 2
+
+
+def test_touch_without_change_keeps_generation(fake_pandoc, story):
+    preview = Preview([str(story)])
+    generation = preview.generation
+    story.write_text(story.read_text())
+    preview.poll()
+    assert preview.generation == generation
+
+
+def test_custom_css_file(fake_pandoc, story, tmp_path):
+    css = tmp_path / "my.css"
+    css.write_text("<style>p{}</style>")
+    page = Preview([str(story)], css=str(css)).page()
+    assert b"<style>p{}</style>" in page
+
+
+# server ---------------------------------------------------
+
+def test_server_serves_page_and_pushes_reload(fake_pandoc, story):
+    preview = Preview([str(story)], interval=0.02)
+    server = make_server(preview, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:%d" % server.server_address[1]
+    try:
+        for _ in range(2):
+            with urllib.request.urlopen(url + "/") as r:
+                assert b"first draft" in r.read()
+        assert len(fake_pandoc) == 1
+
+        with urllib.request.urlopen(url + "/events", timeout=5) as events:
+            story.write_text("second draft\n")
+            assert events.readline() == b"data: reload\n"
+
+        with urllib.request.urlopen(url + "/") as r:
+            assert b"second draft" in r.read()
+    finally:
+        preview.stop()
+        server.shutdown()
+        server.server_close()
+
+
+def test_events_reload_a_page_older_than_the_connection(fake_pandoc, story):
+    preview = Preview([str(story)])
+    server = make_server(preview, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:%d" % server.server_address[1]
+    try:
+        page = preview.page().decode("utf8")
+        # an edit lands between loading the page and connecting
+        story.write_text("second draft\n")
+        preview.poll()
+        assert preview.generation == 2
+        since = page.split("since=")[1].split('"')[0]
+        with urllib.request.urlopen(url + "/events?since=" + since, timeout=5) as events:
+            assert events.readline() == b"data: reload\n"
+    finally:
+        preview.stop()
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,122 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from mdfic import client
+from mdfic.serve import ServeError, listen, stop
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MDFIC = [sys.executable, "-c", "from mdfic.client import main; main()"]
+
+
+@pytest.fixture
+def socket_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "mdfic.sock")
+    monkeypatch.setenv("MDFIC_SOCKET", path)
+    monkeypatch.setenv("PYTHONPATH", ROOT)
+    monkeypatch.delenv("MDFIC_NO_DAEMON", raising=False)
+    return path
+
+
+@pytest.fixture
+def daemon(socket_path):
+    proc = subprocess.Popen(MDFIC + ["serve", "--idle-timeout", "60"], env=dict(os.environ, LOG_LEVEL="INFO"),
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    while "listening" not in proc.stdout.readline():
+        pass
+    yield proc
+    stop(socket_path)
+    proc.wait(timeout=10)
+
+
+def test_command():
+    assert client.command(["docx", "-o", "x.docx"]) == "docx"
+    assert client.command(["--profile", "-", "--profile-stage", "docx.feed", "wc"]) == "wc"
+    assert client.command(["--profile=-", "stats"]) == "stats"
+    assert client.command(["--trace", "docx", "--trace-file", "t.jsonl", "docx"]) == "docx"
+    assert client.command(["--help"]) is None
+
+
+def test_forward_without_daemon(socket_path):
+    assert client.forward(["wc"]) is None
+    # a stale socket file
+    listen(socket_path).close()
+    assert client.forward(["wc"]) is None
+
+
+def test_forward_skips_local_commands(daemon, monkeypatch):
+    assert client.forward(["watch", "--name", "x"]) is None
+    monkeypatch.setenv("MDFIC_NO_DAEMON", "1")
+    assert client.forward(["wc"]) is None
+
+
+def test_daemon_runs_commands(daemon, socket_path, tmp_path):
+    story = tmp_path / "story.md"
+    story.write_text("# One\n\nHello there. General Kenobi.\n")
+    r = subprocess.run(MDFIC + ["stats"], input=story.read_text(), capture_output=True,
+                       text=True, cwd=str(tmp_path))
+    assert r.returncode == 0, r.stderr
+    assert r.stdout.startswith("4 words, 1 paragraphs, 2 sentences")
+
+    # relative paths and exit statuses are the client's
+    r = subprocess.run(MDFIC + ["wc", "story.md", "missing.md"], capture_output=True,
+                       text=True, cwd=str(tmp_path))
+    assert r.returncode == 1
+    assert "story.md: 6 words" in r.stdout
+    assert "missing.md" in r.stderr
+
+    r = subprocess.run(MDFIC + ["no-such-command"], capture_output=True, text=True)
+    assert r.returncode == 2
+    assert "No such command" in r.stderr
+
+    stop(socket_path)
+    log = daemon.stdout.read()
+    assert "mdfic stats" in log
+    assert "mdfic wc story.md missing.md" in log
+
+
+def test_silent_client_does_not_stall_daemon(daemon, socket_path, tmp_path):
+    silent = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    silent.connect(socket_path)
+    try:
+        start = time.monotonic()
+        r = subprocess.run(MDFIC + ["wc", "-"], input="one two\n", capture_output=True, text=True,
+                           cwd=str(tmp_path), timeout=30)
+        assert r.returncode == 0, r.stderr
+        assert time.monotonic() - start < 15
+    finally:
+        silent.close()
+    stop(socket_path)
+    assert "bad request" in daemon.stdout.read()
+
+
+def test_profile_records_the_clients_arguments(daemon, socket_path, tmp_path):
+    (tmp_path / "story.md").write_text("one two\n")
+    profile = tmp_path / "profile.jsonl"
+    r = subprocess.run(MDFIC + ["--profile", str(profile), "wc", "story.md"], capture_output=True,
+                       text=True, cwd=str(tmp_path))
+    assert r.returncode == 0, r.stderr
+    report = json.loads(profile.read_text())
+    assert report["command"] == "wc"
+    assert report["argv"] == ["--profile", str(profile), "wc", "story.md"]
+
+
+def test_second_daemon_refused(daemon, socket_path):
+    with pytest.raises(ServeError):
+        listen(socket_path)
+
+
+def test_stop(daemon, socket_path):
+    assert stop(socket_path)
+    daemon.wait(timeout=10)
+    for _ in range(50):
+        if not os.path.exists(socket_path):
+            break
+        time.sleep(0.1)
+    assert not os.path.exists(socket_path)
+    assert not stop(socket_path)
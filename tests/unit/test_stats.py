@@ -0,0 +1,76 @@
+from mdfic.stats import histogram, percentile, stats, tokenize
+
+
+BOOK = """---
+title: T
+...
+Before any chapter.
+
+# One
+
+"Hello there," she said. He nodded.
+
+Short.
+
+---
+
+Another scene! With two sentences.
+
+# Two
+
+Last “quoted words here” scene.
+"""
+
+
+def test_tokenize_counts():
+    m = tokenize(BOOK)
+    assert m.chapter_titles == [None, "One", "Two"]
+    assert list(m.scene_words) == [3, 7, 5, 5]
+    assert list(m.scene_chapter) == [0, 1, 1, 2]
+    assert list(m.paragraph_words) == [3, 6, 1, 5, 5]
+    assert list(m.paragraph_dialogue) == [0, 2, 0, 0, 3]
+    assert list(m.sentence_words) == [3, 4, 2, 1, 2, 3, 5]
+
+
+def test_tokenize_ignores_setext_underline_only_after_blank_line():
+    m = tokenize("A heading\n---\n\ntext here\n")
+    assert list(m.scene_words) == [5]
+
+
+def test_stats_summary():
+    r = stats(BOOK, wpm=10)
+    assert r["words"] == 20
+    assert r["scenes"] == 4
+    assert r["chapters"] == 3
+    assert r["reading_minutes"] == 2.0
+    assert r["dialogue_words"] == 5
+    assert r["narration_words"] == 15
+    assert r["dialogue_ratio"] == round(5 / 15, 3)
+    assert r["sentence_length"] == dict(min=1, median=3, mean=2.9, p90=5, max=5)
+    assert r["paragraph_length"]["histogram"]["1-10"] == 5
+    assert [c["words"] for c in r["chapter_list"]] == [3, 12, 5]
+    assert [(s["chapter"], s["scene"]) for s in r["scene_list"]] == [(0, 1), (1, 1), (1, 2), (2, 1)]
+
+    assert [c["chapter"] for c in r["chapter_list"]] == [0, 1, 2]
+
+
+def test_stats_chapters_start_at_one_without_front_text():
+    r = stats("# One\n\ntext\n\n# Two\n\nmore\n")
+    assert [c["chapter"] for c in r["chapter_list"]] == [1, 2]
+
+
+def test_stats_empty():
+    r = stats("")
+    assert r["words"] == 0
+    assert r["dialogue_ratio"] is None
+    assert r["sentence_length"]["max"] == 0
+
+
+def test_percentile_nearest_rank():
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile([1, 2, 3, 4], 90) == 4
+    assert percentile([], 50) == 0
+
+
+def test_histogram_buckets():
+    assert histogram([1, 10, 11, 300], (10, 25)) == {"1-10": 2, "11-25": 1, "26+": 1}
@@ -0,0 +1,75 @@
+import io
+import json
+
+import pytest
+
+from mdfic import trace
+from mdfic.docx import HTML2DOCX
+from mdfic.utils import get_in
+
+
+@pytest.fixture
+def stream():
+    out = io.StringIO()
+    yield out
+    trace.disable()
+
+
+def events(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_off_by_default():
+    t = trace.tracer("mdfic.example")
+    assert t.on is False
+    t("ignored", x=1)
+
+
+def test_enable_per_module(stream):
+    docx_tracer = trace.tracer("mdfic.docx")
+    trace.enable(["utils"], stream)
+    assert trace.tracer("mdfic.utils").on
+    assert not docx_tracer.on
+    # modules imported later are traced too
+    trace.enable(["later"], stream)
+    assert trace.tracer("mdfic.later").on
+    trace.disable()
+    assert not trace.tracer("mdfic.utils").on
+
+
+def test_enable_all(stream):
+    trace.enable([trace.ALL], stream)
+    assert trace.tracer("mdfic.docx").on
+    assert trace.tracer("anything.else").on
+
+
+def test_get_in_traces_defaults(stream):
+    trace.enable(["mdfic.utils"], stream)
+    assert get_in({"mdfic": {}}, ["mdfic", "number_scenes"], False) is False
+    assert get_in({"a": 1}, ["a"], None) == 1
+    [event] = events(stream)
+    assert event["module"] == "utils"
+    assert event["event"] == "get_in.default"
+    assert event["keys"] == ["number_scenes"]
+    assert event["error"] == "KeyError"
+
+
+def test_html2docx_events(stream):
+    trace.enable(["docx"], stream)
+    HTML2DOCX({}).feed("<p>One <em>two</em></p>")
+    got = [(e["event"], e.get("tag", e.get("data")), e["stack"]) for e in events(stream)]
+    assert got == [
+        ("starttag", "p", ["p"]),
+        ("data", "One ", ["p"]),
+        ("starttag", "em", ["p", "em"]),
+        ("data", "two", ["p", "em"]),
+        ("endtag", "em", ["p", "em"]),
+        ("endtag", "p", ["p"]),
+    ]
+    assert all(e["t"] >= 0 for e in events(stream))
+
+
+def test_fields_that_arent_json(stream):
+    trace.enable(["x"], stream)
+    trace.tracer("x")("odd", value={1, 2}.__class__)
+    assert events(stream)[0]["value"] == "<class 'set'>"
@@ -1,3 +1,5 @@
+import os
+
 import pytest
 
 from mdfic.utils import (
@@ -6,6 +8,16 @@ from mdfic.utils import (
     parse_metadata,
     get_in,
     int_to_roman,
+    split_scenes,
+    count_scenes,
+    split_chapters,
+    cache_prune,
+    cache_read,
+    cache_write,
+    atomic_write,
+    write_depfile,
+    source_date,
+    rezip,
 )
 
 
@@ -52,6 +64,51 @@ def test_split_metadata_malformed_raises():
         split_metadata_and_text("---\ntitle: T\nno_close")
 
 
+# split_scenes / count_scenes -----------------------------
+
+def test_split_scenes_at_rules():
+    assert split_scenes("a\n\n---\n\nb\n\n* * *\nc") == ["a", "\n\nb", "\nc"]
+
+
+def test_count_scenes_ignores_setext_heading():
+    assert count_scenes("Heading\n---\n\ntext") == 1
+
+
+def test_count_scenes_empty_text():
+    assert count_scenes("  \n") == 0
+
+
+# split_chapters -------------------------------------------
+
+def test_split_chapters_at_level_one_headings():
+    text = "epigraph\n\n# One\n\n## Part\n\na #hashtag\n# Two\nb\n"
+    assert split_chapters(text) == ["epigraph\n\n", "# One\n\n## Part\n\na #hashtag\n", "# Two\nb\n"]
+
+
+def test_split_chapters_no_headings():
+    assert split_chapters("just text") == ["just text"]
+    assert split_chapters("") == []
+
+
+# cache_read / cache_write ---------------------------------
+
+def test_cache_round_trip(cache_dir):
+    assert cache_read("ns", "k") is None
+    cache_write("ns", "k", "välue")
+    assert cache_read("ns", "k") == "välue"
+    assert (cache_dir / "ns" / "k").exists()
+
+
+def test_cache_prune_keeps_most_recently_used(cache_dir):
+    for i, key in enumerate(["a", "b", "c", "d"]):
+        cache_write("ns", key, key)
+        os.utime(cache_dir / "ns" / key, (1000 + i, 1000 + i))
+    assert cache_read("ns", "a") == "a"
+    assert cache_prune("ns", 2) == 2
+    assert sorted(p.name for p in (cache_dir / "ns").iterdir()) == ["a", "d"]
+    assert cache_prune("missing", 2) == 0
+
+
 # parse_metadata -------------------------------------------
 
 def test_parse_metadata_returns_empty_when_no_yaml():
@@ -91,6 +148,77 @@ def test_parse_metadata_does_not_join_nested_lists():
     assert meta["mdfic"]["latex"]["extra_headers"] == ["line1", "line2"]
 
 
+# atomic_write / write_depfile ----------------------------
+
+def test_atomic_write_replaces_on_success(tmp_path):
+    path = tmp_path / "out.txt"
+    path.write_text("old")
+    with atomic_write(str(path)) as f:
+        f.write("new")
+        assert path.read_text() == "old"
+    assert path.read_text() == "new"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.txt"]
+
+
+def test_atomic_write_leaves_target_on_error(tmp_path):
+    path = tmp_path / "out.txt"
+    path.write_text("old")
+    with pytest.raises(RuntimeError):
+        with atomic_write(str(path)) as f:
+            f.write("partial")
+            raise RuntimeError()
+    assert path.read_text() == "old"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.txt"]
+
+
+def test_atomic_write_new_file_is_not_private(tmp_path):
+    path = tmp_path / "out.txt"
+    with atomic_write(str(path)) as f:
+        f.write("x")
+    assert path.stat().st_mode & 0o044
+
+
+def test_write_depfile(tmp_path):
+    dep = tmp_path / "out.d"
+    write_depfile(str(dep), "out/my story.html", ["metadata.yaml", "-", "my story.md"])
+    assert dep.read_text().splitlines() == [
+        "out/my\\ story.html: metadata.yaml my\\ story.md",
+        "metadata.yaml:",
+        "my\\ story.md:",
+    ]
+
+
+# reproducible builds --------------------------------------
+
+def test_source_date_from_environment(monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1700000000")
+    assert source_date(["story.md"]).isoformat() == "2023-11-14T22:13:20+00:00"
+
+
+def test_source_date_from_git(tmp_git_repo, monkeypatch):
+    import subprocess
+    monkeypatch.delenv("SOURCE_DATE_EPOCH", raising=False)
+    (tmp_git_repo / "story.md").write_text("text\n")
+    subprocess.run(["git", "add", "story.md"], check=True)
+    subprocess.run(["git", "commit", "-q", "-m", "story", "--date=@1600000000"], check=True,
+                   env=dict(os.environ, GIT_COMMITTER_DATE="@1600000000"))
+    assert source_date(["story.md"]).timestamp() == 1600000000
+
+
+def test_rezip_fixes_order_and_times(tmp_path):
+    import zipfile
+    path = tmp_path / "a.zip"
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("b", "2")
+        z.writestr("first", "0")
+        z.writestr("a", "1")
+    rezip(str(path), (2001, 2, 3, 4, 5, 6), first=("first",))
+    with zipfile.ZipFile(path) as z:
+        assert z.namelist() == ["first", "a", "b"]
+        assert {i.date_time for i in z.infolist()} == {(2001, 2, 3, 4, 5, 6)}
+        assert z.read("b") == b"2"
+
+
 # get_in ---------------------------------------------------
 
 def test_get_in_top_level():
@@ -0,0 +1,105 @@
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from mdfic.watch import StoryWatcher, snapshot
+
+
+@pytest.fixture
+def story_dir(tmp_path, asset_dir):
+    shutil.copy(asset_dir / "single" / "single.md", tmp_path / "single.md")
+    return tmp_path
+
+
+@pytest.fixture
+def multi_dir(tmp_path, asset_dir):
+    shutil.copytree(asset_dir / "multi", tmp_path / "multi")
+    return tmp_path / "multi"
+
+
+# snapshot -------------------------------------------------
+
+def test_snapshot_missing_file_is_none(tmp_path):
+    assert snapshot([str(tmp_path / "nope")]) == {str(tmp_path / "nope"): None}
+
+
+def test_snapshot_records_size(story_dir):
+    path = str(story_dir / "single.md")
+    assert snapshot([path])[path][1] == os.path.getsize(path)
+
+
+# inputs / outputs -----------------------------------------
+
+def test_inputs_single(story_dir):
+    w = StoryWatcher("single", directory=str(story_dir))
+    assert w.inputs == [str(story_dir / "single.md")]
+
+
+def test_inputs_multi_puts_metadata_first(multi_dir):
+    w = StoryWatcher("multi", directory=str(multi_dir))
+    assert [os.path.basename(p) for p in w.inputs] == ["metadata.yaml", "multi-01.md", "multi-02.md"]
+
+
+def test_outputs_follow_makefile_names(story_dir):
+    w = StoryWatcher("single", directory=str(story_dir))
+    assert w.output("sffms") == str(story_dir / "out" / "single-sffms.docx")
+    assert w.output("tex") == str(story_dir / "single-sffms.tex")
+
+
+def test_unknown_format_raises(story_dir):
+    with pytest.raises(ValueError):
+        StoryWatcher("single", directory=str(story_dir), formats=["pdf"])
+
+
+# wait_for_change ------------------------------------------
+
+def test_wait_for_change_times_out(story_dir):
+    w = StoryWatcher("single", directory=str(story_dir), interval=0.01, debounce=0.01)
+    assert w.wait_for_change(timeout=0.05) == set()
+
+
+def test_wait_for_change_debounces_burst(story_dir):
+    w = StoryWatcher("single", directory=str(story_dir), interval=0.01, debounce=0.2)
+    path = story_dir / "single.md"
+
+    def burst():
+        for i in range(3):
+            time.sleep(0.05)
+            with open(path, "a") as f:
+                f.write("more %d\n" % i)
+
+    t = threading.Thread(target=burst)
+    t.start()
+    changed = w.wait_for_change(timeout=5)
+    t.join()
+    assert changed == {str(path)}
+    # the whole burst was absorbed before returning
+    assert path.read_text().endswith("more 2\n")
+
+
+# build ----------------------------------------------------
+
+@pytest.mark.pandoc
+def test_build_only_rebuilds_changed_outputs(story_dir):
+    css = story_dir / "story.css"
+    css.write_text("<style></style>")
+    w = StoryWatcher("single", directory=str(story_dir), formats=["html", "tex"],
+                     css=str(css))
+    assert [r[0] for r in w.build()] == ["html", "tex"]
+    assert (story_dir / "out" / "single.html").exists()
+
+    assert w.build() == []
+
+    css.write_text("<style>body {}</style>")
+    results = w.build()
+    assert [r[0] for r in results] == ["html"]
+    assert results[0][3] is None
+
+
+def test_build_reports_missing_sources(tmp_path):
+    w = StoryWatcher("nothing", directory=str(tmp_path), formats=["tex"])
+    (result,) = w.build()
+    assert isinstance(result[3], OSError)